@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+run HttpClient against a local stand-in server that stalls or drops connections
+
+	each scenario fetches through the client for a number of refresh cycles
+	and reports how long each cycle cost, showing the request deadline
+	bounding a stalled or trickling server and the circuit breaker skipping
+	a dead one. the client has its default retries and backoff, and the
+	script exits 1 if any cycle goes over the deadline
+	run from anywhere: python3 benchmarks/bench_breaker.py [deadline]
+"""
+
+import os
+import sys
+import time
+import socket
+import threading
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from lib.httpclient import HttpClient
+
+CYCLES = 6
+DEFAULT_DEADLINE = 2.0
+BODY = b'{"ok": true}'
+
+# how late a cycle may finish, for thread wake ups and the server's accept
+DEADLINE_SLACK = 0.25
+TRICKLE_INTERVAL = 0.2
+
+"""
+ok: answer straight away. stall-headers: never answer.
+stall-body: send headers and part of the body, then go quiet. drop: close the connection.
+trickle-headers, trickle-body, trickle-unsized: send a byte at a time, each well inside the socket timeout,
+so only a deadline on the whole request stops them
+"""
+def serve(conn, mode):
+	try:
+		conn.recv(65536)
+		if mode == 'ok':
+			conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: ' + str(len(BODY)).encode() + b'\r\n\r\n' + BODY)
+		elif mode == 'stall-body':
+			conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 100000\r\n\r\n' + b'x' * 100)
+			time.sleep(60)
+		elif mode == 'stall-headers':
+			time.sleep(60)
+		elif mode == 'trickle-headers':
+			conn.sendall(b'HTTP/1.1 200 OK\r\n')
+			for i in range(300):
+				conn.sendall(b'X')
+				time.sleep(TRICKLE_INTERVAL)
+		elif mode in ('trickle-body', 'trickle-unsized'):
+			if mode == 'trickle-body':
+				conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 100000\r\n\r\n')
+			else:
+				conn.sendall(b'HTTP/1.1 200 OK\r\nConnection: close\r\n\r\n')
+			for i in range(300):
+				conn.sendall(b'x')
+				time.sleep(TRICKLE_INTERVAL)
+		conn.close()
+	except OSError:
+		pass
+
+def start_server(mode):
+	sock = socket.socket()
+	sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	sock.bind(('127.0.0.1', 0))
+	sock.listen(16)
+
+	def accept():
+		while True:
+			conn, addr = sock.accept()
+			threading.Thread(target=serve, args=(conn, mode), daemon=True).start()
+
+	threading.Thread(target=accept, daemon=True).start()
+	return 'http://127.0.0.1:{}/'.format(sock.getsockname()[1])
+
+def run(mode, deadline):
+	url = start_server(mode)
+	client = HttpClient()
+	costs = []
+	errors = []
+	for i in range(CYCLES):
+		start = time.monotonic()
+		try:
+			client.get(url, source=mode, deadline=deadline)
+			errors.append('-')
+		except Exception as e:
+			errors.append(type(e).__name__)
+		costs.append(time.monotonic() - start)
+	return costs, errors, client.breaker_stats()[mode]
+
+if __name__ == '__main__':
+	deadline = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DEADLINE
+
+	print("deadline {}s, {} cycles per scenario".format(deadline, CYCLES))
+	print("{:<15}{:>10}{:>10}{:>10}{:>10}  {}".format("scenario", "worst s", "total s", "state", "rejected", "errors"))
+	over = []
+	for mode in ('ok', 'stall-headers', 'stall-body', 'trickle-headers', 'trickle-body', 'trickle-unsized', 'drop'):
+		costs, errors, breaker = run(mode, deadline)
+		print("{:<15}{:>10.2f}{:>10.2f}{:>10}{:>10d}  {}".format(mode, max(costs), sum(costs), breaker['state'], breaker['rejected'], ' '.join(errors)))
+		if max(costs) > deadline + DEADLINE_SLACK:
+			over.append(mode)
+	if over:
+		print("over the deadline: " + ' '.join(over))
+		sys.exit(1)
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+compare the full BeautifulSoup parse of the darksky page with DarkSkyScanner
+
+	checks both return the same dict, then reports parse time,
+	tracemalloc peak memory and how much of the page each one read
+	run from anywhere: python3 benchmarks/bench_darksky.py [page.html]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from lib.darkskyweather import DarkSkyWeather, SCAN_CHUNK_SIZE
+from lib.darkskyscan import DarkSkyScanner
+
+FIXTURE = os.path.join(ROOT_DIR, 'benchmarks', 'fixtures', 'synthetic-darksky-forecast.html')
+
+ROUNDS = 50
+
+def measure(fn):
+	tracemalloc.start()
+	result = fn()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+
+	start = time.perf_counter()
+	for i in range(ROUNDS):
+		fn()
+	return result, (time.perf_counter() - start) / ROUNDS, peak
+
+if __name__ == '__main__':
+	path = sys.argv[1] if len(sys.argv) > 1 else FIXTURE
+	with open(path, 'rb') as f:
+		content = f.read()
+	text = content.decode('utf-8')
+	chunks = [text[i:i + SCAN_CHUNK_SIZE] for i in range(0, len(text), SCAN_CHUNK_SIZE)]
+
+	darksky = DarkSkyWeather.__new__(DarkSkyWeather)
+	read = []
+
+	def scan():
+		fed = []
+		def counted():
+			for chunk in chunks:
+				fed.append(len(chunk))
+				yield chunk
+		weather = DarkSkyScanner().scan(counted())
+		read[:] = fed
+		return weather
+
+	old, old_time, old_peak = measure(lambda: darksky.parse_soup(content))
+	new, new_time, new_peak = measure(scan)
+
+	if old != new:
+		print("scanner result differs: {} != {}".format(new, old))
+		sys.exit(1)
+
+	print(new)
+	print("{:<20}{:>10}{:>12}{:>14}".format("parser", "ms", "peak KB", "chars read"))
+	print("{:<20}{:>10.3f}{:>12.1f}{:>14d}".format("BeautifulSoup", old_time * 1000, old_peak / 1024.0, len(text)))
+	print("{:<20}{:>10.3f}{:>12.1f}{:>14d}".format("DarkSkyScanner", new_time * 1000, new_peak / 1024.0, sum(read)))
+	print("speedup: {:.1f}x".format(old_time / new_time))
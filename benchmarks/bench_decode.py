@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+compare a full jpeg decode + crop with the row limited decode in cropTriState
+
+	each path runs in its own process so peak rss isn't shared between them
+	a copy of the file cut off above the crop must raise, not crop black rows
+	run from anywhere: python3 benchmarks/bench_decode.py [fixture.jpg]
+"""
+
+import io
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+FIXTURE = os.path.join(ROOT_DIR, 'benchmarks', 'fixtures', 'synthetic-ne-geocolor-1200x1200.jpg')
+
+ROUNDS = 20
+
+def max_rss_kb():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+"""
+the jpeg cut off before the crop's bottom row: the row decode has to give up
+ and the full decode it falls back to has to raise
+"""
+def check_truncated(path):
+	from PIL import Image
+	from lib.satelliteimage import SatelliteImage
+
+	with open(path, 'rb') as f:
+		data = f.read()
+	sat = SatelliteImage(None, None, load=False)
+	truncated = data[:len(data) // 3]
+
+	if sat.decodeRows(Image.open(io.BytesIO(truncated)), sat.window.box()[3]) is not None:
+		return 'row decode returned rows it never decoded'
+	try:
+		sat.cropTriState(Image.open(io.BytesIO(truncated)))
+	except OSError:
+		return None
+	return 'cropping a truncated image didn\'t raise'
+
+def run_child(mode, path):
+	from PIL import Image
+	from lib.satelliteimage import SatelliteImage
+
+	with open(path, 'rb') as f:
+		data = f.read()
+
+	sat = SatelliteImage(None, None, load=False)
+	box = sat.window.box()
+
+	def crop():
+		img = Image.open(io.BytesIO(data))
+		if mode == 'full':
+			return img.crop(box)
+		return sat.cropTriState(img)
+
+	# open without decoding so plugins are imported before measuring the peak
+	Image.open(io.BytesIO(data)).size
+	before = max_rss_kb()
+	result = crop()
+	peak = max_rss_kb() - before
+
+	start = time.perf_counter()
+	for i in range(ROUNDS):
+		crop()
+	elapsed = (time.perf_counter() - start) / ROUNDS
+
+	print("{} {} {}".format(elapsed, peak, result.tobytes().hex()[:64]))
+
+if __name__ == '__main__':
+	if len(sys.argv) > 2 and sys.argv[1] == '--child':
+		run_child(sys.argv[2], sys.argv[3])
+		sys.exit(0)
+
+	path = sys.argv[1] if len(sys.argv) > 1 else FIXTURE
+	results = {}
+	for mode in ('full', 'rows'):
+		out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', mode, path])
+		elapsed, peak, digest = out.decode().split()[-3:]
+		results[mode] = (float(elapsed), int(peak), digest)
+		print("{:<20}{:>10.3f} ms{:>10d} KB peak rss".format(mode + " decode", float(elapsed) * 1000, int(peak)))
+
+	if results['full'][2] != results['rows'][2]:
+		print("crop output differs")
+		sys.exit(1)
+
+	print("speedup: {:.1f}x".format(results['full'][0] / results['rows'][0]))
+
+	error = check_truncated(path)
+	print("truncated file: " + (error or "raises"))
+	if error:
+		sys.exit(1)
@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+cost of finding the latest satellite image: listing + soup, streamed listing scan, predicted name
+
+	a local stand-in for the NESDIS cdn publishes a sector image of every size
+	every five minutes, six minutes after its scan time, and serves a day of
+	them in an nginx style listing like benchmarks/fixtures has.
+	reports requests, bytes on the wire and milliseconds per discovery
+	run from anywhere: python3 benchmarks/bench_discovery.py [rounds]
+"""
+
+import os
+import sys
+import time
+import threading
+import http.server
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import lib.projection as projection
+from lib.httpclient import get_http_client, wire_bytes
+from lib.imagediscovery import ImageDiscovery, IMAGE_CADENCE, IMAGE_TIME_FORMAT
+from lib.satelliteimage import SatelliteImage
+
+ROUNDS = 10
+SIZES = ('300x300', '600x600', '1200x1200', '2400x2400')
+ACTUAL_DELAY = timedelta(minutes=6)
+LISTING_HOURS = 24
+
+def published(now):
+	t = now - ACTUAL_DELAY
+	return t - timedelta(minutes=t.minute % 5, seconds=t.second, microseconds=t.microsecond)
+
+def listing(now):
+	newest = published(now)
+	t = newest - timedelta(hours=LISTING_HOURS)
+	lines = ['<html>\n<head><title>Index of /GOES16/ABI/SECTOR/ne/GEOCOLOR/</title></head>\n<body>\n<pre><a href="../">../</a>']
+	while t <= newest:
+		for size in SIZES:
+			name = '{}_GOES16-ABI-ne-GEOCOLOR-{}.jpg'.format(t.strftime(IMAGE_TIME_FORMAT), size)
+			lines.append('<a href="{0}">{0}</a>{1}{2}{3:>20}'.format(name, ' ' * (52 - len(name)), (t + ACTUAL_DELAY).strftime('%d-%b-%Y %H:%M'), 311845))
+		t = t + IMAGE_CADENCE
+	lines.append('</pre><hr></body>\n</html>\n')
+	return '\n'.join(lines).encode('ascii')
+
+class Handler(http.server.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, *args):
+		pass
+
+	def exists(self, name):
+		try:
+			t = datetime.strptime(name[:11], IMAGE_TIME_FORMAT)
+		except ValueError:
+			return False
+		return t <= published(datetime.utcnow())
+
+	def respond(self, body):
+		if self.path.endswith('/'):
+			status, data = 200, listing(datetime.utcnow())
+		elif self.exists(self.path.rsplit('/', 1)[-1]):
+			status, data = 200, b'\xff\xd8' + b'\0' * 311843
+		else:
+			status, data = 404, b'not found'
+		self.send_response(status)
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		if body:
+			self.wfile.write(data)
+
+	def do_GET(self):
+		self.respond(True)
+
+	def do_HEAD(self):
+		self.respond(False)
+
+def measure(fn, rounds):
+	results = []
+	for i in range(rounds):
+		start = time.perf_counter()
+		requests, nbytes = fn()
+		results.append(((time.perf_counter() - start) * 1000, requests, nbytes))
+	ms = sorted(r[0] for r in results)[len(results) // 2]
+	return ms, results[-1][1], results[-1][2]
+
+if __name__ == '__main__':
+	rounds = int(sys.argv[1]) if len(sys.argv) > 1 else ROUNDS
+	server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	projection.NESDIS_URL = 'http://127.0.0.1:{}/'.format(server.server_port)
+
+	sat = SatelliteImage(None, None, load=False)
+	listing_url = sat.window.listingUrl()
+	size_name = sat.window.sizeName()
+	client = get_http_client()
+
+	def soup():
+		res = client.get(listing_url, source='nesdis')
+		sat.parseListing(res.content)
+		return 1, wire_bytes(res)
+
+	def scan():
+		discovery = ImageDiscovery(listing_url, size_name)
+		discovery.scanListing()
+		return discovery.requests, discovery.bytes
+
+	# last image is two before the newest, so a next one is always due by
+	# PUBLISH_DELAY, which is a minute longer than the stand-in's delay
+	last = published(datetime.utcnow()) - IMAGE_CADENCE * 2
+	last_url = listing_url + '{}_GOES16-ABI-ne-GEOCOLOR-{}.jpg'.format(last.strftime(IMAGE_TIME_FORMAT), size_name)
+
+	def predicted():
+		discovery = ImageDiscovery(listing_url, size_name)
+		url = discovery.predict(last_url)
+		if url is None or discovery.method != 'predicted':
+			raise RuntimeError('prediction missed: {}'.format(discovery.method))
+		return discovery.requests, discovery.bytes
+
+	print('{:<18}{:>10}{:>12}{:>10}'.format('discovery', 'requests', 'bytes', 'ms'))
+	for name, fn in (('listing + soup', soup), ('listing scan', scan), ('predicted', predicted)):
+		ms, requests, nbytes = measure(fn, rounds)
+		print('{:<18}{:>10}{:>12}{:>10.2f}'.format(name, requests, nbytes, ms))
+	server.shutdown()
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+compare hitherdither's ordered dithering with lib/dither
+
+	times every algorithm / threshold pair the --dither / --threshold options accept
+	and checks that at least MIN_AGREEMENT percent of pixels agree with
+	hitherdither's output for the fixture crop. exits 1 when a pair falls below it.
+	without hitherdither installed the pairs are checked against references in
+	REFERENCE_DIRECTORY, if there are any, which --record stores from hitherdither.
+	the numpy engine is only opt in (pzwglobals.DITHER_ENGINE) until this agrees
+	run from anywhere: python3 benchmarks/bench_dither.py [--record] [fixture.jpg]
+"""
+
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import numpy as np
+from PIL import Image
+from lib import dither
+from lib.satelliteimage import SatelliteImage
+
+FIXTURE = os.path.join(ROOT_DIR, 'benchmarks', 'fixtures', 'synthetic-ne-geocolor-1200x1200.jpg')
+
+REFERENCE_DIRECTORY = os.path.join(ROOT_DIR, 'benchmarks', 'fixtures', 'dither-reference')
+
+THRESHOLDS = (128, 64, 32)
+
+# percent of pixels that have to come out the same color as hitherdither's
+MIN_AGREEMENT = 95.0
+
+ROUNDS = 10
+# hitherdither's yliluoma is pure python per pixel, one round is plenty
+ROUNDS_SLOW = 1
+
+def timed(fn, rounds):
+	start = time.perf_counter()
+	for i in range(rounds):
+		result = fn()
+	return result, (time.perf_counter() - start) / rounds
+
+"""
+hitherdither's palette indices for a pair, stored as a greyscale png, or None
+"""
+def reference_path(algorithm, threshold):
+	name = algorithm if threshold is None else '{}-{}'.format(algorithm, threshold)
+	return os.path.join(REFERENCE_DIRECTORY, name + '.png')
+
+def load_reference(algorithm, threshold):
+	try:
+		return np.asarray(Image.open(reference_path(algorithm, threshold)))
+	except OSError:
+		return None
+
+def save_reference(algorithm, threshold, img):
+	os.makedirs(REFERENCE_DIRECTORY, exist_ok=True)
+	Image.fromarray(np.asarray(img).astype(np.uint8), 'L').save(reference_path(algorithm, threshold))
+
+if __name__ == '__main__':
+	args = sys.argv[1:]
+	record = '--record' in args
+	args = [a for a in args if a != '--record']
+	path = args[0] if args else FIXTURE
+	sat = SatelliteImage(None, None, load=False)
+	crop = sat.cropTriState(Image.open(path))
+
+	try:
+		import hitherdither
+		hitherdither.ordered
+	except (ImportError, AttributeError):
+		hitherdither = None
+		print("hitherdither not installed, checking lib/dither against any stored references")
+		if record:
+			print("--record needs hitherdither")
+			sys.exit(1)
+
+	start = time.perf_counter()
+	dither.yliluoma_lut()
+	print("{:<20}{:>12.3f} ms (once)".format("yliluoma table", (time.perf_counter() - start) * 1000))
+
+	below = []
+	missing = []
+	print("{:<20}{:>12}{:>12}{:>10}{:>10}".format("algorithm", "hither ms", "engine ms", "speedup", "agree"))
+	for algorithm in dither.ALGORITHMS:
+		thresholds = THRESHOLDS if algorithm != 'yliluoma' else (None,)
+		for threshold in thresholds:
+			sat.dither = algorithm
+			sat.threshold = threshold
+			label = algorithm if threshold is None else "{} {}".format(algorithm, threshold)
+
+			engine_img, engine_time = timed(lambda: sat.orderedIndex(crop), ROUNDS)
+
+			hither_ms = speedup = "-"
+			reference = None
+			if hitherdither is not None:
+				rounds = ROUNDS_SLOW if algorithm == 'yliluoma' else ROUNDS
+				hither_img, hither_time = timed(lambda: sat.hitherditherIndex(crop), rounds)
+				hither_ms = "{:.3f}".format(hither_time * 1000)
+				speedup = "{:.1f}x".format(hither_time / engine_time)
+				reference = np.asarray(hither_img)
+				if record:
+					save_reference(algorithm, threshold, hither_img)
+			else:
+				reference = load_reference(algorithm, threshold)
+
+			if reference is None:
+				missing.append(label)
+				agree = "-"
+			else:
+				agreement = (reference == np.asarray(engine_img)).mean() * 100
+				agree = "{:.1f}%".format(agreement)
+				if agreement < MIN_AGREEMENT:
+					below.append(label)
+			print("{:<20}{:>12}{:>12.3f}{:>10}{:>10}".format(label, hither_ms, engine_time * 1000, speedup, agree))
+
+	if below:
+		print("under {}% agreement with hitherdither: {}".format(MIN_AGREEMENT, ', '.join(below)))
+	if missing:
+		print("agreement not checked, no hitherdither or stored reference for: {}".format(', '.join(missing)))
+	if below:
+		sys.exit(1)
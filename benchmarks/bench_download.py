@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+satellite image refreshes against a local stand-in for the NESDIS cdn
+
+	serves the fixture listing with an ETag, honouring If-None-Match, and
+	the fixture jpeg for any image. runs a few refreshes through
+	getLatestImageUrl and loadCrop and reports the requests and bytes each
+	one cost, checking that
+		an unchanged image is neither downloaded nor decoded again
+		an unchanged listing comes back 304
+		a failed download leaves last_downloads alone, so it's tried again
+	exits 1 if any check fails
+	run from anywhere: python3 benchmarks/bench_download.py
+"""
+
+import os
+import sys
+import threading
+import http.server
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import lib.projection as projection
+from lib.satelliteimage import SatelliteImage
+
+FIXTURES = os.path.join(ROOT_DIR, 'benchmarks', 'fixtures')
+LISTING = os.path.join(FIXTURES, 'synthetic-nesdis-ne-geocolor-listing.html')
+IMAGE = os.path.join(FIXTURES, 'synthetic-ne-geocolor-1200x1200.jpg')
+
+NEW_IMAGE = '20202811205_GOES16-ABI-ne-GEOCOLOR-1200x1200.jpg'
+
+"""
+the stand-in cdn, its listing can gain a newer image and its images can fail
+"""
+class Upstream():
+	def __init__(self):
+		with open(LISTING, 'rb') as f:
+			self.listing = f.read()
+		with open(IMAGE, 'rb') as f:
+			self.image = f.read()
+		self.etag = '"1"'
+		self.image_status = 200
+		self.requests = []
+		self.bytes = 0
+
+	def publish(self, name):
+		anchor = '<a href="{0}">{0}</a>\n'.format(name).encode('ascii')
+		self.listing = self.listing.replace(b'</pre>', anchor + b'</pre>')
+		self.etag = '"{}"'.format(int(self.etag.strip('"')) + 1)
+
+def make_handler(upstream):
+	class Handler(http.server.BaseHTTPRequestHandler):
+		protocol_version = 'HTTP/1.1'
+
+		def log_message(self, *args):
+			pass
+
+		def reply(self, status, body=b'', headers=None, send_body=True):
+			upstream.requests.append((self.command, self.path.rsplit('/', 1)[-1] or 'listing', status))
+			self.send_response(status)
+			for name, value in (headers or {}).items():
+				self.send_header(name, value)
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			if send_body:
+				self.wfile.write(body)
+				upstream.bytes = upstream.bytes + len(body)
+
+		def do_GET(self):
+			if self.path.endswith('/'):
+				if self.headers.get('If-None-Match') == upstream.etag:
+					return self.reply(304, headers={'ETag': upstream.etag})
+				return self.reply(200, upstream.listing, {'ETag': upstream.etag})
+			if upstream.image_status != 200:
+				return self.reply(upstream.image_status)
+			self.reply(200, upstream.image)
+
+		# predicted names are never there, so every refresh goes by the listing
+		def do_HEAD(self):
+			self.reply(404, send_body=False)
+
+	return Handler
+
+def refresh(sat, upstream):
+	upstream.requests = []
+	upstream.bytes = 0
+	url = sat.getLatestImageUrl()
+	crop = sat.loadCrop(url) if url else None
+	return url, crop, list(upstream.requests), upstream.bytes
+
+if __name__ == '__main__':
+	upstream = Upstream()
+	server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), make_handler(upstream))
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	projection.NESDIS_URL = 'http://127.0.0.1:{}/'.format(server.server_port)
+
+	SatelliteImage.last_downloads.clear()
+	sat = SatelliteImage(None, None, load=False)
+	failures = []
+
+	def check(ok, message):
+		if not ok:
+			failures.append(message)
+
+	def report(name, requests, nbytes):
+		print('{:<18}{:>8}{:>10}  {}'.format(name, len(requests), nbytes, ' '.join('{} {} {}'.format(*r) for r in requests)))
+
+	print('{:<18}{:>8}{:>10}  {}'.format('refresh', 'requests', 'bytes', 'what'))
+
+	url, first_crop, requests, nbytes = refresh(sat, upstream)
+	report('first', requests, nbytes)
+	check(first_crop is not None, 'first refresh gave no crop')
+	check(sat.last['url'] == url and sat.last['etag'] == upstream.etag, 'first refresh not remembered')
+
+	url, crop, requests, nbytes = refresh(sat, upstream)
+	report('unchanged', requests, nbytes)
+	check(('GET', 'listing', 304) in requests, 'unchanged listing was not a 304')
+	check(not any(r[0] == 'GET' and r[1].endswith('.jpg') for r in requests), 'unchanged image downloaded again')
+	check(crop is first_crop, 'unchanged image decoded again')
+
+	upstream.publish(NEW_IMAGE)
+	upstream.image_status = 503
+	last = dict(sat.last)
+	url, crop, requests, nbytes = refresh(sat, upstream)
+	report('download fails', requests, nbytes)
+	check(url.endswith(NEW_IMAGE) and crop is None, 'failed download gave a crop')
+	check(sat.last == last, 'failed download changed last_downloads')
+
+	upstream.image_status = 200
+	url, crop, requests, nbytes = refresh(sat, upstream)
+	report('recovered', requests, nbytes)
+	check(('GET', 'listing', 200) in requests, 'listing not fetched again after the failed download')
+	check(crop is not None and sat.last['url'].endswith(NEW_IMAGE), 'new image not picked up after the failed download')
+
+	server.shutdown()
+	for message in failures:
+		print(message)
+	if failures:
+		sys.exit(1)
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+cost of the background frame history: append, get, latest and an hour's frames
+
+	fills a history in a temporary directory with the fixture's dithered
+	background shifted about, several laps round the ring, then reopens it
+	the way a restart would and checks the frames come back as stored
+	run from anywhere: python3 benchmarks/bench_history.py [laps]
+"""
+
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from PIL import Image, ImageChops
+from lib.framehistory import FrameHistory, HISTORY_SLOTS, HISTORY_RESOLUTION
+from lib.memory import rss_kb
+from lib.satelliteimage import SatelliteImage
+
+FIXTURE = os.path.join(ROOT_DIR, 'benchmarks', 'fixtures', 'synthetic-ne-geocolor-1200x1200.jpg')
+
+LAPS = 3
+START = datetime(2020, 10, 7, 12, 0)
+
+def timed(fn, rounds):
+	start = time.perf_counter()
+	for i in range(rounds):
+		result = fn(i)
+	return result, (time.perf_counter() - start) / rounds * 1e6
+
+if __name__ == '__main__':
+	laps = int(sys.argv[1]) if len(sys.argv) > 1 else LAPS
+	sat = SatelliteImage(None, None, load=False)
+	bg = sat.ditheredIndex(sat.cropTriState(Image.open(FIXTURE)))
+	frames = [ImageChops.offset(bg, i * 3, 0) for i in range(16)]
+	step = timedelta(seconds=HISTORY_RESOLUTION)
+	count = HISTORY_SLOTS * laps
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, 'bg-history.ring')
+		history = FrameHistory(path)
+		history.open()
+		rss_before = rss_kb()[0]
+
+		ok, append_us = timed(lambda i: history.append(frames[i % len(frames)], START + step * i), count)
+		last = START + step * (count - 1)
+		img, get_us = timed(lambda i: history.get(last - step * (i % HISTORY_SLOTS)), count)
+		latest, latest_us = timed(lambda i: history.latest(), 100)
+		hour, recent_us = timed(lambda i: history.recent(timedelta(hours=1)), 10)
+		rss_after = rss_kb()[0]
+		history.close()
+
+		# a restart: a new mapping of the same file
+		reopened = FrameHistory(path)
+		same = all(
+			reopened.get(last - step * i).tobytes() == frames[(count - 1 - i) % len(frames)].tobytes()
+			for i in range(HISTORY_SLOTS)
+		)
+		overwritten = reopened.get(last - step * HISTORY_SLOTS) is None
+		size = os.path.getsize(path)
+		reopened.close()
+
+	print('{} frames appended over {} slots, file {} bytes'.format(count, HISTORY_SLOTS, size))
+	print('{:<14}{:>10}'.format('operation', 'us'))
+	print('{:<14}{:>10.1f}'.format('append', append_us))
+	print('{:<14}{:>10.1f}'.format('get', get_us))
+	print('{:<14}{:>10.1f}'.format('latest', latest_us))
+	print('{:<14}{:>10.1f}'.format('recent 1h', recent_us))
+	print('last hour: {} frames, rss grew {} KB'.format(len(hour), rss_after - rss_before))
+	print('after reopening: last lap intact {}, older lap overwritten {}'.format(same, overwritten))
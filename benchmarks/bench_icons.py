@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+compare the old per-pixel icon mask path with the icon cache
+
+	old: open icon, getpixel/putpixel mask, thumbnail icon and mask, paste
+	new: paste from IconCache
+	run from anywhere: python3 benchmarks/bench_icons.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+import pzwglobals
+from lib.icons import IconCache, ICON_DIRECTORY, ICON_SIZE_SMALL, create_mask
+
+ROUNDS = 20
+
+"""
+the original Screen.create_mask loop
+"""
+def legacy_create_mask(source, mask=(0, 1, 2)):
+	mask_image = Image.new("1", source.size)
+	w, h = source.size
+	for x in range(w):
+		for y in range(h):
+			p = source.getpixel((x, y))
+			if p in mask:
+				mask_image.putpixel((x, y), 255)
+	return mask_image
+
+def legacy_paste(bg, name, small):
+	icon_img = Image.open(ICON_DIRECTORY + name + ".png")
+	mask = legacy_create_mask(icon_img)
+	if small:
+		icon_img.thumbnail((ICON_SIZE_SMALL, ICON_SIZE_SMALL))
+		mask.thumbnail((ICON_SIZE_SMALL, ICON_SIZE_SMALL))
+	bg.paste(icon_img, (0, 0), mask)
+
+def bench(label, fn):
+	start = time.perf_counter()
+	for i in range(ROUNDS):
+		fn()
+	elapsed = (time.perf_counter() - start) / ROUNDS
+	print("{:<28}{:>10.3f} ms / frame".format(label, elapsed * 1000))
+	return elapsed
+
+if __name__ == '__main__':
+	names = sorted(os.path.splitext(f)[0] for f in os.listdir(ICON_DIRECTORY) if f.endswith('.png'))
+	bg = Image.new("P", (pzwglobals.DISPLAY_WIDTH, pzwglobals.DISPLAY_HEIGHT))
+
+	# sanity check, new masks must match the old ones pixel for pixel
+	for name in names:
+		icon_img = Image.open(ICON_DIRECTORY + name + ".png")
+		if legacy_create_mask(icon_img).tobytes() != create_mask(icon_img).tobytes():
+			print("mask mismatch for " + name)
+			sys.exit(1)
+
+	start = time.perf_counter()
+	cache = IconCache()
+	print("{:<28}{:>10.3f} ms (once)".format("IconCache load", (time.perf_counter() - start) * 1000))
+
+	# a frame is one full size icon (CurrentWeather) plus three small ones (ForecastDays)
+	def legacy_frame():
+		legacy_paste(bg, names[0], False)
+		for name in names[1:4]:
+			legacy_paste(bg, name, True)
+
+	def cached_frame():
+		cache.paste(bg, names[0], (0, 0))
+		for name in names[1:4]:
+			cache.paste(bg, name, (0, 0), small=True)
+
+	old = bench("per-pixel mask", legacy_frame)
+	new = bench("icon cache", cached_frame)
+	print("speedup: {:.1f}x".format(old / new))
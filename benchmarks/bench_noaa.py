@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+compare the minidom NOAA parse with the streaming NoaaXmlParser
+
+	checks both give the same temps, icons and summaries for each fixture,
+	then reports parse time and tracemalloc peak memory
+	run from anywhere: python3 benchmarks/bench_noaa.py [fixture.xml ...]
+"""
+
+import io
+import os
+import sys
+import glob
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from xml.dom import minidom
+from lib.noaaforecast import NoaaForecast
+from lib.noaaxml import NoaaXmlParser
+
+FIXTURES = sorted(glob.glob(os.path.join(ROOT_DIR, 'benchmarks', 'fixtures', 'synthetic-noaa-*.xml')))
+
+ROUNDS = 200
+
+"""
+our four forecast dates, starting at the first date in the fixture
+"""
+def fixture_dates(xml):
+	first = minidom.parseString(xml).getElementsByTagName('start-valid-time')[0].firstChild.nodeValue[0:10]
+	day = datetime.strptime(first, '%Y-%m-%d')
+	return [(day + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(4)]
+
+def parse_dom(forecast, xml):
+	dom = minidom.parseString(xml)
+	time_layouts = forecast.parseTimeLayouts(dom)
+	return (forecast.parseTemps(dom, time_layouts), forecast.parseIcons(dom, time_layouts), forecast.parseSummaries(dom, time_layouts))
+
+def parse_stream(forecast, xml):
+	parsed = NoaaXmlParser().parse(io.BytesIO(xml))
+	return (parsed.temps(forecast.dates), parsed.icons(forecast.dates), parsed.summaries(forecast.dates))
+
+def measure(fn):
+	tracemalloc.start()
+	result = fn()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+
+	start = time.perf_counter()
+	for i in range(ROUNDS):
+		fn()
+	return result, (time.perf_counter() - start) / ROUNDS, peak
+
+if __name__ == '__main__':
+	paths = sys.argv[1:] or FIXTURES
+
+	print("{:<36}{:>10}{:>12}{:>10}{:>12}".format("fixture", "dom ms", "dom KB", "stream ms", "stream KB"))
+	for path in paths:
+		with open(path, 'rb') as f:
+			xml = f.read()
+
+		forecast = NoaaForecast.__new__(NoaaForecast)
+		forecast.dates = fixture_dates(xml)
+
+		old, old_time, old_peak = measure(lambda: parse_dom(forecast, xml))
+		new, new_time, new_peak = measure(lambda: parse_stream(forecast, xml))
+
+		if old != new:
+			print("streaming parse differs for " + path)
+			sys.exit(1)
+
+		print("{:<36}{:>10.3f}{:>12.1f}{:>10.3f}{:>12.1f}".format(os.path.basename(path), old_time * 1000, old_peak / 1024.0, new_time * 1000, new_peak / 1024.0))
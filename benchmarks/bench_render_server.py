@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+frames per minute of the render server for N locations, from the fixtures
+
+	"per daemon" is what one daemon per location costs: each decodes the
+	image, crops, dithers and composes its own frames. the server rows decode
+	the image once for every location and spread dithering and composing
+	over a process pool. frames are written to a temporary directory
+	run from anywhere: python3 benchmarks/bench_render_server.py [locations ...]
+"""
+
+import io
+import os
+import sys
+import time
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from PIL import Image
+from lib.locations import Location
+from lib.renderserver import RenderServer
+from lib.satelliteimage import SatelliteImage
+from lib.screens import CurrentWeather, ForecastDays
+from suite import read_fixture, build_stages
+
+LOCATION_COUNTS = (1, 8, 32)
+
+"""
+n locations on a grid over the ne sector, around our own
+"""
+def make_locations(n):
+	locations = []
+	for i in range(n):
+		latitude = 40.74307 + (i // 8) * 0.5 - 1.5
+		longitude = -73.9182 + (i % 8) * 0.75 - 3.0
+		locations.append(Location('site-{}'.format(i), latitude, longitude))
+	return locations
+
+def forecasts():
+	stages = dict(build_stages())
+	return stages['noaa_parse'](), stages['darksky_scan']()
+
+"""
+the same work done the way separate daemons would, one location after another
+ each decodes its own copy of the image and encodes its frames as png
+"""
+def per_daemon(locations, noaa, darksky):
+	jpeg = read_fixture('image')
+	sats = [SatelliteImage(None, None, load=False, location=location) for location in locations]
+	screens = [CurrentWeather('current_weather'), ForecastDays('forecast_days')]
+	start = time.perf_counter()
+	frames = 0
+	for sat in sats:
+		crop = sat.cropTriState(Image.open(io.BytesIO(jpeg)))
+		bg = sat.ditheredIndex(crop)
+		for screen in screens:
+			screen.compose(bg.copy(), darksky, noaa).save(io.BytesIO(), 'PNG')
+			frames = frames + 1
+	return frames, time.perf_counter() - start
+
+def server(locations, noaa, darksky, workers, directory):
+	jpeg = read_fixture('image')
+	srv = RenderServer(locations, workers=workers, directory=directory)
+	try:
+		# a throwaway job per worker, so process start up isn't timed
+		if srv.pool is not None:
+			list(srv.pool.map(sum, [[1]] * (workers * 4)))
+		start = time.perf_counter()
+		# every location is in the ne sector, the fixture's
+		crops = {}
+		for sat, members in srv.sectors.values():
+			cropped = sat.cropMany(Image.open(io.BytesIO(jpeg)), [(w.left, w.top) for l, w in members])
+			crops.update({l.name: (c.size, c.convert('RGB').tobytes()) for (l, w), c in zip(members, cropped)})
+		frames = srv.render_frames(crops, {(l.latitude, l.longitude): (noaa, darksky) for l in locations})
+		return frames, time.perf_counter() - start
+	finally:
+		srv.stop()
+
+if __name__ == '__main__':
+	counts = [int(a) for a in sys.argv[1:]] or LOCATION_COUNTS
+	noaa, darksky = forecasts()
+	cpus = os.cpu_count() or 1
+	worker_counts = sorted(set([1, 2, cpus]))
+
+	# build the yliluoma table and load fonts before anything is timed
+	per_daemon(make_locations(1), noaa, darksky)
+
+	print('{:>10}  {:<14}{:>10}{:>12}{:>14}'.format('locations', 'mode', 'frames', 'seconds', 'frames/min'))
+	with tempfile.TemporaryDirectory() as directory:
+		for n in counts:
+			locations = make_locations(n)
+			frames, elapsed = per_daemon(locations, noaa, darksky)
+			print('{:>10}  {:<14}{:>10}{:>12.3f}{:>14.0f}'.format(n, 'per daemon', frames, elapsed, frames / elapsed * 60))
+			for workers in worker_counts:
+				frames, elapsed = server(locations, noaa, darksky, workers, directory)
+				print('{:>10}  {:<14}{:>10}{:>12.3f}{:>14.0f}'.format(n, 'server x{}'.format(workers), frames, elapsed, frames / elapsed * 60))
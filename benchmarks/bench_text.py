@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+compare the old nine draw.text calls per character with the glyph atlas
+
+	a frame is the text of one CurrentWeather and one ForecastDays render
+	run from anywhere: python3 benchmarks/bench_text.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFont
+import pzwglobals
+from lib.glyphs import GlyphAtlas
+from lib.screens import WHITE, BLACK, FONT_SIZE, FONT_SIZE_SMALL
+
+ROUNDS = 50
+
+"""
+the original Screen.text_with_border
+"""
+def legacy_text_with_border(draw, string, xy, font, align="left"):
+	over = 2
+	x,y = xy
+	if align == "right":
+		w,h = draw.textsize(string, font=font)
+		x = x - w
+	cx = x
+	for c in string:
+		draw.text((cx-over,y-over), c, WHITE, font=font)
+		draw.text((cx,y-over), c, WHITE, font=font)
+		draw.text((cx+over,y-over), c, WHITE, font=font)
+		draw.text((cx-over,y), c, WHITE, font=font)
+		draw.text((cx+over,y), c, WHITE, font=font)
+		draw.text((cx-over,y+over), c, WHITE, font=font)
+		draw.text((cx,y+over), c, WHITE, font=font)
+		draw.text((cx+over,y+over), c, WHITE, font=font)
+		cw = draw.textsize(c, font=font)[0]
+		cx = cx + cw
+	cx = x
+	for c in string:
+		draw.text((cx,y), c, BLACK, font=font)
+		cw = draw.textsize(c, font=font)[0]
+		cx = cx + cw
+
+if __name__ == '__main__':
+	font = ImageFont.truetype(pzwglobals.FONT_DIRECTORY + "Impact.ttf", FONT_SIZE)
+	font_small = ImageFont.truetype(pzwglobals.FONT_DIRECTORY + "Impact.ttf", FONT_SIZE_SMALL)
+	bg = Image.open(pzwglobals.IMG_DIRECTORY + 'default-bg.png')
+
+	frame = [
+		("1/23", (20, 6), font, "left"),
+		("10:40 PM", (190, 6), font, "right"),
+		(u"48°", (180, 40), font, "right"),
+		("60 %", (192, 66), font, "right"),
+		("Mon", (8, 2), font, "left"),
+		(u"40-51°", (8, 31), font_small, "left"),
+		("Tue", (73, 2), font, "left"),
+		(u"41-52°", (73, 31), font_small, "left"),
+		("Wed", (138, 2), font, "left"),
+		(u"42-53°", (138, 31), font_small, "left"),
+	]
+
+	atlas = GlyphAtlas()
+
+	def legacy_frame(img):
+		draw = ImageDraw.Draw(img)
+		for string, xy, f, align in frame:
+			legacy_text_with_border(draw, string, xy, f, align)
+
+	def atlas_frame(img):
+		for string, xy, f, align in frame:
+			atlas.text_with_border(img, string, xy, f, fill=BLACK, border_fill=WHITE, align=align)
+
+	# sanity check, the atlas must draw the same pixels
+	old_img = bg.copy()
+	new_img = bg.copy()
+	legacy_frame(old_img)
+	atlas_frame(new_img)
+	if old_img.tobytes() != new_img.tobytes():
+		print("atlas output differs from draw.text output")
+		sys.exit(1)
+
+	results = []
+	for label, fn in (("draw.text x9", legacy_frame), ("glyph atlas", atlas_frame)):
+		start = time.perf_counter()
+		for i in range(ROUNDS):
+			fn(bg.copy())
+		elapsed = (time.perf_counter() - start) / ROUNDS
+		results.append(elapsed)
+		print("{:<28}{:>10.3f} ms / frame".format(label, elapsed * 1000))
+
+	print("speedup: {:.1f}x".format(results[0] / results[1]))
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+peak memory of a full refresh cycle, per stage, against a ceiling
+
+	runs parse -> listing -> decode and crop -> dither -> pre-render on the
+	synthetic responses in benchmarks/fixtures, with memory profiling on,
+	and prints peak traced memory and resident size for every stage.
+	exits 1 if any cycle's resident size went over the ceiling
+	run from anywhere: python3 benchmarks/memory_ceiling.py [--ceiling-mb 96] [--no-low-memory]
+"""
+
+import io
+import os
+import re
+import sys
+import argparse
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import pzwglobals
+from PIL import Image
+from lib.memory import get_memory_budget
+from lib.noaaxml import NoaaXmlParser
+from lib.darkskyscan import DarkSkyScanner
+from lib.darkskyweather import SCAN_CHUNK_SIZE
+from lib.satelliteimage import SatelliteImage
+from lib.refresher import WeatherSnapshot
+from lib.screens import CurrentWeather, ForecastDays
+from suite import read_fixture
+
+DEFAULT_CYCLES = 3
+
+"""
+one refresh cycle, each stage named like the daemon's metrics span
+"""
+def cycle(budget, screens):
+	with budget.stage('noaa.parse'):
+		noaa_xml = read_fixture('noaa')
+		first = re.search(rb'<start-valid-time>(\d{4}-\d\d-\d\d)', noaa_xml).group(1).decode('ascii')
+		day = datetime.strptime(first, '%Y-%m-%d')
+		forecast_dates = [day + timedelta(days=i) for i in range(4)]
+		dates = [fd.strftime('%Y-%m-%d') for fd in forecast_dates]
+		parsed = NoaaXmlParser().parse(io.BytesIO(noaa_xml))
+		noaa = {
+			'date_names': [fd.strftime('%A') for fd in forecast_dates],
+			'dates_abbr': [fd.strftime('%m/%d') for fd in forecast_dates],
+			'temps': parsed.temps(dates),
+			'icons': parsed.icons(dates),
+			'summaries': parsed.summaries(dates)
+		}
+		del parsed, noaa_xml
+	budget.release()
+
+	with budget.stage('darksky.scan'):
+		text = read_fixture('darksky').decode('utf-8')
+		darksky = DarkSkyScanner().scan(iter([text[i:i + SCAN_CHUNK_SIZE] for i in range(0, len(text), SCAN_CHUNK_SIZE)]))
+		del text
+	budget.release()
+
+	sat = SatelliteImage('yliluoma', 64, load=False)
+
+	with budget.stage('satellite.listing_parse'):
+		sat.scanListing(read_fixture('listing'))
+	budget.release()
+
+	with budget.stage('satellite.crop'):
+		img = Image.open(io.BytesIO(read_fixture('image')))
+		crop = sat.cropTriState(img)
+		del img
+	budget.release()
+
+	with budget.stage('dither.yliluoma'):
+		bg = sat.ditheredIndex(crop)
+	budget.release()
+
+	snapshot = WeatherSnapshot(bg=bg, noaa=noaa, darksky=darksky, loaded_at=datetime.now())
+	for screen in screens:
+		screen.on_snapshot(snapshot)
+	budget.release()
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--ceiling-mb', type=float, default=pzwglobals.MEMORY_CEILING_MB, help="most resident MB a cycle may reach")
+	parser.add_argument('--cycles', '-c', type=int, default=DEFAULT_CYCLES, help="refresh cycles to run")
+	parser.add_argument('--no-low-memory', action='store_true', help="profile without freeing intermediates between stages")
+	args = parser.parse_args()
+
+	budget = get_memory_budget()
+	budget.configure(low_memory=not args.no_low_memory, profile=True)
+	screens = [CurrentWeather('current_weather'), ForecastDays('forecast_days')]
+
+	over = 0
+	for i in range(args.cycles):
+		with budget.stage('cycle'):
+			cycle(budget, screens)
+		peak_mb = budget.stages['cycle']['last_rss_peak_kb'] / 1024.0
+		flag = ''
+		if peak_mb > args.ceiling_mb:
+			flag = '  OVER'
+			over = over + 1
+		print('cycle {}: peak rss {:.1f} MB of {:.0f} MB{}'.format(i + 1, peak_mb, args.ceiling_mb, flag))
+
+	print('')
+	print(budget.report())
+	sys.exit(1 if over else 0)
@@ -0,0 +1,241 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+offline benchmark of every stage of the fetch -> parse -> crop -> dither -> render pipeline
+
+	runs against the fixtures in benchmarks/fixtures, so no network is needed,
+	and times each stage on its own. the fixtures are synthetic: hand built
+	NOAA xml, DarkSky html and NESDIS listing shaped like the real responses,
+	and a noise image in place of a GEOCOLOR capture, so decode, dither and
+	compression timings are comparable run to run but not with a real image.
+	a recorded response can be dropped in under the same name. results are printed as json on stdout,
+	the comparison with a stored baseline goes to stderr
+	run from anywhere: python3 benchmarks/suite.py [--baseline file] [--save-baseline]
+	exits 1 if a stage got slower than the baseline by more than the tolerance
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from PIL import Image
+from lib.noaaxml import NoaaXmlParser
+from lib.darkskyscan import DarkSkyScanner
+from lib.darkskyweather import SCAN_CHUNK_SIZE
+from lib.satelliteimage import SatelliteImage
+from lib.screens import CurrentWeather, ForecastDays
+
+FIXTURE_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'fixtures')
+FIXTURES = {
+	'noaa': 'synthetic-noaa-ndfd-byday-morning.xml',
+	'darksky': 'synthetic-darksky-forecast.html',
+	'listing': 'synthetic-nesdis-ne-geocolor-listing.html',
+	'image': 'synthetic-ne-geocolor-1200x1200.jpg'
+}
+
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, 'benchmarks', 'baseline.json')
+DEFAULT_ROUNDS = 20
+DEFAULT_TOLERANCE = 1.25
+
+# bump when stages change meaning, so old baselines aren't compared against
+SUITE_VERSION = 1
+
+DITHERS = (('yliluoma', None), ('bayer', 64), ('cluster', 64))
+
+PACKAGES = ('PIL', 'numpy', 'lxml', 'bs4', 'requests', 'hitherdither')
+
+def read_fixture(name):
+	with open(os.path.join(FIXTURE_DIR, FIXTURES[name]), 'rb') as f:
+		return f.read()
+
+"""
+versions of everything whose upgrade could move the numbers
+"""
+def environment():
+	env = {
+		'python': platform.python_version(),
+		'machine': platform.machine(),
+		'platform': platform.platform()
+	}
+	for name in PACKAGES:
+		try:
+			module = __import__(name)
+			env[name] = getattr(module, '__version__', 'unknown')
+		except Exception:
+			env[name] = None
+	return env
+
+"""
+ordered (name, fn) list of stages, each fn runs the stage once on the fixtures
+ later stages are fed the output of earlier ones, like the daemon does
+"""
+def build_stages():
+	noaa_xml = read_fixture('noaa')
+	darksky_text = read_fixture('darksky').decode('utf-8')
+	listing = read_fixture('listing')
+	jpeg = read_fixture('image')
+
+	first = re.search(rb'<start-valid-time>(\d{4}-\d\d-\d\d)', noaa_xml).group(1).decode('ascii')
+	day = datetime.strptime(first, '%Y-%m-%d')
+	forecast_dates = [day + timedelta(days=i) for i in range(4)]
+	dates = [fd.strftime('%Y-%m-%d') for fd in forecast_dates]
+
+	def noaa_parse():
+		parsed = NoaaXmlParser().parse(io.BytesIO(noaa_xml))
+		return {
+			'date_names': [fd.strftime('%A') for fd in forecast_dates],
+			'dates_abbr': [fd.strftime('%m/%d') for fd in forecast_dates],
+			'temps': parsed.temps(dates),
+			'icons': parsed.icons(dates),
+			'summaries': parsed.summaries(dates)
+		}
+
+	chunks = [darksky_text[i:i + SCAN_CHUNK_SIZE] for i in range(0, len(darksky_text), SCAN_CHUNK_SIZE)]
+
+	def darksky_scan():
+		return DarkSkyScanner().scan(iter(chunks))
+
+	sat = SatelliteImage(None, None, load=False)
+
+	def listing_parse():
+		return sat.scanListing(listing)
+
+	def crop():
+		return sat.cropTriState(Image.open(io.BytesIO(jpeg)))
+
+	noaa = noaa_parse()
+	darksky = darksky_scan()
+	cropped = crop()
+
+	stages = [
+		('noaa_parse', noaa_parse),
+		('darksky_scan', darksky_scan),
+		('listing_parse', listing_parse),
+		('crop', crop)
+	]
+
+	dithered = {}
+	for algorithm, threshold in DITHERS:
+		ditherer = SatelliteImage.__new__(SatelliteImage)
+		ditherer.dither = algorithm
+		ditherer.threshold = threshold
+		name = 'dither_' + algorithm if threshold is None else 'dither_{}_{}'.format(algorithm, threshold)
+		stages.append((name, lambda ditherer=ditherer: ditherer.ditheredIndex(cropped)))
+		dithered[algorithm] = ditherer.ditheredIndex(cropped)
+
+	bg = dithered['yliluoma']
+	current = CurrentWeather('current_weather')
+	forecast = ForecastDays('forecast_days')
+	stages.append(('render_current', lambda: current.compose(bg.copy(), darksky, noaa)))
+	stages.append(('render_forecast', lambda: forecast.compose(bg.copy(), darksky, noaa)))
+
+	return stages
+
+"""
+min, median and mean wall time of fn over rounds, after one warm up run
+"""
+def time_stage(fn, rounds):
+	fn()
+	times = []
+	for i in range(rounds):
+		start = time.perf_counter()
+		fn()
+		times.append((time.perf_counter() - start) * 1000)
+	times.sort()
+	return {
+		'rounds': rounds,
+		'min_ms': round(times[0], 4),
+		'median_ms': round(times[len(times) // 2], 4),
+		'mean_ms': round(sum(times) / len(times), 4)
+	}
+
+def run(rounds, only=None):
+	stages = {}
+	for name, fn in build_stages():
+		if only and not re.search(only, name):
+			continue
+		stages[name] = time_stage(fn, rounds)
+	return {
+		'suite_version': SUITE_VERSION,
+		'timestamp': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+		'environment': environment(),
+		'stages': stages
+	}
+
+"""
+compare fastest runs with a baseline result, the minimum is the figure
+least disturbed by whatever else the machine is doing
+ returns a list of (stage, baseline ms, current ms, ratio), ratio None for new stages
+"""
+def compare(result, baseline, key='min_ms'):
+	rows = []
+	for name, stage in result['stages'].items():
+		base = baseline['stages'].get(name)
+		if base is None or not base[key]:
+			rows.append((name, None, stage[key], None))
+		else:
+			rows.append((name, base[key], stage[key], stage[key] / base[key]))
+	return rows
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--rounds', '-r', type=int, default=DEFAULT_ROUNDS, help="timed runs per stage")
+	parser.add_argument('--stage', '-s', type=str, default=None, help="only run stages matching this regex")
+	parser.add_argument('--output', '-o', type=str, default=None, help="also write the json result here")
+	parser.add_argument('--baseline', '-b', type=str, default=DEFAULT_BASELINE, help="baseline json to compare with")
+	parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+	parser.add_argument('--tolerance', '-t', type=float, default=DEFAULT_TOLERANCE, help="slowdown ratio that counts as a regression")
+	args = parser.parse_args()
+
+	result = run(args.rounds, args.stage)
+	text = json.dumps(result, indent=2, sort_keys=True)
+	print(text)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			f.write(text + '\n')
+
+	if args.save_baseline:
+		with open(args.baseline, 'w') as f:
+			f.write(text + '\n')
+		sys.stderr.write("baseline saved to {}\n".format(args.baseline))
+		sys.exit(0)
+
+	try:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+	except (OSError, ValueError):
+		sys.stderr.write("no baseline at {}, run with --save-baseline to store one\n".format(args.baseline))
+		sys.exit(0)
+
+	if baseline.get('suite_version') != SUITE_VERSION:
+		sys.stderr.write("baseline is from suite version {}, not comparing\n".format(baseline.get('suite_version')))
+		sys.exit(0)
+
+	regressions = 0
+	sys.stderr.write("{:<22}{:>14}{:>14}{:>10}\n".format("stage", "baseline ms", "current ms", "ratio"))
+	for name, base, current, ratio in compare(result, baseline):
+		if ratio is None:
+			sys.stderr.write("{:<22}{:>14}{:>14.3f}{:>10}\n".format(name, "-", current, "new"))
+			continue
+		flag = ''
+		if ratio > args.tolerance:
+			flag = '  SLOWER'
+			regressions = regressions + 1
+		sys.stderr.write("{:<22}{:>14.3f}{:>14.3f}{:>9.2f}x{}\n".format(name, base, current, ratio, flag))
+
+	changed = [k for k in PACKAGES if baseline['environment'].get(k) != result['environment'].get(k)]
+	if changed:
+		sys.stderr.write("package versions differ from the baseline: {}\n".format(', '.join(changed)))
+
+	sys.exit(1 if regressions else 0)
@@ -0,0 +1,114 @@
+import math
+import time
+import threading
+from collections import deque
+import pzwglobals
+
+logger = pzwglobals.logger
+
+BREAKER_FAILURES = 3
+BREAKER_RESET = 5 * 60
+LATENCY_WINDOW = 50
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+"""
+raised instead of calling an upstream whose breaker is open
+"""
+class CircuitOpenError(Exception):
+	pass
+
+"""
+p-th percentile of a list of numbers, nearest rank
+"""
+def percentile(values, p):
+	if not values:
+		return None
+	ordered = sorted(values)
+	index = min(len(ordered) - 1, max(0, int(math.ceil(p / 100.0 * len(ordered))) - 1))
+	return ordered[index]
+
+"""
+CircuitBreaker
+
+	stops calling an upstream after failures in a row, so a dead server
+	costs nothing per refresh and the caller serves cached data instead.
+	once reset seconds have passed one probe request is let through
+	(half-open), its result closes or reopens the breaker.
+	also keeps the latest request latencies for tail reporting
+"""
+class CircuitBreaker():
+	def __init__(self, name, failures=BREAKER_FAILURES, reset=BREAKER_RESET):
+		self.name = name
+		self.max_failures = failures
+		self.reset = reset
+		self.state = CLOSED
+		self.failures = 0
+		self.opened_at = None
+		self.probing = False
+		self.rejected = 0
+		self.latencies = deque(maxlen=LATENCY_WINDOW)
+		self.lock = threading.Lock()
+
+	"""
+	raise CircuitOpenError unless a request may go out now
+	"""
+	def allow(self):
+		with self.lock:
+			if self.state == CLOSED:
+				return
+			if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset:
+				self.set_state(HALF_OPEN)
+			if self.state == HALF_OPEN and not self.probing:
+				self.probing = True
+				return
+			self.rejected = self.rejected + 1
+			raise CircuitOpenError('{} circuit {}, skipping request'.format(self.name, self.state))
+
+	def success(self, seconds):
+		with self.lock:
+			self.latencies.append(seconds)
+			self.probing = False
+			if self.state != CLOSED:
+				self.set_state(CLOSED)
+			self.failures = 0
+
+	def failure(self, seconds):
+		with self.lock:
+			self.latencies.append(seconds)
+			self.failures = self.failures + 1
+			self.probing = False
+			if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.max_failures):
+				self.opened_at = time.monotonic()
+				self.set_state(OPEN)
+
+	"""
+	change state and log it, call with the lock held
+	"""
+	def set_state(self, state):
+		logger.warning('{} circuit {} -> {}, {} failures in a row, latency {}'.format(self.name, self.state, state, self.failures, self.tail()))
+		self.state = state
+
+	"""
+	p50 / p95 / max of the recent latencies in seconds
+	"""
+	def tail(self):
+		values = list(self.latencies)
+		if not values:
+			return {}
+		return {
+			'p50': round(percentile(values, 50), 3),
+			'p95': round(percentile(values, 95), 3),
+			'max': round(max(values), 3)
+		}
+
+	def stats(self):
+		with self.lock:
+			return {
+				'state': self.state,
+				'failures': self.failures,
+				'rejected': self.rejected,
+				'latency': self.tail()
+			}
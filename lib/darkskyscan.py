@@ -0,0 +1,113 @@
+from html.parser import HTMLParser
+
+"""
+DarkSkyScanner
+
+	streaming scan of the darksky forecast page for the four values we use:
+	the currently summary (icon alt) and temperature, pressure and humidity.
+	feed it chunks as they download and stop once done is True,
+	the rest of the page is never read or parsed.
+	only the first span.currently, div.pressure and div.humidity count,
+	same as the soup.find_all(...)[0] lookups it replaces
+"""
+class DarkSkyScanner(HTMLParser):
+	def __init__(self):
+		HTMLParser.__init__(self, convert_charrefs=True)
+		self.weather = {}
+		self.seen = set()
+
+		# block we're inside: 'currently', 'pressure' or 'humidity'
+		self.block = None
+		self.block_tag = None
+		self.block_depth = 0
+
+		# field whose text we're collecting, and how deep in its span we are
+		self.field = None
+		self.field_depth = 0
+		self.field_text = []
+
+	@property
+	def done(self):
+		return len(self.weather) == 4
+
+	def handle_starttag(self, tag, attrs):
+		if self.done:
+			return
+
+		if self.block is None:
+			classes = self.classes(attrs)
+			for block, block_tag in (('currently', 'span'), ('pressure', 'div'), ('humidity', 'div')):
+				if tag == block_tag and block in classes and block not in self.seen:
+					self.seen.add(block)
+					self.block = block
+					self.block_tag = block_tag
+					self.block_depth = 1
+					return
+			return
+
+		if tag == self.block_tag:
+			self.block_depth = self.block_depth + 1
+
+		if self.field is not None:
+			if tag == 'span':
+				self.field_depth = self.field_depth + 1
+			return
+
+		if self.block == 'currently':
+			if tag == 'img' and 'summary' not in self.weather:
+				self.weather['summary'] = dict(attrs).get('alt', '').split()[0]
+			elif tag == 'span' and 'summary' in self.classes(attrs) and 'temperature' not in self.weather:
+				self.start_field('temperature')
+		elif tag == 'span' and 'num' in self.classes(attrs) and self.block not in self.weather:
+			self.start_field(self.block)
+
+	def handle_endtag(self, tag):
+		if self.block is None:
+			return
+
+		if self.field is not None and tag == 'span':
+			self.field_depth = self.field_depth - 1
+			if self.field_depth == 0:
+				self.end_field()
+
+		if tag == self.block_tag:
+			self.block_depth = self.block_depth - 1
+			if self.block_depth == 0:
+				self.block = None
+				self.field = None
+
+	def handle_data(self, data):
+		if self.field is not None:
+			self.field_text.append(data)
+
+	def start_field(self, field):
+		self.field = field
+		self.field_depth = 1
+		self.field_text = []
+
+	def end_field(self):
+		text = ''.join(self.field_text)
+		if self.field == 'temperature':
+			self.weather['temperature'] = int(text.split()[0][:-1])
+		else:
+			self.weather[self.field] = int(text)
+		self.field = None
+
+	def classes(self, attrs):
+		for name, value in attrs:
+			if name == 'class' and value:
+				return value.split()
+		return []
+
+	"""
+	feed text chunks until all four values are found
+	 returns the weather dict, raises ValueError if the page ran out first
+	"""
+	def scan(self, chunks):
+		for chunk in chunks:
+			self.feed(chunk)
+			if self.done:
+				break
+		if not self.done:
+			raise ValueError('darksky page missing {}'.format(sorted({'summary', 'temperature', 'pressure', 'humidity'} - set(self.weather))))
+		return self.weather
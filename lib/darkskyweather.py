@@ -1,14 +1,20 @@
-from datetime import datetime, timedelta
-import requests
-from bs4 import BeautifulSoup
-import json
 import pzwglobals
+from lib.darkskyscan import DarkSkyScanner
+from lib.ttlcache import get_cache, JsonStore
+from lib.httpclient import get_http_client
+from lib.metrics import get_metrics
 
 logger = pzwglobals.logger
 
-DARK_SKY_URL = "https://darksky.net/forecast/{}/us12/en".format(",".join([pzwglobals.LATITUDE, pzwglobals.LONGITUDE]))
+"""
+forecast page url for a latitude and longitude, as strings
+"""
+def dark_sky_url(latitude, longitude):
+	return "https://darksky.net/forecast/{}/us12/en".format(",".join([latitude, longitude]))
 
-LOG_DATE_FORMAT = '%Y%m%d%H%M%S'
+DARK_SKY_URL = dark_sky_url(pzwglobals.LATITUDE, pzwglobals.LONGITUDE)
+
+SCAN_CHUNK_SIZE = 8 * 1024
 
 """
 DarkSkyWeather
@@ -16,50 +22,46 @@ DarkSkyWeather
 	lightly adapted from InkyPhat example script
 	scrape darksky for temp, summary-icon, pressure and humidity
 	store data on public prop weather
+	for the location in pzwglobals, or a lib.locations Location
 """
 class DarkSkyWeather():
-	def __init__(self, debug=False):
-		try:
-			with open(pzwglobals.DATA_DIRECTORY + "darksky.json") as f:
-				drksky_log = json.load(f)
-		except:
-			logger.warning("couldn't open darksky log")
-			drksky_log = {}
-	
-		if drksky_log is not None and "last_load" in drksky_log:
-			last_load = datetime.strptime(drksky_log["last_load"], LOG_DATE_FORMAT)
-			now = datetime.now()
-			tdiff = now - last_load
+	def __init__(self, debug=False, location=None, revalidate=True):
+		if location is None:
+			self.url = DARK_SKY_URL
+			name = 'darksky'
+		else:
+			self.url = dark_sky_url(location.latitude, location.longitude)
+			name = 'darksky-' + location.name
 		
-			logger.debug("time difference: " + last_load.strftime(LOG_DATE_FORMAT) + " - " + now.strftime(LOG_DATE_FORMAT))
-			logger.debug(tdiff)
-			
-			if (tdiff < timedelta(minutes=10) or debug is True):
-				logger.info("using logged darksky data")
-				self.weather = {
-					'summary': drksky_log["summary"],
-					'temperature': drksky_log["temperature"],
-					'pressure': drksky_log["pressure"],
-					'humidity': drksky_log["humidity"],
-					'last_load': drksky_log["last_load"]
-				}
-				return None
+		cache = get_cache(name, JsonStore(pzwglobals.DATA_DIRECTORY + name + ".json"), source='darksky')
 		
-		self.weather = self.get_weather()
-		self.weather['last_load'] = datetime.now().strftime(LOG_DATE_FORMAT)
+		self.weather = cache.get(self.get_weather, ignore_ttl=debug is True, revalidate=revalidate)
 		
-		with open(pzwglobals.DATA_DIRECTORY + "darksky.json", 'w') as f:
-			json.dump(self.weather, f)
-			
 		return None
+
 	"""
 	Query Dark Sky (https://darksky.net/) to scrape current weather data
+	 the page is scanned as it streams in and the download stops
+	 as soon as all four values are found
 	"""
 	def get_weather(self):
+		with get_http_client().stream(self.url, source='darksky', deadline=pzwglobals.FETCH_DEADLINES['darksky']) as res:
+			if res.status_code == 200:
+				if res.encoding is None:
+					res.encoding = 'utf-8'
+				chunks = res.iter_content(chunk_size=SCAN_CHUNK_SIZE, decode_unicode=True)
+				with get_metrics().span('darksky.scan'):
+					return DarkSkyScanner().scan(chunks)
+		return None
+
+	"""
+	full page BeautifulSoup parse, the reference for DarkSkyScanner
+	"""
+	def parse_soup(self, content):
 		weather = {}
-		res = requests.get(DARK_SKY_URL)
-		if res.status_code == 200:
-			soup = BeautifulSoup(res.content, "lxml")
+		if content:
+			from bs4 import BeautifulSoup
+			soup = BeautifulSoup(content, "lxml")
 			curr = soup.find_all("span", "currently")
 			weather["summary"] = curr[0].img["alt"].split()[0]
 			weather["temperature"] = int(curr[0].find("span", "summary").text.split()[0][:-1])
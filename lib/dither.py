@@ -0,0 +1,214 @@
+import numpy as np
+from PIL import Image
+import pzwglobals
+
+logger = pzwglobals.logger
+
+"""
+vectorized ordered dithering for the three colour Inky palette
+
+	same algorithms as the hitherdither calls we used to make
+	(yliluoma 1, bayer and cluster dot, order 8) but done with
+	whole array numpy ops, precomputed threshold matrices and
+	palette lookup tables
+"""
+
+# white, black, red. indices line up with the Inky colours in screens
+PALETTE = np.array([
+	[0xff, 0xff, 0xff],
+	[0x00, 0x00, 0x00],
+	[0xff, 0x00, 0x00]
+], dtype=np.float32)
+
+ALGORITHMS = ('yliluoma', 'bayer', 'cluster')
+
+DEFAULT_ORDER = 8
+
+# bits per channel of the yliluoma mixing plan table
+YLILUOMA_LUT_BITS = 5
+# colours per step of the table build. each step holds a float64 penalty
+# per candidate mix, 256 keeps that around 2.5 MB and builds no slower
+YLILUOMA_LUT_CHUNK = 256
+
+CLUSTER_DOT_8 = np.array([
+	[24, 10, 12, 26, 35, 47, 49, 37],
+	[8, 0, 2, 14, 45, 59, 61, 51],
+	[22, 6, 4, 16, 43, 57, 63, 53],
+	[30, 20, 18, 28, 33, 41, 55, 39],
+	[34, 46, 48, 36, 25, 11, 13, 27],
+	[44, 58, 60, 50, 9, 1, 3, 15],
+	[42, 56, 62, 52, 23, 7, 5, 17],
+	[32, 40, 54, 38, 31, 21, 19, 29]
+], dtype=np.float32)
+
+_threshold_maps = {}
+_offset_maps = {}
+_yliluoma_luts = {}
+
+"""
+bayer index matrix with side of length n (a power of 2)
+ transposed like the one hitherdither dithers with
+"""
+def bayer_matrix(n, transposed=True):
+	m = np.zeros((1, 1), dtype=np.float32)
+	while m.shape[0] < n:
+		m = np.block([
+			[4 * m, 4 * m + 2],
+			[4 * m + 3, 4 * m + 1]
+		])
+	if transposed:
+		return m.T
+	return m
+
+"""
+normalized threshold matrix in [0, 1) for an algorithm
+"""
+def threshold_matrix(algorithm, order=DEFAULT_ORDER):
+	if algorithm in ('yliluoma', 'bayer') or order != 8:
+		m = bayer_matrix(order)
+	else:
+		m = CLUSTER_DOT_8
+	return m / (order * order)
+
+"""
+threshold matrix tiled to an image size, cached per algorithm, order and size
+"""
+def threshold_map(algorithm, size, order=DEFAULT_ORDER):
+	key = (algorithm, order, size)
+	tm = _threshold_maps.get(key)
+	if tm is None:
+		w, h = size
+		m = threshold_matrix(algorithm, order)
+		tm = np.tile(m, (h // order + 1, w // order + 1))[:h, :w]
+		_threshold_maps[key] = tm
+	return tm
+
+"""
+per pixel rgb offsets for bayer and cluster dot, cached per threshold
+ added to the source before the palette lookup, as hitherdither does
+"""
+def offset_map(algorithm, threshold, size, order=DEFAULT_ORDER):
+	key = (algorithm, threshold, order, size)
+	om = _offset_maps.get(key)
+	if om is None:
+		om = threshold_map(algorithm, size, order) * float(threshold)
+		om = np.ascontiguousarray(om[:, :, np.newaxis], dtype=np.float32)
+		_offset_maps[key] = om
+	return om
+
+# |p - c|^2 = |p|^2 - 2 p.c + |c|^2, and |p|^2 is the same for every c
+PALETTE_DOT = -2 * PALETTE.T
+PALETTE_NORM = (PALETTE ** 2).sum(axis=1)
+
+"""
+index of the closest palette colour for every pixel of an (h, w, 3) array
+"""
+def nearest_index(rgb):
+	dist = rgb.dot(PALETTE_DOT) + PALETTE_NORM
+	return dist.argmin(axis=2).astype(np.uint8)
+
+"""
+Yliluoma's perceptual colour distance, broadcast over arrays of rgb in [0, 255]
+"""
+def color_compare(a, b):
+	luma_a = (a[..., 0] * 299 + a[..., 1] * 587 + a[..., 2] * 114) / (255.0 * 1000)
+	luma_b = (b[..., 0] * 299 + b[..., 1] * 587 + b[..., 2] * 114) / (255.0 * 1000)
+	lumadiff = luma_a - luma_b
+	diff = (a - b) / 255.0
+	return (diff[..., 0] ** 2 * 0.299 + diff[..., 1] ** 2 * 0.587 + diff[..., 2] ** 2 * 0.114) * 0.75 + lumadiff ** 2
+
+"""
+every two colour mix Yliluoma's algorithm 1 considers, with its fixed penalty
+"""
+def yliluoma_candidates(order):
+	limit = order * order
+	first = []
+	second = []
+	ratios = []
+	for i in range(len(PALETTE)):
+		for j in range(i, len(PALETTE)):
+			for ratio in range(limit):
+				if i == j and ratio != 0:
+					break
+				first.append(i)
+				second.append(j)
+				ratios.append(ratio)
+	first = np.array(first)
+	second = np.array(second)
+	ratios = np.array(ratios, dtype=np.float32)
+	c1 = PALETTE[first]
+	c2 = PALETTE[second]
+	mixes = c1 + (c2 - c1) * (ratios / limit)[:, np.newaxis]
+	spread = color_compare(c1, c2) * 0.1 * (np.abs(ratios / limit - 0.5) + 0.5)
+	return first, second, ratios, mixes, spread
+
+"""
+mixing plan table for Yliluoma's algorithm 1
+ one entry per quantized rgb colour: first index, second index and ratio
+ built once per order, in chunks so it never needs much memory
+"""
+def yliluoma_lut(order=DEFAULT_ORDER):
+	lut = _yliluoma_luts.get(order)
+	if lut is not None:
+		return lut
+
+	bits = YLILUOMA_LUT_BITS
+	levels = 1 << bits
+	step = 256 // levels
+	first, second, ratios, mixes, spread = yliluoma_candidates(order)
+
+	values = np.arange(levels, dtype=np.float32) * step + (step - 1) / 2.0
+	r, g, b = np.meshgrid(values, values, values, indexing='ij')
+	colors = np.stack([r.ravel(), g.ravel(), b.ravel()], axis=1)
+
+	best = np.empty(len(colors), dtype=np.intp)
+	for start in range(0, len(colors), YLILUOMA_LUT_CHUNK):
+		chunk = colors[start:start + YLILUOMA_LUT_CHUNK]
+		penalty = color_compare(chunk[:, np.newaxis, :], mixes[np.newaxis, :, :]) + spread
+		best[start:start + YLILUOMA_LUT_CHUNK] = penalty.argmin(axis=1)
+
+	limit = float(order * order)
+	lut = (
+		first[best].astype(np.uint8),
+		second[best].astype(np.uint8),
+		(ratios[best] / limit).astype(np.float32)
+	)
+	_yliluoma_luts[order] = lut
+	logger.debug('built yliluoma mixing plan table for order {}'.format(order))
+	return lut
+
+def yliluoma_indices(rgb, order=DEFAULT_ORDER):
+	first, second, ratio = yliluoma_lut(order)
+	shift = 8 - YLILUOMA_LUT_BITS
+	q = rgb >> shift
+	key = (q[:, :, 0].astype(np.intp) << (2 * YLILUOMA_LUT_BITS)) | (q[:, :, 1].astype(np.intp) << YLILUOMA_LUT_BITS) | q[:, :, 2]
+	h, w = key.shape
+	tm = threshold_map('yliluoma', (w, h), order)
+	return np.where(tm < ratio[key], second[key], first[key])
+
+def offset_indices(rgb, algorithm, threshold, order=DEFAULT_ORDER):
+	h, w = rgb.shape[:2]
+	return nearest_index(rgb.astype(np.float32) + offset_map(algorithm, threshold, (w, h), order))
+
+"""
+paletted image from an (h, w) array of palette indices
+"""
+def indexed_image(indices):
+	img = Image.fromarray(indices, 'P')
+	img.putpalette([int(v) for v in PALETTE.ravel()] + [0, 0, 0] * (256 - len(PALETTE)))
+	return img
+
+"""
+ordered dither an image to the Inky palette
+
+	:param img: source image, converted to rgb
+	:param algorithm: yliluoma, bayer or cluster
+	:param threshold: spread for bayer and cluster, yliluoma ignores it
+"""
+def ordered_dither(img, algorithm, threshold, order=DEFAULT_ORDER):
+	rgb = np.asarray(img.convert('RGB'), dtype=np.uint8)
+	if algorithm == 'yliluoma':
+		indices = yliluoma_indices(rgb, order)
+	else:
+		indices = offset_indices(rgb, algorithm, threshold, order)
+	return indexed_image(indices)
@@ -0,0 +1,139 @@
+import os
+import time
+import struct
+import hashlib
+import pzwglobals
+from lib.frames import pack_frame, unpack_frame
+from lib.fileutil import atomic_write
+from lib.metrics import get_metrics
+
+logger = pzwglobals.logger
+
+CACHE_DIRECTORY = pzwglobals.DATA_DIRECTORY + 'dither-cache/'
+
+# bump when dither output or the entry format changes so old entries are never served
+CACHE_VERSION = 2
+
+CACHE_MAX_AGE = 60 * 60 * 24
+CACHE_MAX_BYTES = 512 * 1024
+
+ENTRY_EXT = '.bin'
+
+"""
+DitherCache
+
+	dithered backgrounds stored on disk, keyed by a hash of the source pixels
+	and the dither settings, so an unchanged satellite crop is never dithered
+	twice, even across restarts. entries are evicted by age and total size
+"""
+class DitherCache():
+	def __init__(self, directory=CACHE_DIRECTORY, max_age=CACHE_MAX_AGE, max_bytes=CACHE_MAX_BYTES):
+		self.directory = directory
+		self.max_age = max_age
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+
+	def key(self, img, algorithm, threshold, order):
+		h = hashlib.sha1()
+		h.update("{}:{}:{}:{}:{}:{}".format(CACHE_VERSION, img.mode, img.size, algorithm, threshold, order).encode('ascii'))
+		h.update(img.tobytes())
+		return h.hexdigest()
+
+	def path(self, key):
+		return self.directory + key + ENTRY_EXT
+
+	"""
+	cached dithered image for key, or None
+	"""
+	def get(self, key):
+		path = self.path(key)
+		try:
+			with open(path, 'rb') as f:
+				img = unpack_frame(f.read())
+		except (OSError, ValueError, struct.error):
+			return None
+		try:
+			os.utime(path, None)
+		except OSError:
+			pass
+		return img
+
+	"""
+	store a paletted image under key, packed like lib.warmstart's frames and written atomically
+	"""
+	def put(self, key, img):
+		data = pack_frame(img)
+		if data is None:
+			return
+		try:
+			os.makedirs(self.directory, exist_ok=True)
+			atomic_write(self.path(key), data)
+		except OSError:
+			logger.warning("couldn't write dither cache entry " + key)
+			return
+		self.evict()
+
+	"""
+	drop entries older than max_age, then the oldest ones until we fit in max_bytes
+	"""
+	def evict(self):
+		try:
+			names = [n for n in os.listdir(self.directory) if n.endswith(ENTRY_EXT)]
+		except OSError:
+			return
+		now = time.time()
+		entries = []
+		for name in names:
+			path = self.directory + name
+			try:
+				st = os.stat(path)
+			except OSError:
+				continue
+			if now - st.st_mtime > self.max_age:
+				self.remove(path)
+			else:
+				entries.append((st.st_mtime, st.st_size, path))
+
+		entries.sort()
+		total = sum(e[1] for e in entries)
+		while entries and total > self.max_bytes:
+			mtime, size, path = entries.pop(0)
+			self.remove(path)
+			total = total - size
+
+	def remove(self, path):
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+
+	"""
+	dither img through dither_fn unless we already have the result
+	"""
+	def dither(self, img, algorithm, threshold, order, dither_fn):
+		key = self.key(img, algorithm, threshold, order)
+		cached = self.get(key)
+		if cached is not None:
+			self.hits = self.hits + 1
+			get_metrics().incr('dither_cache.hit')
+			logger.info('dither cache hit ({} hits, {} misses)'.format(self.hits, self.misses))
+			return cached
+		self.misses = self.misses + 1
+		get_metrics().incr('dither_cache.miss')
+		logger.info('dither cache miss ({} hits, {} misses)'.format(self.hits, self.misses))
+		with get_metrics().span('dither.' + algorithm):
+			result = dither_fn(img)
+		self.put(key, result)
+		return result
+
+	def stats(self):
+		return {'hits': self.hits, 'misses': self.misses}
+
+_shared_cache = None
+
+def get_dither_cache():
+	global _shared_cache
+	if _shared_cache is None:
+		_shared_cache = DitherCache()
+	return _shared_cache
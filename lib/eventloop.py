@@ -0,0 +1,106 @@
+import time
+import heapq
+import math
+import queue
+import itertools
+import pzwglobals
+
+logger = pzwglobals.logger
+
+# a minute tick lands this long after the minute turns, so the clock has moved on
+MINUTE_MARGIN = 0.05
+
+"""
+seconds until just after the wall clock's next minute
+"""
+def seconds_to_next_minute(now=None):
+	if now is None:
+		now = time.time()
+	return math.floor(now / 60.0 + 1) * 60 - now + MINUTE_MARGIN
+
+"""
+EventLoop
+
+	blocking event loop for the ui thread
+	gpio callbacks, the keyboard thread and the refresher post named events
+	from their own threads, run() sleeps in a queue wait until one arrives
+	or the next timer is due, so an idle display never wakes up
+"""
+class EventLoop():
+	def __init__(self):
+		self.events = queue.Queue()
+		self.handlers = {}
+		self.timers = []
+		self.timer_ids = itertools.count()
+		self.running = False
+		self.wakeups = 0
+
+	"""
+	handle every event called name with fn(data)
+	"""
+	def on(self, name, fn):
+		self.handlers[name] = fn
+
+	"""
+	queue an event, safe to call from any thread
+	"""
+	def post(self, name, data=None):
+		self.events.put((name, data))
+
+	"""
+	post an event after delay seconds, only call from the loop thread
+	"""
+	def call_later(self, delay, name, data=None):
+		heapq.heappush(self.timers, (time.monotonic() + delay, next(self.timer_ids), name, data))
+
+	"""
+	post an event at the start of every minute, only call from the loop thread
+	 for anything that follows the clock shown on screen
+	"""
+	def every_minute(self, name, data=None):
+		def tick(tick_data):
+			self.call_later(seconds_to_next_minute(), name + '.tick')
+			self.dispatch(name, data)
+		self.on(name + '.tick', tick)
+		self.call_later(seconds_to_next_minute(), name + '.tick')
+
+	def stop(self):
+		self.post(None)
+
+	"""
+	seconds until the next timer, or None to wait forever
+	"""
+	def next_timeout(self):
+		if not self.timers:
+			return None
+		return max(self.timers[0][0] - time.monotonic(), 0)
+
+	def dispatch(self, name, data):
+		fn = self.handlers.get(name)
+		if fn is None:
+			logger.warning('EventLoop::dispatch no handler for ' + str(name))
+			return
+		fn(data)
+
+	def run(self):
+		self.running = True
+		while self.running:
+			try:
+				name, data = self.events.get(timeout=self.next_timeout())
+			except queue.Empty:
+				name = None
+				data = None
+			else:
+				if name is None:
+					self.running = False
+					break
+
+			self.wakeups = self.wakeups + 1
+
+			if name is not None:
+				self.dispatch(name, data)
+
+			now = time.monotonic()
+			while self.timers and self.timers[0][0] <= now:
+				due, timer_id, timer_name, timer_data = heapq.heappop(self.timers)
+				self.dispatch(timer_name, timer_data)
@@ -0,0 +1,13 @@
+import os
+
+# nothing from lib here, so every module can write files through it
+
+"""
+write bytes through a temp file and rename, so readers never see half a file
+ and a power cut never leaves one
+"""
+def atomic_write(path, data):
+	tmp_path = path + '.tmp'
+	with open(tmp_path, 'wb') as f:
+		f.write(data)
+	os.replace(tmp_path, path)
@@ -0,0 +1,204 @@
+import os
+import mmap
+import zlib
+import struct
+import calendar
+import threading
+from datetime import datetime, timedelta
+import pzwglobals
+from lib.frames import FRAME_COLORS, packable, pack_pixels, unpack_pixels
+
+logger = pzwglobals.logger
+
+HISTORY_FILE = pzwglobals.DATA_DIRECTORY + 'bg-history.ring'
+
+# bump when the file layout changes, an old file is started over
+HISTORY_VERSION = 1
+
+# a day of satellite images at their five minute cadence, about 1.6 MB
+HISTORY_SLOTS = 288
+HISTORY_RESOLUTION = 300
+
+HISTORY_MAGIC = b'PZFH'
+
+# magic, version, width, height, slots, resolution in seconds, latest capture
+HISTORY_HEADER = '<4sHHHIIq'
+
+# capture time in utc seconds (0 for an empty slot), crc32 of the rest of the slot
+SLOT_HEADER = '<qI'
+
+# frames are 4 color palette images, the palette is kept with each one
+PALETTE_BYTES = FRAME_COLORS * 3
+
+def to_seconds(t):
+	return calendar.timegm(t.utctimetuple())
+
+def from_seconds(s):
+	return datetime(1970, 1, 1) + timedelta(seconds=s)
+
+"""
+FrameHistory
+
+	the last HISTORY_SLOTS dithered backgrounds in a fixed size file in
+	DATA_DIRECTORY, memory mapped, packed at 2 bits per pixel by
+	lib.frames. a frame's slot follows from its capture time,
+	one slot per HISTORY_RESOLUTION seconds going round the file, so
+	storing and finding a frame are a single slot's work, nothing is
+	indexed, and a restart picks up the file as it was. a slot whose
+	crc doesn't match, say from a power cut mid write, reads as empty
+	times are naive utc datetimes, like the satellite image names'
+"""
+class FrameHistory():
+	def __init__(self, path=HISTORY_FILE, size=(pzwglobals.DISPLAY_WIDTH, pzwglobals.DISPLAY_HEIGHT), slots=HISTORY_SLOTS, resolution=HISTORY_RESOLUTION):
+		self.path = path
+		self.size = size
+		self.slots = slots
+		self.resolution = resolution
+		self.pixel_bytes = (size[0] + 3) // 4 * size[1]
+		self.slot_bytes = struct.calcsize(SLOT_HEADER) + PALETTE_BYTES + self.pixel_bytes
+		self.file_bytes = struct.calcsize(HISTORY_HEADER) + slots * self.slot_bytes
+		self.mm = None
+
+	def header(self, latest):
+		return struct.pack(HISTORY_HEADER, HISTORY_MAGIC, HISTORY_VERSION, self.size[0], self.size[1], self.slots, self.resolution, latest)
+
+	"""
+	map the file, starting it over when it's missing or laid out differently
+	 False when it can't be had, then there's just no history
+	"""
+	def open(self):
+		if self.mm is not None:
+			return True
+		try:
+			os.makedirs(os.path.dirname(self.path), exist_ok=True)
+			fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+			try:
+				head = os.pread(fd, struct.calcsize(HISTORY_HEADER), 0)
+				if len(head) < struct.calcsize(HISTORY_HEADER) or head[:-8] != self.header(0)[:-8] or os.fstat(fd).st_size != self.file_bytes:
+					if head:
+						logger.info('frame history layout changed, starting over')
+					os.ftruncate(fd, 0)
+					os.ftruncate(fd, self.file_bytes)
+					os.pwrite(fd, self.header(0), 0)
+				self.mm = mmap.mmap(fd, self.file_bytes)
+			finally:
+				os.close(fd)
+		except (OSError, ValueError):
+			logger.warning("couldn't open frame history " + self.path)
+			self.mm = None
+			return False
+		return True
+
+	def close(self):
+		if self.mm is not None:
+			self.mm.close()
+			self.mm = None
+
+	def offset(self, seconds):
+		return struct.calcsize(HISTORY_HEADER) + (seconds // self.resolution) % self.slots * self.slot_bytes
+
+	def slot_time(self, seconds):
+		return struct.unpack_from(SLOT_HEADER, self.mm, self.offset(seconds))[0]
+
+	def latest_seconds(self):
+		return struct.unpack_from(HISTORY_HEADER, self.mm)[-1]
+
+	"""
+	store a paletted background captured at t, overwriting the one a full lap older
+	 returns False for frames that don't fit, and for a t older than what's in its slot.
+	 a t already in its slot is left alone, that frame is stored and synced
+	"""
+	def append(self, img, t):
+		if not packable(img) or img.size != self.size:
+			logger.debug('frame history only keeps {}x{} 4 color frames'.format(*self.size))
+			return False
+		if not self.open():
+			return False
+		seconds = to_seconds(t)
+		stored = self.slot_time(seconds)
+		if stored > seconds:
+			return False
+		if stored == seconds:
+			return True
+		palette = bytes((img.getpalette() or [])[:PALETTE_BYTES]).ljust(PALETTE_BYTES, b'\0')
+		body = palette + pack_pixels(img)
+		offset = self.offset(seconds)
+		head_bytes = struct.calcsize(SLOT_HEADER)
+		self.mm[offset + head_bytes:offset + self.slot_bytes] = body
+		struct.pack_into(SLOT_HEADER, self.mm, offset, seconds, zlib.crc32(struct.pack('<q', seconds) + body))
+		if seconds > self.latest_seconds():
+			self.mm[:struct.calcsize(HISTORY_HEADER)] = self.header(seconds)
+		self.flush(offset, self.slot_bytes)
+		self.flush(0, struct.calcsize(HISTORY_HEADER))
+		return True
+
+	# msync just the pages a write touched
+	def flush(self, offset, length):
+		start = offset - offset % mmap.PAGESIZE
+		self.mm.flush(start, offset + length - start)
+
+	"""
+	the frame captured in t's slot, or None
+	"""
+	def get(self, t):
+		if not self.open():
+			return None
+		seconds = to_seconds(t)
+		return self.read(seconds // self.resolution)
+
+	def read(self, bucket):
+		offset = self.offset(bucket * self.resolution)
+		head_bytes = struct.calcsize(SLOT_HEADER)
+		seconds, crc = struct.unpack_from(SLOT_HEADER, self.mm, offset)
+		if seconds == 0 or seconds // self.resolution != bucket:
+			return None
+		body = self.mm[offset + head_bytes:offset + self.slot_bytes]
+		if zlib.crc32(struct.pack('<q', seconds) + body) != crc:
+			return None
+		return unpack_pixels(body[PALETTE_BYTES:], self.size, body[:PALETTE_BYTES])
+
+	"""
+	capture time and frame of the newest background, or None
+	"""
+	def latest(self):
+		if not self.open():
+			return None
+		seconds = self.latest_seconds()
+		if seconds == 0:
+			return None
+		img = self.read(seconds // self.resolution)
+		if img is None:
+			return None
+		return from_seconds(seconds), img
+
+	"""
+	(capture time, frame) for every frame stored in the span before the newest, oldest first
+	 for animating the last hour: history.recent(timedelta(hours=1))
+	"""
+	def recent(self, span):
+		if not self.open():
+			return []
+		latest = self.latest_seconds()
+		if latest == 0:
+			return []
+		newest = latest // self.resolution
+		oldest = max(newest - self.slots + 1, (latest - int(span.total_seconds())) // self.resolution)
+		frames = []
+		for bucket in range(oldest, newest + 1):
+			img = self.read(bucket)
+			if img is not None:
+				frames.append((from_seconds(self.slot_time(bucket * self.resolution)), img))
+		return frames
+
+_history = None
+_history_lock = threading.Lock()
+
+"""
+shared history, satellite images are fetched from more than one thread
+"""
+def get_frame_history():
+	global _history
+	with _history_lock:
+		if _history is None:
+			_history = FrameHistory()
+		return _history
@@ -0,0 +1,108 @@
+import struct
+import hashlib
+from PIL import Image
+import pzwglobals
+from lib.metrics import get_metrics
+
+logger = pzwglobals.logger
+
+# width, height, palette colors
+FRAME_HEADER = '<HHH'
+
+# frames are 4 color palette images, so pixels pack at 2 bits each
+FRAME_COLORS = 4
+
+"""
+hash of a composited frame
+ mode and size are included so a 1 bit confirm screen never matches a palette frame
+"""
+def frame_hash(img):
+	h = hashlib.sha1()
+	h.update("{}{}".format(img.mode, img.size).encode('ascii'))
+	h.update(img.tobytes())
+	return h.hexdigest()
+
+"""
+whether a frame fits in FRAME_COLORS colors, so it can be packed
+"""
+def packable(img):
+	return img.mode == 'P' and img.getextrema()[1] < FRAME_COLORS
+
+"""
+pixels of a 4 color paletted image at 2 bits per pixel, rows padded to a byte
+ PIL packs and unpacks P;2 itself, so reading frames back doesn't need numpy
+"""
+def pack_pixels(img):
+	return img.tobytes('raw', 'P;2')
+
+def unpack_pixels(data, size, palette):
+	img = Image.frombytes('P', size, data, 'raw', 'P;2')
+	img.putpalette(list(palette) + [0, 0, 0] * (256 - len(palette) // 3))
+	return img
+
+"""
+paletted image as header, palette and packed pixels
+ about 5.5 KB for a display frame
+ returns None for images that don't fit in 4 colors
+"""
+def pack_frame(img):
+	if not packable(img):
+		return None
+	palette = (img.getpalette() or [])[:FRAME_COLORS * 3]
+	colors = len(palette) // 3
+	return struct.pack(FRAME_HEADER, img.size[0], img.size[1], colors) + bytes(palette) + pack_pixels(img)
+
+def unpack_frame(data):
+	w, h, colors = struct.unpack_from(FRAME_HEADER, data)
+	offset = struct.calcsize(FRAME_HEADER)
+	palette = data[offset:offset + colors * 3]
+	return unpack_pixels(data[offset + colors * 3:], (w, h), palette)
+
+"""
+FrameGate
+
+	remember the last frame pushed to each output (the display or a png path)
+	and skip the push when the new frame is identical
+	pushes and skips are counted so we can see how many refreshes it saves
+"""
+class FrameGate():
+	def __init__(self):
+		self.last_hashes = {}
+		self.screen_hashes = {}
+		self.pushes = 0
+		self.skips = 0
+
+	"""
+	push img through push_fn unless target already shows it
+	 returns True if the frame was pushed
+	"""
+	def push(self, screen_name, target, img, push_fn):
+		h = frame_hash(img)
+		self.screen_hashes[screen_name] = h
+
+		if self.last_hashes.get(target) == h:
+			self.skips = self.skips + 1
+			get_metrics().incr('frames.skipped')
+			logger.debug('FrameGate::push skipped unchanged {} frame'.format(screen_name))
+			return False
+
+		with get_metrics().span('push.' + ('display' if target == 'display' else 'png')):
+			push_fn(img)
+		self.last_hashes[target] = h
+		self.pushes = self.pushes + 1
+		get_metrics().incr('frames.pushed')
+		return True
+
+	def stats(self):
+		return {'pushes': self.pushes, 'skips': self.skips}
+
+_shared_gate = None
+
+"""
+shared gate, all screens push to the same display
+"""
+def get_frame_gate():
+	global _shared_gate
+	if _shared_gate is None:
+		_shared_gate = FrameGate()
+	return _shared_gate
@@ -0,0 +1,135 @@
+from PIL import Image, ImageDraw
+import pzwglobals
+
+logger = pzwglobals.logger
+
+BORDER_OVER = 2
+
+# offsets of the eight white copies that make up the ersatz dropshadow
+BORDER_OFFSETS = [
+	(-1, -1), (0, -1), (1, -1),
+	(-1, 0), (1, 0),
+	(-1, 1), (0, 1), (1, 1)
+]
+
+"""
+Glyph
+
+	one pre-rendered bordered character
+	masks are cropped to their ink, offset is relative to the pen position
+"""
+class Glyph():
+	def __init__(self, border_mask, mask, offset, advance):
+		self.border_mask = border_mask
+		self.mask = mask
+		self.offset = offset
+		self.advance = advance
+
+"""
+GlyphAtlas
+
+	cache of bordered glyphs keyed by font, size and character
+	plus a memo of string measurements so draw.textsize isn't called per render
+"""
+class GlyphAtlas():
+	def __init__(self, over=BORDER_OVER):
+		self.over = over
+		self.glyphs = {}
+		self.sizes = {}
+		self.scratch = ImageDraw.Draw(Image.new('1', (1, 1)))
+
+	def font_key(self, font):
+		return (getattr(font, 'path', id(font)), getattr(font, 'size', None))
+
+	"""
+	measure a string the way draw.textsize does, memoized
+	"""
+	def textsize(self, string, font):
+		key = (self.font_key(font), string)
+		size = self.sizes.get(key)
+		if size is None:
+			size = self.scratch.textsize(string, font=font)
+			self.sizes[key] = size
+		return size
+
+	"""
+	get a Glyph for a character, rendering it on first use
+	"""
+	def glyph(self, c, font):
+		key = (self.font_key(font), c)
+		glyph = self.glyphs.get(key)
+		if glyph is None:
+			glyph = self.render_glyph(c, font)
+			self.glyphs[key] = glyph
+		return glyph
+
+	"""
+	render the black glyph and its white border into 1 bit masks
+	 the scratch canvas is padded so overhanging glyphs aren't clipped
+	"""
+	def render_glyph(self, c, font):
+		over = self.over
+		w, h = self.textsize(c, font)
+		pad = over + max(w, h)
+		size = (w + pad * 2, h + pad * 2)
+
+		border = Image.new('L', size, 0)
+		border_draw = ImageDraw.Draw(border)
+		border_draw.fontmode = '1'
+		for ox, oy in BORDER_OFFSETS:
+			border_draw.text((pad + ox * over, pad + oy * over), c, 255, font=font)
+
+		mask = Image.new('L', size, 0)
+		mask_draw = ImageDraw.Draw(mask)
+		mask_draw.fontmode = '1'
+		mask_draw.text((pad, pad), c, 255, font=font)
+
+		bbox = border.getbbox()
+		if bbox is None:
+			return Glyph(None, None, (0, 0), w)
+
+		border = border.crop(bbox).convert('1')
+		mask = mask.crop(bbox).convert('1')
+
+		return Glyph(border, mask, (bbox[0] - pad, bbox[1] - pad), w)
+
+	"""
+	render a string onto an image with a white border
+
+		all the white borders go down first, then the black glyphs,
+		so a neighbour's border never covers a character
+
+		:param img: image to paste onto
+		:param string: text to render
+		:param xy: tuple with top and right or left corner
+		:param align: optional align left or right
+	"""
+	def text_with_border(self, img, string, xy, font, fill=1, border_fill=0, align="left"):
+		x, y = xy
+		if align == "right":
+			w, h = self.textsize(string, font)
+			x = x - w
+
+		placed = []
+		cx = x
+		for c in string:
+			glyph = self.glyph(c, font)
+			if glyph.mask is not None:
+				placed.append((glyph, (cx + glyph.offset[0], y + glyph.offset[1])))
+			cx = cx + glyph.advance
+
+		for glyph, pos in placed:
+			img.paste(border_fill, pos, glyph.border_mask)
+		for glyph, pos in placed:
+			img.paste(fill, pos, glyph.mask)
+
+_shared_atlas = None
+
+"""
+shared atlas instance so all screens reuse the same glyphs
+"""
+def get_glyph_atlas():
+	global _shared_atlas
+	if _shared_atlas is None:
+		_shared_atlas = GlyphAtlas()
+	return _shared_atlas
@@ -0,0 +1,358 @@
+import time
+import socket
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+import pzwglobals
+from lib.breaker import CircuitBreaker, CircuitOpenError
+from lib.metrics import get_metrics
+
+logger = pzwglobals.logger
+
+HTTP_TIMEOUT = 30
+HTTP_RETRIES = 2
+HTTP_BACKOFF = 0.5
+HTTP_POOL_SIZE = 4
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+USER_AGENT = 'pizero-weather'
+
+# errors that mean the upstream let us down, rather than our handling of its data
+UPSTREAM_ERRORS = (requests.RequestException, HTTPError, OSError)
+
+"""
+bytes that came over the wire for a response, before decompression
+"""
+def wire_bytes(res):
+	try:
+		return res.raw.tell()
+	except Exception:
+		return len(res.content or b'')
+
+"""
+Deadline
+
+	a request's hard deadline, headers and body included. a timer started
+	before anything is sent shuts down the socket the request is on when
+	it fires, which wakes a thread blocked reading it. the client's
+	connections attach their socket to their thread's deadline as they
+	connect or send, redirects and retries included. the socket is kept
+	here because http.client lets go of it once a response says it closes
+"""
+class Deadline():
+	def __init__(self, seconds, url):
+		self.seconds = seconds
+		self.url = url
+		self.expires = time.monotonic() + seconds
+		self.expired = False
+		self.sock = None
+		self.lock = threading.Lock()
+		self.timer = threading.Timer(seconds, self.expire)
+		self.timer.daemon = True
+		self.timer.start()
+
+	def remaining(self):
+		return self.expires - time.monotonic()
+
+	def attach(self, sock):
+		if sock is None:
+			return
+		with self.lock:
+			self.sock = sock
+			expired = self.expired
+		if expired:
+			self.cut(sock)
+
+	def expire(self):
+		with self.lock:
+			self.expired = True
+			sock = self.sock
+		logger.warning('http deadline passed for ' + self.url)
+		if sock is not None:
+			self.cut(sock)
+
+	def cut(self, sock):
+		try:
+			sock.shutdown(socket.SHUT_RDWR)
+		except OSError:
+			pass
+
+	def cancel(self):
+		self.timer.cancel()
+
+	def error(self):
+		return requests.Timeout('deadline of {}s passed for {}'.format(self.seconds, self.url))
+
+# the deadline of the request each thread is sending
+_sending = threading.local()
+
+class DeadlineConnectionMixin():
+	def connect(self):
+		super().connect()
+		deadline = getattr(_sending, 'deadline', None)
+		if deadline is not None:
+			deadline.attach(self.sock)
+
+	def request(self, *args, **kwargs):
+		deadline = getattr(_sending, 'deadline', None)
+		if deadline is not None:
+			deadline.attach(self.sock)
+		return super().request(*args, **kwargs)
+
+class DeadlineHTTPConnection(DeadlineConnectionMixin, HTTPConnection):
+	pass
+
+class DeadlineHTTPSConnection(DeadlineConnectionMixin, HTTPSConnection):
+	pass
+
+class DeadlineHTTPConnectionPool(HTTPConnectionPool):
+	ConnectionCls = DeadlineHTTPConnection
+
+class DeadlineHTTPSConnectionPool(HTTPSConnectionPool):
+	ConnectionCls = DeadlineHTTPSConnection
+
+"""
+HTTPAdapter whose pools make connections a Deadline can cut
+"""
+class DeadlineAdapter(HTTPAdapter):
+	def init_poolmanager(self, *args, **kwargs):
+		super().init_poolmanager(*args, **kwargs)
+		self.poolmanager.pool_classes_by_scheme = {
+			'http': DeadlineHTTPConnectionPool,
+			'https': DeadlineHTTPSConnectionPool
+		}
+
+"""
+HttpClient
+
+	one pooled session for every upstream fetch
+	connections are kept alive per host, so the NESDIS listing and the
+	image it points to share a TLS connection. responses are gzip
+	negotiated, idempotent requests get a few retries with backoff,
+	and bytes and latency are tallied per host.
+	every source has a circuit breaker, and a request can carry a hard
+	deadline: attempts and backoff are fitted into it, and a Deadline
+	cuts the connection if headers or body are still arriving when it
+	runs out
+"""
+class HttpClient():
+	def __init__(self, timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, pool_size=HTTP_POOL_SIZE):
+		self.timeout = timeout
+		self.retries = retries
+		self.backoff = backoff
+		self.session = requests.Session()
+		self.session.headers.update({
+			'Accept-Encoding': 'gzip, deflate',
+			'User-Agent': USER_AGENT
+		})
+		# retries are ours, so they can be fitted into a deadline
+		adapter = DeadlineAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+		self.session.mount('http://', adapter)
+		self.session.mount('https://', adapter)
+		self.lock = threading.Lock()
+		self.hosts = {}
+		self.breakers = {}
+
+	"""
+	the breaker for a source, made on first use
+	"""
+	def breaker(self, source):
+		with self.lock:
+			breaker = self.breakers.get(source)
+			if breaker is None:
+				breaker = CircuitBreaker(source)
+				self.breakers[source] = breaker
+			return breaker
+
+	"""
+	send a request through the pool
+
+		:param source: breaker name, defaults to the url's host
+		:param deadline: seconds the whole request, retries and body included, may take
+	 raises CircuitOpenError without sending anything if the source's breaker is open,
+	 requests.Timeout once the deadline has passed
+	 non streamed responses are accounted here, streamed ones when stream() closes them
+	"""
+	def request(self, method, url, stream=False, source=None, deadline=None, **kwargs):
+		breaker = self.breaker(source or urlsplit(url).netloc)
+		try:
+			breaker.allow()
+		except CircuitOpenError:
+			get_metrics().incr('http.{}.rejected'.format(breaker.name))
+			raise
+
+		start = time.monotonic()
+		watch = Deadline(deadline, url) if deadline is not None else None
+		try:
+			res = self.send(method, url, watch, kwargs)
+		except Exception as e:
+			self.finish(method, url, breaker, start, None, 0, watch)
+			if watch is not None and watch.expired:
+				raise watch.error() from e
+			raise
+		if watch is not None and watch.expired:
+			# cut off mid headers can still parse as a response
+			res.close()
+			self.finish(method, url, breaker, start, None, 0, watch)
+			raise watch.error()
+
+		res.breaker = breaker
+		res.started = start
+		res.deadline = watch
+
+		if stream:
+			return res
+
+		try:
+			res.content
+		except Exception as e:
+			self.finish(method, url, breaker, start, None, wire_bytes(res), watch)
+			if watch is not None and watch.expired:
+				raise watch.error() from e
+			raise
+		self.finish(method, url, breaker, start, res.status_code, wire_bytes(res), watch)
+		if watch is not None and watch.expired:
+			raise watch.error()
+		return res
+
+	"""
+	send until there's a response worth keeping, retrying GET and HEAD
+	 on connection errors and RETRY_STATUSES with exponential backoff.
+	 under a deadline each attempt's socket timeout is a share of the time
+	 left, backoff never takes more than half of it, and once it's gone
+	 there are no more attempts
+	"""
+	def send(self, method, url, watch, kwargs):
+		retries = self.retries if method in IDEMPOTENT_METHODS else 0
+		timeout = kwargs.pop('timeout', self.timeout)
+		attempt = 0
+		while True:
+			attempt_timeout = timeout
+			if watch is not None:
+				remaining = watch.remaining()
+				if remaining <= 0:
+					raise watch.error()
+				attempt_timeout = min(timeout, remaining / (retries - attempt + 1.0))
+			_sending.deadline = watch
+			try:
+				res = self.session.request(method, url, stream=True, timeout=attempt_timeout, **kwargs)
+			except (requests.ConnectionError, requests.Timeout):
+				if attempt >= retries or not self.wait(attempt, watch):
+					raise
+				attempt = attempt + 1
+				continue
+			finally:
+				_sending.deadline = None
+			if res.status_code in RETRY_STATUSES and attempt < retries and self.wait(attempt, watch, res):
+				attempt = attempt + 1
+				continue
+			return res
+
+	"""
+	back off before another attempt, False when there's no time for one
+	"""
+	def wait(self, attempt, watch, res=None):
+		delay = self.backoff * (2 ** attempt)
+		if watch is not None:
+			remaining = watch.remaining()
+			if watch.expired or remaining <= 0:
+				return False
+			delay = min(delay, remaining / 2.0)
+		if res is not None:
+			res.close()
+		if delay > 0:
+			time.sleep(delay)
+		return True
+
+	def get(self, url, **kwargs):
+		return self.request('GET', url, **kwargs)
+
+	def head(self, url, **kwargs):
+		return self.request('HEAD', url, **kwargs)
+
+	"""
+	streamed GET as a context manager
+	 the body is read by the caller, bytes and latency are recorded on exit
+	 an error reading the body counts against the source's breaker,
+	 an error in the caller's own handling of it doesn't
+	"""
+	@contextmanager
+	def stream(self, url, **kwargs):
+		res = self.request('GET', url, stream=True, **kwargs)
+		status = res.status_code
+		try:
+			yield res
+			# a body cut off without a length to check against just ends early
+			if res.deadline is not None and res.deadline.expired:
+				status = None
+				raise res.deadline.error()
+		except UPSTREAM_ERRORS as e:
+			status = None
+			if res.deadline is not None and res.deadline.expired:
+				raise res.deadline.error() from e
+			raise
+		finally:
+			nbytes = wire_bytes(res)
+			res.close()
+			self.finish('GET', url, res.breaker, res.started, status, nbytes, res.deadline)
+
+	def finish(self, method, url, breaker, start, status, nbytes, watch=None):
+		seconds = time.monotonic() - start
+		if watch is not None:
+			watch.cancel()
+			if watch.expired:
+				status = None
+		if status is None or status >= 500 or status == 429:
+			breaker.failure(seconds)
+		else:
+			breaker.success(seconds)
+		self.record(method, url, status, nbytes, seconds)
+		metrics = get_metrics()
+		metrics.observe('http.' + breaker.name, seconds * 1000)
+		metrics.incr('http.bytes', nbytes)
+		metrics.incr('http.{}.bytes'.format(breaker.name), nbytes)
+
+	def record(self, method, url, status, nbytes, seconds):
+		host = urlsplit(url).netloc
+		with self.lock:
+			stats = self.hosts.setdefault(host, {'requests': 0, 'failures': 0, 'bytes': 0, 'seconds': 0.0})
+			stats['requests'] = stats['requests'] + 1
+			if status is None or status >= 400:
+				stats['failures'] = stats['failures'] + 1
+			stats['bytes'] = stats['bytes'] + nbytes
+			stats['seconds'] = stats['seconds'] + seconds
+		logger.debug('http {} {} {} {} bytes in {:.3f}s'.format(method, url, status, nbytes, seconds))
+
+	"""
+	per host totals: requests, failures, bytes and seconds
+	"""
+	def stats(self):
+		with self.lock:
+			return {host: dict(stats) for host, stats in self.hosts.items()}
+
+	"""
+	per source breaker state, failures, rejected requests and tail latency
+	"""
+	def breaker_stats(self):
+		with self.lock:
+			breakers = list(self.breakers.values())
+		return {breaker.name: breaker.stats() for breaker in breakers}
+
+_client = None
+_client_lock = threading.Lock()
+
+"""
+shared client, so every fetcher draws on the same connection pool
+"""
+def get_http_client():
+	global _client
+	with _client_lock:
+		if _client is None:
+			_client = HttpClient()
+		return _client
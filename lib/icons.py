@@ -0,0 +1,104 @@
+import os
+from PIL import Image
+import pzwglobals
+
+logger = pzwglobals.logger
+
+ICON_DIRECTORY = pzwglobals.IMG_DIRECTORY + 'icons/'
+
+ICON_SIZE_SMALL = 50
+
+# inky palette indices, duplicated from screens to avoid a circular import
+MASK_COLORS = (0, 1, 2)
+
+"""
+Create a transparency mask.
+
+	Takes a paletized source image and converts it into a mask
+	permitting all the colours supported by Inky pHAT (0, 1, 2)
+	or an optional list of allowed colours.
+	Uses a 256 entry lookup table so the whole image is mapped in one pass.
+
+	:param mask: Optional list of Inky pHAT colours to allow.
+"""
+def create_mask(source, mask=MASK_COLORS):
+	lut = [255 if i in mask else 0 for i in range(256)]
+	return source.point(lut, '1')
+
+"""
+IconCache
+
+	load every icon in images/icons once
+	keep full size and small (thumbnail) variants plus their masks in memory
+	so screens only have to paste
+"""
+class IconCache():
+	def __init__(self, directory=ICON_DIRECTORY, small_size=ICON_SIZE_SMALL):
+		self.directory = directory
+		self.small_size = small_size
+		self.icons = {}
+		self.icons_small = {}
+
+		try:
+			filenames = sorted(os.listdir(directory))
+		except OSError:
+			logger.warning("couldn't list icon directory " + directory)
+			filenames = []
+
+		for filename in filenames:
+			name, ext = os.path.splitext(filename)
+			if ext != '.png':
+				continue
+			try:
+				self.load(name, directory + filename)
+			except Exception:
+				logger.warning("couldn't load icon " + filename)
+
+		logger.debug('IconCache loaded {} icons'.format(len(self.icons)))
+
+	"""
+	load one icon and build its masks
+	 the small variant is thumbnailed from the full size icon and mask
+	 exactly as ForecastDays used to do per render
+	"""
+	def load(self, name, path):
+		icon_img = Image.open(path)
+		icon_img.load()
+		mask = create_mask(icon_img)
+		self.icons[name] = (icon_img, mask)
+
+		icon_small = icon_img.copy()
+		mask_small = mask.copy()
+		icon_small.thumbnail((self.small_size, self.small_size))
+		mask_small.thumbnail((self.small_size, self.small_size))
+		self.icons_small[name] = (icon_small, mask_small)
+
+	"""
+	get an (image, mask) tuple for an icon name, or None if we don't have it
+	"""
+	def get(self, name, small=False):
+		if small:
+			return self.icons_small.get(name)
+		return self.icons.get(name)
+
+	"""
+	paste an icon onto an image, returns False if the icon is unknown
+	"""
+	def paste(self, img, name, xy, small=False):
+		sprite = self.get(name, small)
+		if sprite is None:
+			return False
+		icon_img, mask = sprite
+		img.paste(icon_img, xy, mask)
+		return True
+
+_shared_cache = None
+
+"""
+shared cache instance so all screens use the same sprites
+"""
+def get_icon_cache():
+	global _shared_cache
+	if _shared_cache is None:
+		_shared_cache = IconCache()
+	return _shared_cache
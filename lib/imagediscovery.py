@@ -0,0 +1,156 @@
+import re
+import time
+from datetime import datetime, timedelta
+import pzwglobals
+from lib.httpclient import get_http_client, wire_bytes, UPSTREAM_ERRORS
+from lib.breaker import CircuitOpenError
+from lib.metrics import get_metrics
+
+logger = pzwglobals.logger
+
+LISTING_CHUNK_SIZE = 16 * 1024
+
+# sector images are scanned every five minutes, and named for the scan's
+# start as YYYYDDDHHMM (day of year, utc): 20202811200_GOES16-ABI-ne-GEOCOLOR-1200x1200.jpg
+IMAGE_CADENCE = timedelta(minutes=5)
+IMAGE_TIME_FORMAT = '%Y%j%H%M'
+IMAGE_TIME_LENGTH = 11
+
+# how long after its scan starts an image shows up on the cdn
+PUBLISH_DELAY = timedelta(minutes=7)
+
+# most predicted names probed before falling back to the listing
+MAX_PROBES = 2
+
+"""
+scan time of a sector image from its name, None if it isn't a timestamped image
+"""
+def imageTime(name):
+	stamp = name[:IMAGE_TIME_LENGTH]
+	if len(stamp) != IMAGE_TIME_LENGTH or not stamp.isdigit():
+		return None
+	try:
+		return datetime.strptime(stamp, IMAGE_TIME_FORMAT)
+	except ValueError:
+		return None
+
+"""
+name of the image scanned at t, otherwise named like name
+"""
+def imageName(name, t):
+	return t.strftime(IMAGE_TIME_FORMAT) + name[IMAGE_TIME_LENGTH:]
+
+"""
+ListingScanner
+
+	streaming scan of a NESDIS directory listing for the last timestamped
+	image of one size. the listing is sorted by name, so oldest first, and
+	the last match is the latest image. feed it bytes as they download,
+	a match split across two chunks is caught by keeping the tail around
+"""
+class ListingScanner():
+	def __init__(self, size_name):
+		self.pattern = re.compile(rb'href="(\d{' + str(IMAGE_TIME_LENGTH).encode('ascii') + rb'}_[^"/]*-' + re.escape(size_name.encode('ascii')) + rb'\.jpg)"')
+		self.tail = b''
+		self.latest = None
+
+	def feed(self, chunk):
+		data = self.tail + chunk
+		end = 0
+		for match in self.pattern.finditer(data):
+			self.latest = match.group(1).decode('ascii')
+			end = match.end()
+		# keep what could be the start of an anchor cut off by the chunk boundary
+		cut = data.rfind(b'<', end)
+		self.tail = data[cut:] if cut >= 0 else b''
+
+	def scan(self, chunks):
+		for chunk in chunks:
+			self.feed(chunk)
+		return self.latest
+
+"""
+ImageDiscovery
+
+	finds the latest image of a sector and size without reading the listing
+	when it can: the next images' names follow from the last one and the
+	publishing cadence, so those are probed with HEAD, newest first.
+	the listing is scanned only for the first image and when a probe misses.
+	requests, bytes and scan time of each discovery go to the log and metrics
+"""
+class ImageDiscovery():
+	def __init__(self, listing_url, size_name, source='nesdis'):
+		self.listing_url = listing_url
+		self.size_name = size_name
+		self.source = source
+		self.method = None
+		self.requests = 0
+		self.bytes = 0
+		self.scan_ms = 0.0
+		self.headers = {}
+
+	"""
+	names the next images would have, newest first, that should be out by now
+	"""
+	def predictions(self, last_name, now=None):
+		last_time = imageTime(last_name)
+		if last_time is None:
+			return None
+		if now is None:
+			now = datetime.utcnow()
+		due = (now - PUBLISH_DELAY - last_time) // IMAGE_CADENCE
+		return [imageName(last_name, last_time + IMAGE_CADENCE * n) for n in range(due, max(due - MAX_PROBES, 0), -1)]
+
+	"""
+	url of the newest image after last_url, from predicted names
+	 returns last_url when no newer image is due yet, None when a probe missed
+	 or failed, so the caller goes by the listing instead
+	"""
+	def predict(self, last_url):
+		if last_url is None or not last_url.startswith(self.listing_url):
+			return None
+		names = self.predictions(last_url[len(self.listing_url):])
+		if names is None:
+			return None
+		if not names:
+			self.method = 'not-due'
+			return last_url
+		client = get_http_client()
+		for name in names:
+			try:
+				res = client.head(self.listing_url + name, source=self.source, deadline=pzwglobals.FETCH_DEADLINES[self.source])
+			except UPSTREAM_ERRORS + (CircuitOpenError,):
+				logger.debug('probe for {} failed, reading the listing'.format(name))
+				return None
+			self.requests = self.requests + 1
+			if res.status_code == 200:
+				self.method = 'predicted'
+				return self.listing_url + name
+		return None
+
+	"""
+	stream the listing and scan it for the latest image
+	 returns (status, url), url is None unless status is 200
+	"""
+	def scanListing(self, headers=None):
+		self.method = 'listing'
+		self.requests = self.requests + 1
+		scanner = ListingScanner(self.size_name)
+		with get_http_client().stream(self.listing_url, headers=headers or {}, source=self.source, deadline=pzwglobals.FETCH_DEADLINES[self.source]) as res:
+			if res.status_code == 200:
+				start = time.perf_counter()
+				with get_metrics().span('satellite.listing_parse'):
+					scanner.scan(res.iter_content(chunk_size=LISTING_CHUNK_SIZE))
+				self.scan_ms = (time.perf_counter() - start) * 1000
+			self.bytes = self.bytes + wire_bytes(res)
+			self.headers = res.headers
+			status = res.status_code
+		if status == 200 and scanner.latest is None:
+			logger.warning('Error: no image urls found')
+		return status, (self.listing_url + scanner.latest if scanner.latest else None)
+
+	def report(self):
+		get_metrics().incr('discovery.' + self.method)
+		get_metrics().incr('discovery.requests', self.requests)
+		get_metrics().incr('discovery.bytes', self.bytes)
+		logger.info('image discovery {}: {} requests, {} bytes, scan {:.1f} ms'.format(self.method, self.requests, self.bytes, self.scan_ms))
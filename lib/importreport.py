@@ -0,0 +1,66 @@
+import os
+import sys
+import subprocess
+import pzwglobals
+
+IMPORT_REPORT_TOP = 20
+
+ROOT_DIRECTORY = os.path.dirname(os.path.abspath(pzwglobals.__file__))
+
+"""
+import module in a fresh interpreter with -X importtime
+ returns a list of (name, depth, self_us, cumulative_us) for module and everything
+ it imported, interpreter startup (site and friends) is left out
+"""
+def import_times(module='pzweather'):
+	result = subprocess.run(
+		[sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+		cwd=ROOT_DIRECTORY,
+		stdout=subprocess.DEVNULL,
+		stderr=subprocess.PIPE,
+		universal_newlines=True
+	)
+	times = []
+	for line in result.stderr.splitlines():
+		if not line.startswith('import time:'):
+			continue
+		fields = line[len('import time:'):].split('|')
+		if len(fields) != 3 or not fields[0].strip().isdigit():
+			continue
+		name = fields[2].rstrip()
+		depth = (len(name) - len(name.lstrip()) - 1) // 2 + 1
+		times.append((name.strip(), depth, int(fields[0]), int(fields[1])))
+
+	# -X importtime lists a module after everything it imported
+	for end in range(len(times) - 1, -1, -1):
+		if times[end][0] == module and times[end][1] == 1:
+			start = end
+			while start > 0 and times[start - 1][1] > 1:
+				start = start - 1
+			return times[start:end + 1]
+	return times
+
+"""
+printable report of what importing module costs
+ the most expensive imports by cumulative time, then self time summed per top level package
+"""
+def import_report(module='pzweather', top=IMPORT_REPORT_TOP):
+	times = import_times(module)
+	total = max([t[3] for t in times] or [0])
+
+	packages = {}
+	for name, depth, self_us, cumulative_us in times:
+		package = name.split('.')[0]
+		packages[package] = packages.get(package, 0) + self_us
+
+	lines = ['import {}: {:.1f} ms, {} modules'.format(module, total / 1000.0, len(times)), '']
+	lines.append('{:>10}{:>10}  {}'.format('self ms', 'cum ms', 'module'))
+	for name, depth, self_us, cumulative_us in sorted(times, key=lambda t: t[3], reverse=True)[:top]:
+		lines.append('{:>10.1f}{:>10.1f}  {}{}'.format(self_us / 1000.0, cumulative_us / 1000.0, '  ' * (depth - 1), name))
+
+	lines.append('')
+	lines.append('{:>10}  {}'.format('self ms', 'package'))
+	for package, self_us in sorted(packages.items(), key=lambda p: p[1], reverse=True)[:top]:
+		lines.append('{:>10.1f}  {}'.format(self_us / 1000.0, package))
+
+	return '\n'.join(lines)
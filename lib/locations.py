@@ -0,0 +1,67 @@
+import json
+import pzwglobals
+
+logger = pzwglobals.logger
+
+"""
+Location
+
+	a site we render frames for: where the forecasts are for
+	and where in the satellite image its background is cropped from
+	the crop is worked out from latitude and longitude, crop_left and
+	crop_top move it by hand within the sector image that's picked
+"""
+class Location():
+	def __init__(self, name, latitude, longitude, crop_left=None, crop_top=None):
+		self.name = name
+		self.latitude = str(latitude)
+		self.longitude = str(longitude)
+		self.crop_left = int(crop_left) if crop_left is not None else None
+		self.crop_top = int(crop_top) if crop_top is not None else None
+
+	def __repr__(self):
+		return 'Location({}, {}, {})'.format(self.name, self.latitude, self.longitude)
+
+	"""
+	lib.projection CropWindow for a width by height background, None if no sector covers us
+	"""
+	def window(self, width, height):
+		from lib.projection import cropWindow
+		window = cropWindow(self.latitude, self.longitude, width, height)
+		if window is None or (self.crop_left is None and self.crop_top is None):
+			return window
+		left = self.crop_left if self.crop_left is not None else window.left
+		top = self.crop_top if self.crop_top is not None else window.top
+		return window.movedTo(left, top)
+
+"""
+the location in pzwglobals, the one the display daemon shows
+"""
+def default_location():
+	return Location('default', pzwglobals.LATITUDE, pzwglobals.LONGITUDE)
+
+"""
+locations from a json file, a list of objects with name, latitude, longitude
+ and optionally crop_left and crop_top in sector image pixels
+ raises ValueError for duplicate names and for a file without any
+"""
+def load_locations(path):
+	with open(path) as f:
+		entries = json.load(f)
+	locations = []
+	names = set()
+	for entry in entries:
+		location = Location(
+			entry['name'],
+			entry['latitude'],
+			entry['longitude'],
+			entry.get('crop_left'),
+			entry.get('crop_top')
+		)
+		if location.name in names:
+			raise ValueError('duplicate location name ' + location.name)
+		names.add(location.name)
+		locations.append(location)
+	if not locations:
+		raise ValueError('no locations in ' + path)
+	return locations
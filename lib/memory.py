@@ -0,0 +1,194 @@
+import gc
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+import pzwglobals
+
+logger = pzwglobals.logger
+
+PROC_STATUS = '/proc/self/status'
+PROC_CLEAR_REFS = '/proc/self/clear_refs'
+
+# frames of stack kept per traced allocation, 1 is enough for per stage totals
+TRACE_FRAMES = 1
+
+"""
+resident and peak resident set size of this process in KB
+ peak is None where the kernel doesn't report it
+"""
+def rss_kb():
+	rss = peak = None
+	try:
+		with open(PROC_STATUS) as f:
+			for line in f:
+				if line.startswith('VmRSS:'):
+					rss = int(line.split()[1])
+				elif line.startswith('VmHWM:'):
+					peak = int(line.split()[1])
+	except (OSError, ValueError):
+		import resource
+		rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		if sys.platform == 'darwin':
+			rss = rss // 1024
+	return rss, peak
+
+"""
+reset the kernel's peak rss to the current rss, so the next peak is a stage's own
+ needs linux 4.0 or later, returns False where that isn't available
+"""
+def reset_peak_rss():
+	try:
+		with open(PROC_CLEAR_REFS, 'w') as f:
+			f.write('5')
+		return True
+	except OSError:
+		return False
+
+"""
+hand freed heap pages back to the os
+ glibc keeps freed memory in its arenas, so without this rss never drops
+ after a big decode. a no-op on other platforms
+"""
+def malloc_trim():
+	try:
+		import ctypes
+		ctypes.CDLL('libc.so.6').malloc_trim(0)
+	except (OSError, AttributeError):
+		pass
+
+"""
+MemoryBudget
+
+	memory settings for the daemon and a per stage profiler
+
+	low_memory: load sources one at a time and release each stage's
+	 intermediates (download buffers, parse trees, decoded rows) as soon
+	 as it finishes, rather than letting their peaks stack up
+	profile: record the peak traced (python and numpy) allocation and the
+	 peak rss of every metrics span. pillow's own buffers only show in rss.
+	 tracing costs cpu, so this is for diagnosing, not for running
+"""
+class MemoryBudget():
+	def __init__(self):
+		self.low_memory = False
+		self.profiling = False
+		self.lock = threading.Lock()
+		self.stack = []
+		self.stages = {}
+		self.peak_rss_resets = False
+
+	def configure(self, low_memory=False, profile=False):
+		self.low_memory = low_memory
+		if profile and not self.profiling:
+			tracemalloc.start(TRACE_FRAMES)
+			self.peak_rss_resets = reset_peak_rss()
+			self.profiling = True
+		logger.info('MemoryBudget::configure low memory: {} profiling: {}'.format(self.low_memory, self.profiling))
+
+	"""
+	collect cycles and trim the heap, between stages in low memory mode
+	 bs4 trees are full of reference cycles, so they wait for the collector
+	"""
+	def release(self):
+		if not self.low_memory:
+			return
+		gc.collect()
+		malloc_trim()
+
+	"""
+	record peak memory of the with block under name, when profiling
+	 stages nest, an outer stage's peak includes its inner stages'.
+	 the tracer is process wide, so stages running concurrently on other
+	 threads show up in each other's peaks. low memory mode runs them in turn
+	"""
+	@contextmanager
+	def stage(self, name):
+		if not self.profiling:
+			yield
+			return
+		with self.lock:
+			current, peak = tracemalloc.get_traced_memory()
+			if self.stack:
+				self.stack[-1]['peak'] = max(self.stack[-1]['peak'], peak)
+				self.stack[-1]['rss_peak'] = max(self.stack[-1]['rss_peak'], rss_kb()[1] or 0)
+			rss = rss_kb()[0]
+			frame = {'name': name, 'start': current, 'peak': current, 'rss_start': rss, 'rss_peak': rss or 0}
+			self.stack.append(frame)
+			tracemalloc.reset_peak()
+			if self.peak_rss_resets:
+				reset_peak_rss()
+		try:
+			yield
+		finally:
+			with self.lock:
+				current, peak = tracemalloc.get_traced_memory()
+				rss, rss_peak = rss_kb()
+				if frame in self.stack:
+					self.stack.remove(frame)
+				frame['peak'] = max(frame['peak'], peak)
+				frame['rss_peak'] = max(frame['rss_peak'], rss_peak or rss or 0)
+				if self.stack:
+					self.stack[-1]['peak'] = max(self.stack[-1]['peak'], frame['peak'])
+					self.stack[-1]['rss_peak'] = max(self.stack[-1]['rss_peak'], frame['rss_peak'])
+				self.record(name, frame, current, rss)
+
+	def record(self, name, frame, current, rss):
+		stage = self.stages.get(name)
+		if stage is None:
+			stage = {'count': 0, 'peak_kb': 0, 'rss_peak_kb': 0}
+			self.stages[name] = stage
+		stage['count'] = stage['count'] + 1
+		stage['last_peak_kb'] = (frame['peak'] - frame['start']) // 1024
+		stage['peak_kb'] = max(stage['peak_kb'], stage['last_peak_kb'])
+		stage['retained_kb'] = (current - frame['start']) // 1024
+		stage['last_rss_peak_kb'] = frame['rss_peak']
+		stage['rss_peak_kb'] = max(stage['rss_peak_kb'], frame['rss_peak'])
+		stage['rss_after_kb'] = rss
+
+	"""
+	per stage memory as a dict, None when not profiling
+	 peak_kb: most traced memory a stage allocated above what it started with
+	 retained_kb: traced memory still held when it last finished
+	 rss_peak_kb, rss_after_kb: whole process resident size during and after it
+	"""
+	def summary(self):
+		if not self.profiling:
+			return None
+		with self.lock:
+			current, peak = tracemalloc.get_traced_memory()
+			rss, rss_peak = rss_kb()
+			return {
+				'low_memory': self.low_memory,
+				'traced_kb': current // 1024,
+				'rss_kb': rss,
+				'rss_peak_kb': rss_peak if not self.peak_rss_resets else None,
+				'stages': {name: dict(stage) for name, stage in sorted(self.stages.items())}
+			}
+
+	"""
+	printable table of the summary, heaviest stages first
+	"""
+	def report(self):
+		summary = self.summary()
+		if summary is None:
+			return 'memory profiling is off'
+		lines = ['traced {} KB, rss {} KB'.format(summary['traced_kb'], summary['rss_kb'])]
+		lines.append('{:>10}{:>12}{:>12}{:>10}  {}'.format('peak KB', 'retained KB', 'rss peak KB', 'count', 'stage'))
+		for name, stage in sorted(summary['stages'].items(), key=lambda s: s[1]['peak_kb'], reverse=True):
+			lines.append('{:>10}{:>12}{:>12}{:>10}  {}'.format(stage['peak_kb'], stage['retained_kb'], stage['rss_peak_kb'], stage['count'], name))
+		return '\n'.join(lines)
+
+_memory = None
+_memory_lock = threading.Lock()
+
+"""
+shared memory budget, configured once from the command line in main()
+"""
+def get_memory_budget():
+	global _memory
+	if _memory is None:
+		with _memory_lock:
+			if _memory is None:
+				_memory = MemoryBudget()
+	return _memory
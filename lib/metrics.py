@@ -0,0 +1,168 @@
+import json
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+import pzwglobals
+from lib.fileutil import atomic_write
+from lib.memory import get_memory_budget
+
+logger = pzwglobals.logger
+
+METRICS_FILE = pzwglobals.DATA_DIRECTORY + 'metrics.json'
+
+# histogram bucket upper bounds in ms, anything slower lands in an overflow bucket
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+# histograms roll over six ten minute windows, so they cover the last hour
+WINDOW_SECONDS = 10 * 60
+WINDOWS = 6
+
+"""
+Window
+
+	bucket counts for one slice of time
+"""
+class Window():
+	__slots__ = ('start', 'counts', 'count', 'total', 'max')
+
+	def __init__(self, start, buckets):
+		self.start = start
+		self.counts = [0] * buckets
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+"""
+Histogram
+
+	fixed bucket histogram over a rolling set of time windows
+	recording is a bisect and a few additions, old windows simply drop off
+"""
+class Histogram():
+	def __init__(self, bounds=BUCKETS_MS, window=WINDOW_SECONDS, windows=WINDOWS):
+		self.bounds = bounds
+		self.window = window
+		self.windows = deque(maxlen=windows)
+
+	def observe(self, value, now):
+		if not self.windows or now - self.windows[-1].start >= self.window:
+			self.windows.append(Window(now, len(self.bounds) + 1))
+		w = self.windows[-1]
+		w.counts[bisect_left(self.bounds, value)] += 1
+		w.count += 1
+		w.total += value
+		if value > w.max:
+			w.max = value
+
+	"""
+	count, mean, max and bucket estimated percentiles over the live windows
+	"""
+	def summary(self, now):
+		live = [w for w in self.windows if now - w.start < self.window * self.windows.maxlen]
+		count = sum(w.count for w in live)
+		if not count:
+			return {'count': 0}
+		counts = [sum(c) for c in zip(*[w.counts for w in live])]
+		top = max(w.max for w in live)
+		return {
+			'count': count,
+			'mean': round(sum(w.total for w in live) / count, 3),
+			'p50': self.percentile(counts, count, 50, top),
+			'p95': self.percentile(counts, count, 95, top),
+			'p99': self.percentile(counts, count, 99, top),
+			'max': round(top, 3),
+			'buckets': dict(zip([str(b) for b in self.bounds] + ['inf'], counts))
+		}
+
+	"""
+	upper bound of the bucket holding the p-th percentile, capped at the largest value seen
+	"""
+	def percentile(self, counts, count, p, top):
+		rank = count * p / 100.0
+		seen = 0
+		for i, n in enumerate(counts):
+			seen = seen + n
+			if seen >= rank:
+				return round(min(self.bounds[i], top), 3) if i < len(self.bounds) else round(top, 3)
+		return round(top, 3)
+
+"""
+Metrics
+
+	timing spans and counters for the daemon's hot paths
+	spans feed rolling histograms (ms), counters are running totals.
+	everything is summarised into a json file in DATA_DIRECTORY by write()
+"""
+class Metrics():
+	def __init__(self, path=METRICS_FILE):
+		self.path = path
+		self.lock = threading.Lock()
+		self.histograms = {}
+		self.counters = {}
+		self.started = time.time()
+
+	"""
+	time the with block into the histogram called name
+	 also a memory stage, when memory profiling is on
+	"""
+	@contextmanager
+	def span(self, name):
+		start = time.perf_counter()
+		try:
+			with get_memory_budget().stage(name):
+				yield
+		finally:
+			self.observe(name, (time.perf_counter() - start) * 1000)
+
+	def observe(self, name, ms):
+		now = time.monotonic()
+		with self.lock:
+			histogram = self.histograms.get(name)
+			if histogram is None:
+				histogram = Histogram()
+				self.histograms[name] = histogram
+			histogram.observe(ms, now)
+
+	def incr(self, name, n=1):
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + n
+
+	def summary(self):
+		now = time.monotonic()
+		memory = get_memory_budget().summary()
+		with self.lock:
+			summary = {
+				'written_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+				'uptime': round(time.time() - self.started),
+				'counters': dict(self.counters),
+				'spans_ms': {name: h.summary(now) for name, h in sorted(self.histograms.items())}
+			}
+		if memory is not None:
+			summary['memory'] = memory
+		return summary
+
+	"""
+	write the summary to our metrics file, atomically
+	"""
+	def write(self):
+		data = json.dumps(self.summary(), indent=1, sort_keys=True)
+		try:
+			atomic_write(self.path, data.encode('utf-8'))
+		except OSError:
+			logger.warning("couldn't write metrics to " + self.path)
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+"""
+shared metrics, every module records into the same spans and counters
+"""
+def get_metrics():
+	global _metrics
+	if _metrics is None:
+		with _metrics_lock:
+			if _metrics is None:
+				_metrics = Metrics()
+	return _metrics
@@ -1,57 +1,55 @@
 from datetime import datetime, timedelta
-from urllib.request import urlopen
-from xml.dom import minidom
-import json
 import pzwglobals
+from lib.noaaxml import NoaaXmlParser
+from lib.ttlcache import get_cache, JsonStore
+from lib.httpclient import get_http_client
+from lib.metrics import get_metrics
 
 logger = pzwglobals.logger
 
 NOAA_ENDPOINT = "http://graphical.weather.gov/xml/SOAP_server/ndfdSOAPclientByDay.php"
 NOAA_FORMAT = "12+hourly"
 NOAA_NUM_DAYS = "4"
-NOAA_QUERY = "whichClient=NDFDgenByDay&lat=" + pzwglobals.LATITUDE + "&lon=" + pzwglobals.LONGITUDE + "&format=" + NOAA_FORMAT + "&numDays=" + NOAA_NUM_DAYS + "&Unit=e"
-NOAA_URL = NOAA_ENDPOINT + "?" + NOAA_QUERY
 
-LOG_DATE_FORMAT = '%Y%m%d%H%M%S'
+"""
+forecast url for a latitude and longitude, as strings
+"""
+def noaaUrl(latitude, longitude):
+	query = "whichClient=NDFDgenByDay&lat=" + latitude + "&lon=" + longitude + "&format=" + NOAA_FORMAT + "&numDays=" + NOAA_NUM_DAYS + "&Unit=e"
+	return NOAA_ENDPOINT + "?" + query
+
+NOAA_URL = noaaUrl(pzwglobals.LATITUDE, pzwglobals.LONGITUDE)
 
 """
 NoaaForecast
 
 	parse NOAA location based xml for min, max temps and forecast icon
 	store data on public prop forecast
+	for the location in pzwglobals, or a lib.locations Location
 """
 class NoaaForecast():
-	def __init__(self, debug=False):
-	
-		logger.debug('NOAA_URL: ' + NOAA_URL)
-		
-		try:
-			with open(pzwglobals.DATA_DIRECTORY + "noaa.json") as f:
-				noaa_log = json.load(f)
-		except:
-			logger.warning("couldn't open noaa log")
-			noaa_log = {}
-	
-		if noaa_log is not None and "last_load" in noaa_log:
-			last_load = datetime.strptime(noaa_log["last_load"], LOG_DATE_FORMAT)
-			now = datetime.now()
-			tdiff = now - last_load
-		
-			logger.debug("time difference: " + last_load.strftime(LOG_DATE_FORMAT) + " - " + now.strftime(LOG_DATE_FORMAT))
-			logger.debug(tdiff)
-		
-			if (tdiff < timedelta(minutes=45) or debug is True):
-				logger.info("using logged noaa data")
-				self.forecast = {
-					'date_names': noaa_log["date_names"],
-					'dates_abbr': noaa_log["dates_abbr"],
-					'temps': noaa_log["temps"],
-					'icons': noaa_log["icons"],
-					'summaries': noaa_log["summaries"],
-					'last_load': noaa_log["last_load"]
-				}
-				return None
+	def __init__(self, debug=False, location=None, revalidate=True):
+		
+		if location is None:
+			self.url = NOAA_URL
+			name = 'noaa'
+		else:
+			self.url = noaaUrl(location.latitude, location.longitude)
+			name = 'noaa-' + location.name
+		
+		logger.debug('NOAA_URL: ' + self.url)
 		
+		cache = get_cache(name, JsonStore(pzwglobals.DATA_DIRECTORY + name + ".json"), source='noaa')
+		
+		self.forecast = cache.get(self.loadForecast, ignore_ttl=debug is True, revalidate=revalidate)
+		
+		return None
+
+	"""
+	build a fresh forecast from the NOAA xml
+	 errors are left to the cache, which keeps the last good forecast
+	"""
+	def loadForecast(self):
 		today = datetime.today()
 		
 		forecast_dates = [
@@ -65,46 +63,33 @@ class NoaaForecast():
 		
 		logger.debug('noaa desired dates: {}'.format(self.dates))
 		
-		try:
-			xmldom = self.getNoaaXmlDom()
-			time_layouts = self.parseTimeLayouts(xmldom)
-			temps = self.parseTemps(xmldom, time_layouts)
-			icons = self.parseIcons(xmldom, time_layouts)
-			summaries = self.parseSummaries(xmldom, time_layouts)
-			
-		except:
-			logger.warning('error building forecast')
-			
-			if "last_load" in noaa_log:
-				self.forecast = {
-					'date_names': noaa_log["date_names"],
-					'dates_abbr': noaa_log["dates_abbr"],
-					'temps': noaa_log["temps"],
-					'icons': noaa_log["icons"],
-					'summaries': noaa_log["summaries"],
-					'last_load': noaa_log["last_load"]
-				}
-			return None
-
-		self.forecast = {
+		parsed = self.getNoaaXml()
+		
+		return {
 			'date_names': [fd.strftime("%A") for fd in forecast_dates],
 			'dates_abbr': [fd.strftime("%m/%d") for fd in forecast_dates],
-			'temps': temps,
-			'icons': icons,
-			'summaries': summaries,
-			'last_load': datetime.now().strftime(LOG_DATE_FORMAT)
+			'temps': parsed.temps(self.dates),
+			'icons': parsed.icons(self.dates),
+			'summaries': parsed.summaries(self.dates)
 		}
-		
-		with open(pzwglobals.DATA_DIRECTORY + "noaa.json", 'w') as f:
-			json.dump(self.forecast, f)
-		
-		return None
+
+	"""
+	load xml and parse it as it streams in
+	"""
+	def getNoaaXml(self):
+		with get_http_client().stream(self.url, source='noaa', deadline=pzwglobals.FETCH_DEADLINES['noaa']) as res:
+			res.raise_for_status()
+			res.raw.decode_content = True
+			with get_metrics().span('noaa.parse'):
+				return NoaaXmlParser().parse(res.raw)
 
 	"""
 	load xml and parse with minidom
+	 the parse* methods below work on this dom, kept as the reference parser
 	"""
 	def getNoaaXmlDom(self):
-		xml = urlopen(NOAA_URL).read()
+		xml = get_http_client().get(self.url, source='noaa', deadline=pzwglobals.FETCH_DEADLINES['noaa']).content
+		from xml.dom import minidom
 		dom = minidom.parseString(xml)
 		return dom
 
@@ -0,0 +1,144 @@
+from xml.etree.ElementTree import iterparse
+
+"""
+NoaaXmlParser
+
+	single pass streaming parser for NOAA NDFD (dwml) xml
+	keeps only the elements NoaaForecast uses: time layouts, max / min
+	temperatures and the first weather and conditions-icon blocks.
+	time layouts are read straight into date -> index maps and every
+	element is cleared once read, so no document tree builds up.
+	results match the old minidom parse in NoaaForecast
+"""
+class NoaaXmlParser():
+	def __init__(self):
+		# layout key -> {date: index of its first start-valid-time}
+		self.time_layouts = {}
+		# (type, time layout, [value text]) for every temperature element
+		self.temperatures = []
+		# (time layout, [icon-link text]) of the first conditions-icon
+		self.icon_links = None
+		# (time layout, [weather-summary]) of the first weather element
+		self.weather_summaries = None
+
+	"""
+	parse a path or file-like object, e.g. an open http response
+	"""
+	def parse(self, source):
+		layout_key = None
+		layout_dates = None
+		temperature = None
+		icons = None
+		weather = None
+
+		for event, elem in iterparse(source, events=('start', 'end')):
+			tag = elem.tag
+
+			if event == 'start':
+				if tag == 'time-layout':
+					layout_key = None
+					layout_dates = {}
+					layout_count = 0
+				elif tag == 'temperature':
+					temperature = (elem.get('type'), elem.get('time-layout'), [])
+				elif tag == 'conditions-icon' and self.icon_links is None:
+					icons = (elem.get('time-layout'), [])
+				elif tag == 'weather' and self.weather_summaries is None:
+					weather = (elem.get('time-layout'), [])
+				continue
+
+			if layout_dates is not None:
+				if tag == 'layout-key':
+					if layout_key is None:
+						layout_key = elem.text
+				elif tag == 'start-valid-time':
+					date = elem.text[0:10]
+					if date not in layout_dates:
+						layout_dates[date] = layout_count
+					layout_count = layout_count + 1
+				elif tag == 'time-layout':
+					self.time_layouts[layout_key] = layout_dates
+					layout_dates = None
+
+			elif temperature is not None:
+				if tag == 'value':
+					temperature[2].append(elem.text)
+				elif tag == 'temperature':
+					self.temperatures.append(temperature)
+					temperature = None
+
+			elif icons is not None:
+				if tag == 'icon-link':
+					icons[1].append(elem.text)
+				elif tag == 'conditions-icon':
+					self.icon_links = icons
+					icons = None
+
+			elif weather is not None:
+				if tag == 'weather-conditions':
+					weather[1].append(elem.get('weather-summary', ''))
+				elif tag == 'weather':
+					self.weather_summaries = weather
+					weather = None
+
+			elem.clear()
+
+		return self
+
+	"""
+	highs and lows for our dates, '?' where there's no value
+	"""
+	def temps(self, dates):
+		highs = ['?'] * 4
+		lows = ['?'] * 4
+
+		for temp_type, time_layout, values in self.temperatures:
+			if temp_type == 'maximum':
+				days = highs
+			elif temp_type == 'minimum':
+				days = lows
+			else:
+				continue
+			date_indices = self.time_layouts[time_layout]
+			for i in range(len(dates)):
+				date_index = date_indices.get(dates[i])
+				if date_index is not None and values[date_index] is not None:
+					days[i] = values[date_index]
+
+		return [highs, lows]
+
+	"""
+	icon names for our dates, None where there's no icon
+	"""
+	def icons(self, dates):
+		if self.icon_links is None:
+			raise ValueError('no conditions-icon in noaa xml')
+		time_layout, icon_links = self.icon_links
+		date_indices = self.time_layouts[time_layout]
+
+		icons = [None] * 4
+
+		for i in range(len(dates)):
+			date_index = date_indices.get(dates[i])
+			if date_index is not None and icon_links[date_index] is not None:
+				icons[i] = icon_links[date_index].split('/')[-1].split('.')[0].rstrip('0123456789')
+
+		return icons
+
+	"""
+	weather summaries for our dates, empty where there's none
+	"""
+	def summaries(self, dates):
+		if self.weather_summaries is None:
+			raise ValueError('no weather in noaa xml')
+		time_layout, weather_values = self.weather_summaries
+		date_indices = self.time_layouts[time_layout]
+
+		summaries = [""] * 4
+
+		for i in range(len(dates)):
+			date_index = date_indices.get(dates[i])
+			if date_index is not None:
+				summaries[i] = weather_values[date_index]
+
+		return summaries
@@ -0,0 +1,147 @@
+import math
+import pzwglobals
+
+logger = pzwglobals.logger
+
+"""
+latitude and longitude to pixels in the GOES ABI sector images on the NESDIS cdn
+
+	the images are on the ABI fixed grid: pixels are evenly spaced scan angles
+	seen from the satellite, so a location's pixel comes straight from the
+	geostationary projection (GOES-R product user guide, 4.2.8) and each
+	sector only needs its top left scan angles and pixel size
+"""
+
+NESDIS_URL = "https://cdn.star.nesdis.noaa.gov/GOES16/ABI/"
+
+# GRS80 earth and the satellite's distance from the earth's centre, in metres
+R_EQ = 6378137.0
+R_POL = 6356752.31414
+SATELLITE_HEIGHT = 42164160.0
+SATELLITE_LONGITUDE = -75.2
+
+# scan angle per pixel of the images we crop from, radians
+# the 2 km look of the 1200 x 1200 ne images our crops have always had
+CROP_SCALE = 56e-6
+
+"""
+sectors we can crop from
+
+	path: where the sector's GEOCOLOR listing is under NESDIS_URL
+	x, y: scan angles in radians of the top left corner of the image
+	scale: scan angle per pixel of the largest image
+	sizes: the image sizes published, smallest first
+
+ conus is the ABI conus scene as the product user guide defines it.
+ ne's corner is where our old hand set crop (593, 508 in the 1200 x 1200
+ image) puts pzwglobals' location at the centre of the display
+"""
+SECTORS = {
+	'ne': {
+		'path': 'SECTOR/ne',
+		'x': -0.036261,
+		'y': 0.141845,
+		'scale': 28e-6,
+		'sizes': ((300, 300), (600, 600), (1200, 1200), (2400, 2400))
+	},
+	'conus': {
+		'path': 'CONUS',
+		'x': -0.101360,
+		'y': 0.128240,
+		'scale': 28e-6,
+		'sizes': ((625, 375), (1250, 750), (2500, 1500), (5000, 3000))
+	}
+}
+
+_windows = {}
+
+"""
+CropWindow
+
+	where a location's background comes from: a sector image of a given size
+	and the box in it, width by height with left, top as its corner
+"""
+class CropWindow():
+	def __init__(self, sector, size, left, top, width, height):
+		self.sector = sector
+		self.size = size
+		self.left = left
+		self.top = top
+		self.width = width
+		self.height = height
+
+	def __repr__(self):
+		return 'CropWindow({} {}x{} at {}, {})'.format(self.sector, self.size[0], self.size[1], self.left, self.top)
+
+	def box(self):
+		return (self.left, self.top, self.left + self.width, self.top + self.height)
+
+	# the part of image names that picks this size out of the listing
+	def sizeName(self):
+		return '{}x{}'.format(*self.size)
+
+	def listingUrl(self):
+		return NESDIS_URL + SECTORS[self.sector]['path'] + '/GEOCOLOR/'
+
+	# the same sector image with the box somewhere else
+	def movedTo(self, left, top):
+		return CropWindow(self.sector, self.size, left, top, self.width, self.height)
+
+"""
+fixed grid scan angles (x, y) in radians of a location
+ None when the satellite can't see it
+"""
+def scanAngles(latitude, longitude, satellite_longitude=SATELLITE_LONGITUDE):
+	e2 = 1 - (R_POL * R_POL) / (R_EQ * R_EQ)
+	phi_c = math.atan((R_POL * R_POL) / (R_EQ * R_EQ) * math.tan(math.radians(latitude)))
+	r_c = R_POL / math.sqrt(1 - e2 * math.cos(phi_c) ** 2)
+	dlon = math.radians(longitude - satellite_longitude)
+	s_x = SATELLITE_HEIGHT - r_c * math.cos(phi_c) * math.cos(dlon)
+	s_y = -r_c * math.cos(phi_c) * math.sin(dlon)
+	s_z = r_c * math.sin(phi_c)
+	if SATELLITE_HEIGHT * (SATELLITE_HEIGHT - s_x) < s_y * s_y + (R_EQ * R_EQ) / (R_POL * R_POL) * s_z * s_z:
+		return None
+	x = math.asin(-s_y / math.sqrt(s_x * s_x + s_y * s_y + s_z * s_z))
+	y = math.atan(s_z / s_x)
+	return x, y
+
+"""
+fractional (column, row) of a location in a sector image of size, None if it isn't visible
+"""
+def sectorPixel(sector, size, latitude, longitude):
+	angles = scanAngles(latitude, longitude)
+	if angles is None:
+		return None
+	s = SECTORS[sector]
+	scale = s['scale'] * s['sizes'][-1][0] / size[0]
+	return (angles[0] - s['x']) / scale, (s['y'] - angles[1]) / scale
+
+"""
+the crop window for a location and a display sized box, centred on the location
+ out of the sector images at scale that hold the whole box, the one with the fewest
+ pixels, so the smallest download. None when no sector covers it
+"""
+def cropWindow(latitude, longitude, width, height, scale=CROP_SCALE):
+	key = (float(latitude), float(longitude), width, height, scale)
+	if key in _windows:
+		return _windows[key]
+
+	best = None
+	for sector, s in SECTORS.items():
+		for size in s['sizes']:
+			if abs(s['scale'] * s['sizes'][-1][0] / size[0] - scale) > scale * 0.01:
+				continue
+			pixel = sectorPixel(sector, size, float(latitude), float(longitude))
+			if pixel is None:
+				continue
+			left = int(round(pixel[0] - width / 2.0))
+			top = int(round(pixel[1] - height / 2.0))
+			if left < 0 or top < 0 or left + width > size[0] or top + height > size[1]:
+				continue
+			if best is None or size[0] * size[1] < best.size[0] * best.size[1]:
+				best = CropWindow(sector, size, left, top, width, height)
+
+	if best is None:
+		logger.warning('no satellite sector covers {}, {}'.format(latitude, longitude))
+	_windows[key] = best
+	return best
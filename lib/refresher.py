@@ -0,0 +1,94 @@
+import threading
+from datetime import datetime
+import pzwglobals
+
+logger = pzwglobals.logger
+
+REFRESH_INTERVAL = 10 * 60
+
+"""
+WeatherSnapshot
+
+	one complete set of display data: background, noaa forecast and darksky weather
+	snapshots are never modified once built, a refresh builds a new one
+"""
+class WeatherSnapshot():
+	def __init__(self, bg=None, noaa=None, darksky=None, loaded_at=None):
+		self.bg = bg
+		self.noaa = noaa
+		self.darksky = darksky
+		self.loaded_at = loaded_at if loaded_at is not None else datetime.now()
+
+"""
+Refresher
+
+	background thread that builds a new WeatherSnapshot every interval
+	and swaps it in atomically, so the ui thread never waits on the network.
+	subscribers are called with each new snapshot, on the refresher thread
+"""
+class Refresher():
+	def __init__(self, build_snapshot, interval=REFRESH_INTERVAL):
+		self.build_snapshot = build_snapshot
+		self.interval = interval
+		self.snapshot = WeatherSnapshot()
+		self.subscribers = []
+		self.lock = threading.Lock()
+		self.stopped = threading.Event()
+		self.thread = None
+
+	"""
+	call fn(snapshot) after every swap
+	"""
+	def subscribe(self, fn):
+		with self.lock:
+			self.subscribers.append(fn)
+
+	"""
+	make snapshot current and tell subscribers
+	"""
+	def swap(self, snapshot):
+		with self.lock:
+			self.snapshot = snapshot
+			subscribers = list(self.subscribers)
+		for fn in subscribers:
+			try:
+				fn(snapshot)
+			except Exception:
+				logger.exception('Refresher::swap subscriber failed')
+
+	"""
+	make snapshot current without telling subscribers
+	 for state restored at startup, which they already have
+	"""
+	def restore(self, snapshot):
+		with self.lock:
+			self.snapshot = snapshot
+
+	"""
+	build and swap in a snapshot now, on the calling thread
+	"""
+	def refresh(self):
+		self.swap(self.build_snapshot())
+
+	"""
+	refresh every interval on a background thread
+	 the first refresh comes after delay seconds, a full interval if not given
+	"""
+	def start(self, delay=None):
+		if self.thread is not None:
+			return
+		self.thread = threading.Thread(target=self.run, args=(delay,), name='pzw-refresher', daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		self.stopped.set()
+
+	def run(self, delay=None):
+		logger.debug('Refresher::run every {}s'.format(self.interval))
+		wait = self.interval if delay is None else delay
+		while not self.stopped.wait(wait):
+			wait = self.interval
+			try:
+				self.refresh()
+			except Exception:
+				logger.exception('Refresher::run refresh failed, keeping last snapshot')
@@ -0,0 +1,264 @@
+import io
+import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from PIL import Image
+import pzwglobals
+from lib.frames import pack_frame, unpack_frame
+from lib.fileutil import atomic_write
+from lib.metrics import get_metrics
+
+logger = pzwglobals.logger
+
+RENDER_DIRECTORY = pzwglobals.DATA_DIRECTORY + 'render-server/'
+
+# frames show the time to the minute, so every location is re-rendered this often
+# forecasts come from their caches and only go upstream once those are stale
+RENDER_INTERVAL = 60
+
+# seconds between checks of the satellite listing
+IMAGE_INTERVAL = pzwglobals.CACHE_TTLS['satellite']
+
+# threads fetching forecasts, the upstreams are slow but light
+FETCH_WORKERS = 4
+
+# each worker process sets these up once, in init_worker
+_worker = None
+
+"""
+per process setup for the render pool: our ditherer and one of each screen
+ fonts, glyph atlas, icon cache and the yliluoma table are then built
+ once per worker rather than once per location
+"""
+def init_worker(dither, threshold):
+	global _worker
+	from lib.satelliteimage import SatelliteImage
+	from lib.screens import CurrentWeather, ForecastDays
+	_worker = {
+		'sat': SatelliteImage(dither, threshold, load=False),
+		'screens': [CurrentWeather('current_weather'), ForecastDays('forecast_days')]
+	}
+
+"""
+dither a location's crop unless its background is already done, then compose its screens
+ runs in a pool process, so everything in and out is plain bytes
+
+	:param job: (location name, packed background or None, (size, rgb bytes) crop or None, noaa, darksky)
+	:returns: (location name, packed background, {screen name: (frame hash, png bytes)})
+"""
+def render_location(job):
+	from lib.frames import frame_hash
+	name, bg, crop, noaa, darksky = job
+	if bg is None:
+		bg_img = _worker['sat'].ditheredIndex(Image.frombytes('RGB', crop[0], crop[1]))
+		bg = pack_frame(bg_img)
+	else:
+		bg_img = unpack_frame(bg)
+	frames = {}
+	for screen in _worker['screens']:
+		frame = screen.compose(bg_img.copy(), darksky, noaa)
+		buf = io.BytesIO()
+		frame.save(buf, 'PNG')
+		frames[screen.name] = (frame_hash(frame), buf.getvalue())
+	return name, bg, frames
+
+"""
+RenderServer
+
+	renders both screens for a list of lib.locations Locations
+	each sector image is downloaded and decoded once for all the locations cropped from it,
+	each distinct latitude and longitude's forecasts are fetched once,
+	and dithering and composing are spread over a process pool.
+	frames are written as png to directory/<location>/<screen>.png
+"""
+class RenderServer():
+	def __init__(self, locations, dither=None, threshold=None, workers=None, directory=RENDER_DIRECTORY):
+		from lib.satelliteimage import SatelliteImage, DEFAULT_DITHER_ALGORITHM, DEFAULT_DITHER_THRESHOLD
+		self.directory = directory
+		self.dither = dither if dither is not None else DEFAULT_DITHER_ALGORITHM
+		self.threshold = threshold if threshold is not None else DEFAULT_DITHER_THRESHOLD
+		
+		# locations grouped by the sector image they're cropped from
+		self.locations = []
+		self.sectors = {}
+		for location in locations:
+			sat = SatelliteImage(self.dither, self.threshold, load=False, location=location)
+			if sat.window is None:
+				logger.warning('RenderServer::init no satellite image covers ' + location.name)
+				continue
+			key = (sat.window.listingUrl(), sat.window.sizeName())
+			if key not in self.sectors:
+				self.sectors[key] = (sat, [])
+			self.sectors[key][1].append((location, sat.window))
+			self.locations.append(location)
+		
+		if not self.locations:
+			raise ValueError('no satellite image covers any of the {} locations, nothing to render'.format(len(locations)))
+		
+		self.workers = workers or os.cpu_count() or 1
+		# with a single worker the round trips to another process are pure overhead
+		if self.workers > 1:
+			self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(self.dither, self.threshold))
+		else:
+			self.pool = None
+			init_worker(self.dither, self.threshold)
+		self.fetcher = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='pzw-server')
+		self.image_checked_at = None
+		self.backgrounds = {}
+		self.frame_hashes = {}
+		self.stopped = threading.Event()
+
+	"""
+	crops of the latest satellite images for locations without a current background
+	 returns {location name: (size, rgb bytes)}, empty when nothing new is needed
+	"""
+	def fetch_crops(self):
+		due = self.image_checked_at is None or time.time() - self.image_checked_at >= IMAGE_INTERVAL
+		if due:
+			self.image_checked_at = time.time()
+
+		crops = {}
+		for sat, members in self.sectors.values():
+			if due or any(l.name not in self.backgrounds for l, w in members):
+				crops.update(self.fetch_sector(sat, members))
+		return crops
+
+	"""
+	crops of one sector's latest image, for its locations that need one
+	"""
+	def fetch_sector(self, sat, members):
+		url = sat.getLatestImageUrl()
+		if url is None:
+			return {}
+		missing = [(l, w) for l, w in members if l.name not in self.backgrounds]
+		if url != sat.last['url']:
+			for l, w in members:
+				self.backgrounds.pop(l.name, None)
+			missing = members
+		if not missing:
+			return {}
+
+		img = sat.downloadLatest(url)
+		if img is None:
+			return {}
+		try:
+			with get_metrics().span('server.crop'):
+				crops = sat.cropMany(img, [(w.left, w.top) for l, w in missing])
+		except (OSError, SyntaxError, ValueError):
+			logger.warning("couldn't decode satellite image " + url)
+			return {}
+		sat.commitListing(url)
+		return {l.name: (crop.size, crop.convert('RGB').tobytes()) for (l, w), crop in zip(missing, crops)}
+
+	"""
+	noaa and darksky data for every location, fetched once per latitude and longitude
+	 returns {(latitude, longitude): (noaa, darksky)}
+	"""
+	def fetch_forecasts(self):
+		from lib.noaaforecast import NoaaForecast
+		from lib.darkskyweather import DarkSkyWeather
+		futures = {}
+		for location in self.locations:
+			key = (location.latitude, location.longitude)
+			if key in futures:
+				continue
+			futures[key] = (
+				self.fetcher.submit(lambda location=location: NoaaForecast(location=location).forecast),
+				self.fetcher.submit(lambda location=location: DarkSkyWeather(location=location).weather)
+			)
+		forecasts = {}
+		for key, (noaa, darksky) in futures.items():
+			forecasts[key] = (self.result(noaa), self.result(darksky))
+		return forecasts
+
+	def result(self, future):
+		try:
+			return future.result()
+		except Exception:
+			logger.exception('RenderServer::fetch_forecasts fetch failed')
+			return None
+
+	"""
+	one cycle: fetch what's needed, render every location, write changed frames
+	 returns (frames rendered, seconds taken)
+	"""
+	def render(self):
+		start = time.time()
+		crops = self.fetcher.submit(self.fetch_crops)
+		forecasts = self.fetch_forecasts()
+		crops = crops.result()
+		frames = self.render_frames(crops, forecasts)
+		elapsed = time.time() - start
+		get_metrics().observe('server.cycle', elapsed * 1000)
+		get_metrics().incr('server.frames', frames)
+		logger.info('RenderServer::render {} frames for {} locations in {:.2f}s, {:.0f} frames/min'.format(
+			frames, len(self.locations), elapsed, frames / elapsed * 60 if elapsed else 0))
+		return frames, elapsed
+
+	"""
+	render every location from crops and forecasts, over the process pool
+	 returns the number of frames rendered
+	"""
+	def render_frames(self, crops, forecasts):
+		jobs = []
+		for location in self.locations:
+			noaa, darksky = forecasts.get((location.latitude, location.longitude), (None, None))
+			if noaa is None or darksky is None:
+				logger.warning('RenderServer::render no forecast for ' + location.name)
+				continue
+			bg = self.backgrounds.get(location.name)
+			crop = crops.get(location.name) if bg is None else None
+			if bg is None and crop is None:
+				logger.warning('RenderServer::render no background for ' + location.name)
+				continue
+			jobs.append((location.name, bg, crop, noaa, darksky))
+
+		if self.pool is None:
+			results = map(render_location, jobs)
+		else:
+			# a few batches per worker keeps them all busy without a round trip per location
+			results = self.pool.map(render_location, jobs, chunksize=max(1, len(jobs) // (self.workers * 4)))
+		rendered = 0
+		for name, bg, frames in results:
+			self.backgrounds[name] = bg
+			for screen_name, (h, png) in frames.items():
+				rendered = rendered + 1
+				self.save(name, screen_name, h, png)
+		return rendered
+
+	"""
+	write a frame unless the file already holds it
+	"""
+	def save(self, location_name, screen_name, h, png):
+		key = (location_name, screen_name)
+		if self.frame_hashes.get(key) == h:
+			return
+		directory = os.path.join(self.directory, location_name)
+		try:
+			os.makedirs(directory, exist_ok=True)
+			atomic_write(os.path.join(directory, screen_name + '.png'), png)
+		except OSError:
+			logger.warning("couldn't write frame {} for {}".format(screen_name, location_name))
+			return
+		self.frame_hashes[key] = h
+
+	"""
+	render every interval until stopped
+	"""
+	def serve(self, interval=RENDER_INTERVAL):
+		logger.info('RenderServer::serve {} locations into {}'.format(len(self.locations), self.directory))
+		while not self.stopped.is_set():
+			started = time.time()
+			try:
+				self.render()
+			except Exception:
+				logger.exception('RenderServer::serve render failed')
+			get_metrics().write()
+			self.stopped.wait(max(interval - (time.time() - started), 0))
+
+	def stop(self):
+		self.stopped.set()
+		self.fetcher.shutdown(wait=False)
+		if self.pool is not None:
+			self.pool.shutdown()
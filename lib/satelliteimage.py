@@ -1,31 +1,37 @@
-import os
-import time
+import io
 import re
-from urllib.request import urlretrieve
-import requests
-from xml.dom import minidom
-from bs4 import BeautifulSoup
-from PIL import Image, ImageDraw, ImageFont
-import hitherdither
+from PIL import Image
 import pzwglobals
+from lib.ttlcache import get_cache
+from lib.httpclient import get_http_client
+from lib.metrics import get_metrics
+from lib.memory import get_memory_budget
 
 DEFAULT_BG = pzwglobals.IMG_DIRECTORY + 'default-bg.png'
 
 DEFAULT_DITHER_ALGORITHM = 'yliluoma'
 DEFAULT_DITHER_THRESHOLD = 64
 
-NOAA_IMG_URL = "https://cdn.star.nesdis.noaa.gov/GOES16/ABI/SECTOR/ne/GEOCOLOR/"
+# crops are display sized, lib.projection finds where in which sector image
+BG_WIDTH = pzwglobals.DISPLAY_WIDTH
+BG_HEIGHT = pzwglobals.DISPLAY_HEIGHT
 
-CROP_LEFT = 593
-CROP_TOP = 508
-BG_WIDTH = 212
-BG_HEIGHT = 104
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DECODE_CHUNK_SIZE = 64 * 1024
 
 logger = pzwglobals.logger
 
-palette = hitherdither.palette.Palette(
-	[0xffffff, 0x000000, 0xff0000]
-)
+# bs4, numpy and hitherdither are imported where they're used,
+# so importing this module stays cheap until an image is fetched
+
+"""
+hitherdither palette of our three display colors
+"""
+def hitherditherPalette():
+	import hitherdither
+	return hitherdither.palette.Palette(
+		[0xffffff, 0x000000, 0xff0000]
+	)
 
 """
 SatelliteImage
@@ -33,9 +39,17 @@ SatelliteImage
 	attempt to download latest NOAA satellite image
 	crop and dither it for Inky display
 	store new image or local default on public prop image
+	the crop is around pzwglobals' location, or a lib.locations Location,
+	from the smallest sector image that covers it
 """
 class SatelliteImage():
-	def __init__(self, dither, threshold, debug=False):
+	
+	# per sector listing: its validators, the image url it gave us,
+	# and our crop of that image. kept on the class so the next refresh
+	# can skip an unchanged listing or image
+	last_downloads = {}
+	
+	def __init__(self, dither, threshold, debug=False, load=True, location=None, revalidate=True):
 		
 		if debug is True:
 			self.image = self.getDefault()
@@ -48,71 +62,285 @@ class SatelliteImage():
 		
 		self.dither = dither
 		self.threshold = threshold
+		self.listing_validators = (None, None)
 		
 		logger.debug("SatelliteImage init with dither: {} at {}".format(self.dither, self.threshold))
 		
-		url = self.getLatestImageUrl()
+		from lib.locations import default_location
+		if location is None:
+			location = default_location()
+		self.window = location.window(BG_WIDTH, BG_HEIGHT)
 		
-		if not url:
+		if self.window is None:
 			self.image = self.getDefault()
 			return None
 		
-		img = self.downloadLatest(url)
+		logger.debug("SatelliteImage crop {}".format(self.window))
+		
+		self.last = SatelliteImage.last_downloads.setdefault(self.window.listingUrl(), {
+			'etag': None,
+			'last_modified': None,
+			'url': None,
+			'crop': None
+		})
+		
+		# the render server drives the download, crop and dither steps itself
+		if not load:
+			self.image = None
+			return None
+		
+		# memory only: across restarts the warm start snapshot has the last
+		# background and the dither cache has the dithered crops
+		name = 'satellite-{}-{}'.format(self.dither, self.threshold)
+		cache = get_cache(name, source='satellite')
+		
+		self.image = cache.get(self.loadImage, revalidate=revalidate)
 		
-		if not img:
+		if self.image is None:
 			self.image = self.getDefault()
+		
+		return None
+
+	"""
+	 download, crop and dither the latest image
+	  returns None when there's no new image to be had
+	"""
+	def loadImage(self):
+		url = self.getLatestImageUrl()
+		
+		if not url:
 			return None
 		
-		crop = self.cropTriState(img)
+		crop = self.loadCrop(url)
 		
-		#self.image = self.pillowIndex(crop)
+		if crop is None:
+			return None
 		
-		#self.image = self.diffusionDither(crop)
+		#return self.pillowIndex(crop)
 		
-		self.image = self.ditheredIndex(crop)
+		#return self.diffusionDither(crop)
 		
-		return None
+		from lib.dithercache import get_dither_cache
+		# the engine is part of the name so the two engines' output is cached apart
+		algorithm = '{}-{}'.format(pzwglobals.DITHER_ENGINE, self.dither)
+		img = get_dither_cache().dither(crop, algorithm, self.threshold, 8, self.ditheredIndex)
+		self.keepHistory(url, img)
+		return img
+
+	"""
+	 add the background to lib.framehistory, under the scan time in the image's name
+	"""
+	def keepHistory(self, url, img):
+		from datetime import datetime
+		from lib.framehistory import get_frame_history
+		from lib.imagediscovery import imageTime
+		captured_at = imageTime(url.rsplit('/', 1)[-1]) or datetime.utcnow()
+		with get_metrics().span('satellite.history'):
+			get_frame_history().append(img, captured_at)
 
 	"""
-	 find latest 1200 x 1200 satellite image on server
+	 find latest satellite image of our sector and size on server
+	  the next image's name is predicted from the last one and probed,
+	  the listing is only read when there's no last image or a probe misses
 	"""
 	def getLatestImageUrl(self):
-		res = requests.get(NOAA_IMG_URL)
-		if res.status_code == 200:
-			soup = BeautifulSoup(res.content, 'html.parser')
-			img_urls = soup.find_all('a', string=re.compile("1200x1200"))
-			if not img_urls:
-				logger.warning('Error: no image urls found')
-				return None
-			logger.debug('latest image anchor: ')
-			logger.debug(img_urls[-1])
-			return NOAA_IMG_URL + img_urls[-1]['href']
+		from lib.imagediscovery import ImageDiscovery
+		last = self.last
+		discovery = ImageDiscovery(self.window.listingUrl(), self.window.sizeName())
+		
+		url = discovery.predict(last['url'])
+		if url is not None:
+			discovery.report()
+			self.listing_validators = (last['etag'], last['last_modified'])
+			return url
+		
+		headers = {}
+		if last['url'] is not None:
+			if last['etag']:
+				headers['If-None-Match'] = last['etag']
+			if last['last_modified']:
+				headers['If-Modified-Since'] = last['last_modified']
+		status, url = discovery.scanListing(headers)
+		discovery.report()
+		if status == 304:
+			logger.debug('image listing not modified')
+			get_metrics().incr('satellite.listing_not_modified')
+			return last['url']
+		if status == 200:
+			self.listing_validators = (discovery.headers.get('ETag'), discovery.headers.get('Last-Modified'))
+			return url
 		return None
 	
+	"""
+	 url of the latest image of our size in the directory listing html
+	"""
+	def scanListing(self, content):
+		from lib.imagediscovery import ListingScanner
+		name = ListingScanner(self.window.sizeName()).scan([content])
+		if name is None:
+			return None
+		return self.window.listingUrl() + name
+	
+	"""
+	 full soup parse of the listing, the reference for ListingScanner
+	"""
+	def parseListing(self, content):
+		from bs4 import BeautifulSoup
+		soup = BeautifulSoup(content, 'html.parser')
+		img_urls = soup.find_all('a', string=re.compile(self.window.sizeName()))
+		if not img_urls:
+			logger.warning('Error: no image urls found')
+			return None
+		logger.debug('latest image anchor: ')
+		logger.debug(img_urls[-1])
+		return self.window.listingUrl() + img_urls[-1]['href']
+	
+	"""
+	 get our crop of the image at url
+	  reuses the last crop when the newest image is the one we already processed
+	"""
+	def loadCrop(self, url):
+		last = self.last
+		
+		if url == last['url'] and last['crop'] is not None:
+			logger.debug('latest satellite image unchanged, reusing crop')
+			get_metrics().incr('satellite.crop_reused')
+			return last['crop']
+		
+		img = self.downloadLatest(url)
+		
+		if img is None:
+			return None
+		
+		try:
+			with get_metrics().span('satellite.crop'):
+				crop = self.cropTriState(img)
+		except (OSError, SyntaxError, ValueError):
+			# truncated or corrupt, nothing is kept so the next refresh tries again
+			logger.warning("couldn't decode satellite image " + url)
+			return None
+		
+		# the jpeg and its decoded rows are dead weight from here on
+		del img
+		get_memory_budget().release()
+		
+		self.commitListing(url)
+		last['crop'] = crop
+		return crop
+	
+	"""
+	 remember the listing validators and the image url they led to
+	  only called once that image is processed, so a failed download
+	  doesn't leave us skipping a listing we never got anything from
+	"""
+	def commitListing(self, url):
+		last = self.last
+		last['etag'], last['last_modified'] = self.listing_validators
+		last['url'] = url
+	
 	"""
 	 download latest satellite image
+	  streamed into memory, nothing is written to disk
 	"""
 	def downloadLatest(self, url):
-		sat_img_localname = "noaa-download" + time.strftime("%Y%m%d%H%M") + ".jpg"
 		try:
-			sat_img_local, headers = urlretrieve(url, sat_img_localname)
-			img = Image.open(sat_img_local)
-			os.remove(sat_img_local)
-			return img
-		except:
+			with get_http_client().stream(url, source='nesdis', deadline=pzwglobals.FETCH_DEADLINES['nesdis']) as res:
+				if res.status_code != 200:
+					logger.warning('satellite download failed with status {}'.format(res.status_code))
+					return None
+				
+				buf = io.BytesIO()
+				for chunk in res.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+					buf.write(chunk)
+				
+				logger.debug('downloaded {} bytes from {}'.format(buf.tell(), url))
+				
+				buf.seek(0)
+				return Image.open(buf)
+		except Exception:
+			logger.warning("couldn't download satellite image " + url)
 			return None
 	
 	"""
-	 crop nyc area from satellite image
+	 crop our crop window, or the same size box at left, top, from satellite image
+	  only the rows down to the bottom of the crop are decoded when possible
+	"""
+	def cropTriState(self, img, left=None, top=None):
+		if left is None:
+			left, top = self.window.left, self.window.top
+		return self.cropMany(img, [(left, top)])[0]
+
+	"""
+	 crop several boxes the size of our crop window from one satellite image
+	  the image is decoded once, down to the lowest crop's bottom row
+	"""
+	def cropMany(self, img, corners):
+		width, height = self.window.width, self.window.height
+		bottom = max(top for left, top in corners) + height
+		top_rows = self.decodeRows(img, bottom)
+		if top_rows is not None:
+			img = top_rows
+		return [img.crop((left, top, left + width, top + height)) for left, top in corners]
+
 	"""
-	def cropTriState(self, img):
-		return img.crop((CROP_LEFT, CROP_TOP, CROP_LEFT + BG_WIDTH, CROP_TOP + BG_HEIGHT))
+	 decode only the top rows of a not yet loaded jpeg
+	  libjpeg decodes top to bottom, so we stop once the last row we need is out
+	  and never allocate or decode the rest of the image.
+	  scale-on-decode (draft) doesn't help here, the crop is at native resolution.
+	  returns None if img isn't a baseline single tile jpeg, if this Pillow
+	  doesn't have the decoder hook, or if the data runs out before the last
+	  row: the caller then falls back to a full decode, which raises for a
+	  truncated file instead of handing back black rows
+	"""
+	def decodeRows(self, img, rows):
+		# Pillow has no public way to decode into a smaller image than the file's
+		if not hasattr(Image, '_getdecoder'):
+			return None
+		try:
+			if img.format != 'JPEG' or len(img.tile) != 1 or rows >= img.size[1]:
+				return None
+			
+			decoder_name, extents, offset, args = img.tile[0]
+			if decoder_name != 'jpeg':
+				return None
+			
+			size = (img.size[0], rows)
+			decoder = Image._getdecoder(img.mode, decoder_name, args, img.decoderconfig)
+			top_rows = Image.new(img.mode, size)
+			decoder.setimage(top_rows.im, (0, 0) + size)
+			
+			# same feed loop as ImageFile.load. once every row is out the decoder
+			# stops by itself (n < 0), reporting an error for the scanlines it
+			# didn't get to, which is what we want. running out of data first
+			# means the rows past that point were never written
+			img.fp.seek(offset)
+			buf = b''
+			n = 0
+			try:
+				while True:
+					s = img.fp.read(DECODE_CHUNK_SIZE)
+					buf = buf + s
+					n, err = decoder.decode(buf)
+					if n < 0 or not s:
+						break
+					buf = buf[n:]
+			finally:
+				decoder.cleanup()
+			
+			if n >= 0:
+				logger.warning('satellite image ends before row {}'.format(rows))
+				return None
+			
+			return top_rows
+		except Exception:
+			logger.debug('row limited decode unavailable, decoding full image')
+			return None
 
 	"""
 	 convert rgb image to 3 color indexed image using Pil quantize with custom palette
 	"""
 	def pillowIndex(self, img):
-		img = img.crop((CROP_LEFT, CROP_TOP, CROP_LEFT + BG_WIDTH, CROP_TOP + BG_HEIGHT))
+		img = img.crop(self.window.box())
 		idx_img = Image.new("P", (1, 1))
 		idx_img.putpalette((255, 255, 255, 0, 0, 0, 255, 0, 0) + (0, 0, 0) * 252)
 		img2 = img.quantize(palette=idx_img)
@@ -120,16 +348,35 @@ class SatelliteImage():
 
 	"""
 	 convert rgb image to 3 color indexed image
-	 with custom dithering via hitherdither library
+	 with the engine pzwglobals.DITHER_ENGINE picks
 	"""
 	def ditheredIndex(self, img):
+		if pzwglobals.DITHER_ENGINE == 'numpy':
+			return self.orderedIndex(img)
+		return self.hitherditherIndex(img)
+
+	"""
+	 convert rgb image to 3 color indexed image
+	 with our vectorized ordered dither engine
+	"""
+	def orderedIndex(self, img):
+		from lib.dither import ordered_dither
+		return ordered_dither(img, self.dither, self.threshold, order=8)
+
+	"""
+	 convert rgb image to 3 color indexed image
+	 with custom dithering via hitherdither library
+	"""
+	def hitherditherIndex(self, img):
+		import hitherdither
+		palette = hitherditherPalette()
 		
 		#Yliluoma's Algorithm 1
-		if self.dither is 'yliluoma':
+		if self.dither == 'yliluoma':
 			img_dithered = hitherdither.ordered.yliluoma.yliluomas_1_ordered_dithering(img, palette, order=8)
 		
 		#Bayer dithering
-		elif self.dither is 'bayer':
+		elif self.dither == 'bayer':
 			threshold = self.threshold
 			img_dithered = hitherdither.ordered.bayer.bayer_dithering(img, palette, [threshold, threshold, threshold], order=8)
 		
@@ -144,6 +391,8 @@ class SatelliteImage():
 	 do dither using one of hitherdither's diffusion dither algorithms
 	"""
 	def diffusionDither(self, img):
+		import hitherdither
+		palette = hitherditherPalette()
 		return hitherdither.diffusion.error_diffusion_dithering(img, palette, method='stevenson-arce')
 		
 	"""
@@ -1,7 +1,12 @@
 from datetime import datetime
-from PIL import Image, ImageDraw, ImageFont
+import threading
+from PIL import Image, ImageFont
 import textwrap
 import pzwglobals
+from lib.icons import create_mask, get_icon_cache
+from lib.glyphs import get_glyph_atlas
+from lib.frames import get_frame_gate
+from lib.metrics import get_metrics
 
 logger = pzwglobals.logger
 
@@ -16,19 +21,125 @@ FONT_SIZE = 26
 FONT_SIZE_SMALL = 18
 FONT_Y_OFFSET = 6
 
-ICON_SIZE_SMALL = 50
+# composing shares the glyph atlas and icon cache, and happens on both
+# the ui thread and the refresher thread, so one frame is composed at a time
+COMPOSE_LOCK = threading.Lock()
 
 class Screen():
-	def __init__(self, name='screen', display=None, debug=False):
+	
+	# png written in place of the display on desktop
+	filename = 'pz-weather-screen.png'
+	
+	def __init__(self, name='screen', display=None, debug=False, icon=None):
 		self.name = name
 		self.display = display
 		self.debug = debug
+		self.icon = icon
 		
 		self.font = ImageFont.truetype(pzwglobals.FONT_DIRECTORY + "Impact.ttf", FONT_SIZE)
 		self.font_small = ImageFont.truetype(pzwglobals.FONT_DIRECTORY + "Impact.ttf", FONT_SIZE_SMALL)
+		self.icons = get_icon_cache()
+		self.glyphs = get_glyph_atlas()
+		self.frames = get_frame_gate()
+		self.last_frame = None
+		self.prerendered = None
 
-	def render(self):
-		pass
+	"""
+	draw this screen onto bg and return the finished frame
+	"""
+	def compose(self, bg, darksky, noaa, icon=None):
+		return bg
+
+	def render(self, bg, darksky, noaa, icon=None):
+		with get_metrics().span('render.' + self.name), COMPOSE_LOCK:
+			frame = self.compose(bg, darksky, noaa, icon)
+		return self.show(frame)
+
+	"""
+	what besides the snapshot a composed frame depends on, e.g. the clock
+	 a pre-rendered frame is only used while this still matches
+	"""
+	def frame_key(self):
+		return None
+
+	"""
+	called with each new WeatherSnapshot, on the refresher thread
+	 composes our frame ahead of time in the display's native format,
+	 so showing this screen later only costs the push
+	"""
+	def on_snapshot(self, snapshot):
+		if snapshot.bg is None:
+			return
+		try:
+			key = self.frame_key()
+			with get_metrics().span('prerender.' + self.name), COMPOSE_LOCK:
+				frame = self.compose(snapshot.bg.copy(), snapshot.darksky, snapshot.noaa, self.icon)
+			self.prerendered = (snapshot, key, frame, self.native_buffer(frame))
+		except Exception:
+			logger.exception('Screen::on_snapshot pre-render failed for ' + self.name)
+			self.prerendered = None
+
+	"""
+	pre-render again if the frame_key moved on since the last pre-render, e.g. the minute
+	 called on the ui thread's minute tick, so a screen showing the clock
+	 still only costs the push when the button is pressed
+	 returns True if a frame was composed
+	"""
+	def refresh_prerender(self, snapshot):
+		ready = self.prerendered
+		if snapshot is None or (ready is not None and ready[0] is snapshot and ready[1] == self.frame_key()):
+			return False
+		self.on_snapshot(snapshot)
+		return True
+
+	"""
+	show this screen for snapshot, from the pre-rendered frame when it's still current
+	 returns True if the pre-rendered frame was used
+	"""
+	def show_snapshot(self, snapshot):
+		ready = self.prerendered
+		if ready is not None and ready[0] is snapshot and ready[1] == self.frame_key():
+			self.show(ready[2], buffer=ready[3])
+			return True
+		self.render(bg=snapshot.bg.copy(), darksky=snapshot.darksky, noaa=snapshot.noaa, icon=self.icon)
+		return False
+
+	"""
+	frame converted to what the display driver pushes, the frame itself on desktop
+	"""
+	def native_buffer(self, img):
+		buf = getattr(self.display, 'buf', None)
+		if buf is None:
+			return img
+		import numpy
+		return numpy.array(img, dtype=numpy.uint8).reshape(buf.shape)
+
+	"""
+	push a finished frame to the display, or save it as png on desktop
+	 skipped by the frame gate when the target already shows this frame
+
+		:param img: composited frame
+		:param filename: png name used when there is no display, defaults to the screen's
+		:param buffer: img already in the display's native format, from native_buffer
+	"""
+	def show(self, img, filename=None, buffer=None):
+		self.last_frame = img
+		if filename is None:
+			filename = self.filename
+		if self.display is not None:
+			if buffer is not None and buffer is not img:
+				return self.frames.push(self.name, 'display', img, lambda frame: self.push_buffer(buffer))
+			return self.frames.push(self.name, 'display', img, self.push_display)
+		path = pzwglobals.IMG_DIRECTORY + filename
+		return self.frames.push(self.name, path, img, lambda frame: frame.save(path))
+
+	def push_display(self, img):
+		self.display.set_image(img)
+		self.display.show()
+
+	def push_buffer(self, buffer):
+		self.display.buf = buffer
+		self.display.show()
 
 	"""
 	Create a transparency mask.
@@ -40,81 +151,70 @@ class Screen():
 		:param mask: Optional list of Inky pHAT colours to allow.
 	"""
 	def create_mask(self, source, mask=(WHITE, BLACK, RED)):
-		mask_image = Image.new("1", source.size)
-		w, h = source.size
-		for x in range(w):
-			for y in range(h):
-				p = source.getpixel((x, y))
-				if p in mask:
-					mask_image.putpixel((x, y), 255)
-		return mask_image
+		return create_mask(source, mask)
 
 	"""
 	render a string onto our surface with a white border
 	
-		measure width to figure x point if right aligned
-		render in white first for ersatz dropshadow, then black
+		glyphs come pre-rendered from the glyph atlas
+		white border for ersatz dropshadow first, then black
 
+		:param img: image to render onto
 		:param string: text to render
 		:param xy: tuple with top and right or left corner
 		:param align: optional align left or right
 	"""
-	def text_with_border(self, draw, string, xy, align="left", font=None):
+	def text_with_border(self, img, string, xy, align="left", font=None):
 		if font is None:
 			font = self.font 
-		over = 2
-		x,y = xy
-		if align is "right":
-			w,h = draw.textsize(string, font=font)
-			x = x - w
-		cx = x
-		for c in string:
-			draw.text((cx-over,y-over), c, WHITE, font=font)
-			draw.text((cx,y-over), c, WHITE, font=font)
-			draw.text((cx+over,y-over), c, WHITE, font=font)
-			draw.text((cx-over,y), c, WHITE, font=font)
-			draw.text((cx+over,y), c, WHITE, font=font)
-			draw.text((cx-over,y+over), c, WHITE, font=font)
-			draw.text((cx,y+over), c, WHITE, font=font)
-			draw.text((cx+over,y+over), c, WHITE, font=font)
-			cw = draw.textsize(c, font=font)[0]
-			cx = cx + cw
-		cx = x
-		for c in string:
-			draw.text((cx,y), c, BLACK, font=font)
-			cw = draw.textsize(c, font=font)[0]
-			cx = cx + cw
+		self.glyphs.text_with_border(img, string, xy, font, fill=BLACK, border_fill=WHITE, align=align)
+
+	"""
+	memoized string measurement, same result as draw.textsize
+	"""
+	def textsize(self, string, font=None):
+		if font is None:
+			font = self.font
+		return self.glyphs.textsize(string, font)
 
 """
 confirm shutdown screen
 """
 class ConfirmScreen(Screen):
+	
+	filename = 'pz-weather-confirm.png'
+	
 	def __init__(self, name, icon=None, display=None, debug=False):
 		Screen.__init__(self, name, display, debug)
 	
+	# nothing from the weather data on this screen
+	def on_snapshot(self, snapshot):
+		pass
+	
 	def render(self):
 		bg = Image.new("1", (pzwglobals.DISPLAY_WIDTH, pzwglobals.DISPLAY_HEIGHT), 0)
 		msg = 'Shutdown?'
-		draw = ImageDraw.Draw(bg)
-		mid_y = int(pzwglobals.DISPLAY_HEIGHT / 2) - int(draw.textsize(msg, font=self.font)[1] / 2) - int(FONT_Y_OFFSET / 2)
-		self.text_with_border(draw, msg, (LR_PADDING, mid_y))
+		mid_y = int(pzwglobals.DISPLAY_HEIGHT / 2) - int(self.textsize(msg)[1] / 2) - int(FONT_Y_OFFSET / 2)
+		self.text_with_border(bg, msg, (LR_PADDING, mid_y))
 		
-		if self.display is not None:
-			self.display.set_image(bg)
-			self.display.show()
-		else:
-			bg.save(pzwglobals.IMG_DIRECTORY + 'pz-weather-confirm.png')
+		self.show(bg)
 
 """
 screen class for current weather
 """
 class CurrentWeather(Screen):
+	
+	filename = 'pz-weather-current.png'
+	
 	def __init__(self, name, icon=None, display=None, debug=False):
-		Screen.__init__(self, name, display, debug)
+		Screen.__init__(self, name, display, debug, icon)
 
-	def render(self, bg, darksky, noaa, icon=None):
+	# we show the date and time to the minute
+	def frame_key(self):
+		return datetime.now().strftime("%Y%m%d%H%M")
+
+	def compose(self, bg, darksky, noaa, icon=None):
 		now = datetime.now()
-		draw = ImageDraw.Draw(bg)
 
 		date = now.strftime("%m/%d")
 		if date[0] is "0":
@@ -124,18 +224,18 @@ class CurrentWeather(Screen):
 		if time[0] is "0":
 			time = time[1:]
 
-		self.text_with_border(draw, date, (LR_PADDING, TB_PADDING - FONT_Y_OFFSET))
-		self.text_with_border(draw, time, (pzwglobals.DISPLAY_WIDTH - LR_PADDING - 2, TB_PADDING - FONT_Y_OFFSET), align="right")
+		self.text_with_border(bg, date, (LR_PADDING, TB_PADDING - FONT_Y_OFFSET))
+		self.text_with_border(bg, time, (pzwglobals.DISPLAY_WIDTH - LR_PADDING - 2, TB_PADDING - FONT_Y_OFFSET), align="right")
 
 		if darksky is not None:
 			if "temperature" in darksky:
 				temp_str = u"{}°".format(darksky["temperature"])
-				mid_y = int(pzwglobals.DISPLAY_HEIGHT / 2) - int(draw.textsize(temp_str, font=self.font)[1] / 2) - int(FONT_Y_OFFSET / 2)
-				self.text_with_border(draw, temp_str, (pzwglobals.DISPLAY_WIDTH - LR_PADDING - 12, mid_y), align="right")
+				mid_y = int(pzwglobals.DISPLAY_HEIGHT / 2) - int(self.textsize(temp_str)[1] / 2) - int(FONT_Y_OFFSET / 2)
+				self.text_with_border(bg, temp_str, (pzwglobals.DISPLAY_WIDTH - LR_PADDING - 12, mid_y), align="right")
 
 			if "humidity" in darksky:
-				bottom_y = pzwglobals.DISPLAY_HEIGHT - TB_PADDING -  draw.textsize(temp_str, font=self.font)[1]
-				self.text_with_border(draw, "{} %".format(darksky["humidity"]), (pzwglobals.DISPLAY_WIDTH - LR_PADDING, bottom_y), align="right")
+				bottom_y = pzwglobals.DISPLAY_HEIGHT - TB_PADDING -  self.textsize(temp_str)[1]
+				self.text_with_border(bg, "{} %".format(darksky["humidity"]), (pzwglobals.DISPLAY_WIDTH - LR_PADDING, bottom_y), align="right")
 
 		# current icon
 		# we have some noaa icons that take precedence for display
@@ -169,33 +269,24 @@ class CurrentWeather(Screen):
 				if noaa_icon in pzwglobals.NOAA_ICON_MAP:
 					icon_name = pzwglobals.NOAA_ICON_MAP[noaa_icon]
 
-		#if we determined an icon, try to load it
+		#if we determined an icon, paste it from the icon cache
 		if icon_name is not None:
-			try:
-				icon = pzwglobals.IMG_DIRECTORY + "icons/" + icon_name + ".png"
-				icon_img = Image.open(icon)
-				mask = self.create_mask(icon_img)
-				bg.paste(icon_img, (LR_PADDING, 40), mask)
-			except:
-				pass
+			self.icons.paste(bg, icon_name, (LR_PADDING, 40))
 
-		if self.display is not None:
-			self.display.set_image(bg)
-			self.display.show()
-		else:
-			bg.save(pzwglobals.IMG_DIRECTORY + 'pz-weather-current.png')
+		return bg
 
 """
 screen class for three day forecast
 """
 class ForecastDays(Screen):
+	
+	filename = 'pz-weather-forecast.png'
+	
 	def __init__(self, name, display=None, debug=False):
 		Screen.__init__(self, name, display, debug)
 	
 	# print day, high and low, and icon for our forecast days
-	def render(self, bg, darksky, noaa, icon=None):
-		
-		draw = ImageDraw.Draw(bg)
+	def compose(self, bg, darksky, noaa, icon=None):
 		
 		rx = 8 #LR_PADDING
 		ry = TB_PADDING - 4 - FONT_Y_OFFSET
@@ -204,29 +295,24 @@ class ForecastDays(Screen):
 		line_height_small = FONT_SIZE_SMALL + 4
 		
 		for i in range(1,4):
-			self.text_with_border(draw, noaa["date_names"][i][:3], (rx, ry), align="left")
-			self.text_with_border(draw, "{}-{}°".format(noaa["temps"][1][i], noaa["temps"][0][i]), (rx, ry + line_height), align="left", font=self.font_small)
+			self.text_with_border(bg, noaa["date_names"][i][:3], (rx, ry), align="left")
+			self.text_with_border(bg, "{}-{}°".format(noaa["temps"][1][i], noaa["temps"][0][i]), (rx, ry + line_height), align="left", font=self.font_small)
 			
+			icon_name = None
 			if noaa["icons"][i] is not None and noaa["icons"][i] in pzwglobals.NOAA_ICON_MAP:
-				icon = pzwglobals.IMG_DIRECTORY + "icons/" + pzwglobals.NOAA_ICON_MAP[noaa["icons"][i]] + ".png"
-				icon_img = Image.open(icon)
-				mask = self.create_mask(icon_img)
-				icon_img.thumbnail((ICON_SIZE_SMALL, ICON_SIZE_SMALL))
-				mask.thumbnail((ICON_SIZE_SMALL, ICON_SIZE_SMALL))
-				bg.paste(icon_img, (rx, ry + line_height + line_height_small), mask)
+				icon_name = pzwglobals.NOAA_ICON_MAP[noaa["icons"][i]]
+			
+			if icon_name is not None and self.icons.get(icon_name, small=True) is not None:
+				self.icons.paste(bg, icon_name, (rx, ry + line_height + line_height_small), small=True)
 			elif noaa["summaries"][i] is not None:
 				summary_text = noaa["summaries"][i]
 				summary_lines = textwrap.wrap(summary_text, width=9)
 				summary_y = ry + line_height + line_height_small
 				for s_line in summary_lines:
-					s_lineh = draw.textsize(s_line, font=self.font_small)[1]
-					self.text_with_border(draw, s_line, (rx, summary_y), align="left", font=self.font_small)
+					s_lineh = self.textsize(s_line, font=self.font_small)[1]
+					self.text_with_border(bg, s_line, (rx, summary_y), align="left", font=self.font_small)
 					summary_y = summary_y + s_lineh
 		
 			rx = rx + col_width
 		
-		if self.display is not None:
-			self.display.set_image(bg)
-			self.display.show()
-		else:
-			bg.save(pzwglobals.IMG_DIRECTORY + 'pz-weather-forecast.png')
+		return bg
@@ -0,0 +1,164 @@
+import json
+import threading
+from datetime import datetime, timedelta
+import pzwglobals
+from lib.fileutil import atomic_write
+from lib.metrics import get_metrics
+
+logger = pzwglobals.logger
+
+LOG_DATE_FORMAT = '%Y%m%d%H%M%S'
+
+"""
+JsonStore
+
+	dict values in a json file, with the load time in a last_load key
+	same format the noaa.json / darksky.json logs always had
+"""
+class JsonStore():
+	def __init__(self, path):
+		self.path = path
+
+	def load(self):
+		with open(self.path) as f:
+			value = json.load(f)
+		return value, datetime.strptime(value['last_load'], LOG_DATE_FORMAT)
+
+	def save(self, value, loaded_at):
+		value['last_load'] = loaded_at.strftime(LOG_DATE_FORMAT)
+		atomic_write(self.path, json.dumps(value).encode('utf-8'))
+
+"""
+TTLCache
+
+	one cached value for a data source, kept in memory and mirrored to disk
+	fresh values are served as is. stale values are served straight away
+	while a background thread fetches a new one (stale-while-revalidate),
+	so only a cold cache ever waits on the network. callers that can wait,
+	like the refresher thread, pass revalidate=False to fetch a stale value
+	themselves and get the new one.
+	a failed fetch keeps whatever we had
+"""
+class TTLCache():
+	def __init__(self, name, ttl, store=None):
+		self.name = name
+		self.ttl = timedelta(seconds=ttl)
+		self.store = store
+		self.value = None
+		self.loaded_at = None
+		self.disk_checked = False
+		self.lock = threading.Lock()
+		self.revalidating = False
+		self.hits = 0
+		self.misses = 0
+		self.stale = 0
+
+	"""
+	read the disk copy once, after that memory is the source of truth
+	"""
+	def load_from_disk(self):
+		if self.disk_checked or self.store is None:
+			return
+		self.disk_checked = True
+		try:
+			self.value, self.loaded_at = self.store.load()
+		except Exception:
+			logger.warning("couldn't open {} cache".format(self.name))
+
+	def fresh(self):
+		return self.loaded_at is not None and datetime.now() - self.loaded_at < self.ttl
+
+	"""
+	cached value, calling fetch() only when we have to
+
+		:param fetch: returns a new value, or None / raises on failure
+		:param ignore_ttl: serve any cached value, however old (debug mode)
+		:param revalidate: serve a stale value and fetch in the background,
+		 False fetches on the calling thread and waits
+	"""
+	def get(self, fetch, ignore_ttl=False, revalidate=True):
+		with self.lock:
+			self.load_from_disk()
+			value = self.value
+
+			if value is not None and (ignore_ttl or self.fresh()):
+				self.hits = self.hits + 1
+				get_metrics().incr('cache.{}.hit'.format(self.name))
+				logger.debug('{} cache hit {}'.format(self.name, self.stats()))
+				return value
+
+			if value is not None:
+				self.stale = self.stale + 1
+				get_metrics().incr('cache.{}.stale'.format(self.name))
+				if revalidate:
+					logger.info('{} cache stale, revalidating in background {}'.format(self.name, self.stats()))
+					self.start_revalidate(fetch)
+					return value
+			else:
+				self.misses = self.misses + 1
+				get_metrics().incr('cache.{}.miss'.format(self.name))
+
+		logger.info('{} cache {} {}'.format(self.name, 'miss' if value is None else 'stale, fetching', self.stats()))
+		return self.refresh(fetch)
+
+	"""
+	fetch now and store the result, returns the cached value if fetch fails
+	"""
+	def refresh(self, fetch):
+		try:
+			value = fetch()
+		except Exception:
+			logger.exception('{} fetch failed'.format(self.name))
+			value = None
+
+		with self.lock:
+			if value is None:
+				return self.value
+			self.put(value)
+			return value
+
+	"""
+	store a value, call with the lock held
+	"""
+	def put(self, value):
+		self.value = value
+		self.loaded_at = datetime.now()
+		if self.store is not None:
+			try:
+				self.store.save(value, self.loaded_at)
+			except Exception:
+				logger.warning("couldn't write {} cache".format(self.name))
+
+	def start_revalidate(self, fetch):
+		if self.revalidating:
+			return
+		self.revalidating = True
+		thread = threading.Thread(target=self.revalidate, args=(fetch,), name='pzw-revalidate-' + self.name, daemon=True)
+		thread.start()
+
+	def revalidate(self, fetch):
+		try:
+			self.refresh(fetch)
+		finally:
+			self.revalidating = False
+
+	def stats(self):
+		return {'hits': self.hits, 'misses': self.misses, 'stale': self.stale}
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+"""
+shared cache for a source, so every instance sees the same in memory copy
+ ttl defaults to pzwglobals.CACHE_TTLS[source]
+"""
+def get_cache(name, store=None, ttl=None, source=None):
+	with _caches_lock:
+		cache = _caches.get(name)
+		if cache is None:
+			if ttl is None:
+				ttl = pzwglobals.CACHE_TTLS[source or name]
+			cache = TTLCache(name, ttl, store)
+			_caches[name] = cache
+		return cache
+
@@ -0,0 +1,99 @@
+import os
+import json
+import struct
+from datetime import datetime
+import pzwglobals
+from lib.frames import frame_hash, pack_frame, unpack_frame
+from lib.fileutil import atomic_write
+from lib.refresher import WeatherSnapshot
+
+logger = pzwglobals.logger
+
+WARM_START_DIRECTORY = pzwglobals.DATA_DIRECTORY + 'warm-start/'
+
+SNAPSHOT_FILE = 'snapshot.json'
+BG_FILE = 'bg'
+FRAME_EXT = '.frame'
+
+LOG_DATE_FORMAT = '%Y%m%d%H%M%S'
+
+"""
+WarmStart
+
+	the last data snapshot and the last frame of each screen, kept in
+	DATA_DIRECTORY so a reboot can put a frame on the display before
+	any network, parsing or dithering happens
+"""
+class WarmStart():
+	def __init__(self, directory=WARM_START_DIRECTORY):
+		self.directory = directory
+		self.frame_hashes = {}
+
+	def frame_path(self, screen_name):
+		return self.directory + screen_name + FRAME_EXT
+
+	"""
+	store the frame a screen just showed, unless it's the one already stored
+	"""
+	def save_frame(self, screen_name, img):
+		h = frame_hash(img)
+		if self.frame_hashes.get(screen_name) == h:
+			return
+		data = pack_frame(img)
+		if data is None:
+			return
+		try:
+			os.makedirs(self.directory, exist_ok=True)
+			atomic_write(self.frame_path(screen_name), data)
+		except OSError:
+			logger.warning("couldn't save warm start frame for " + screen_name)
+			return
+		self.frame_hashes[screen_name] = h
+
+	"""
+	last stored frame for a screen, or None
+	"""
+	def load_frame(self, screen_name):
+		try:
+			with open(self.frame_path(screen_name), 'rb') as f:
+				img = unpack_frame(f.read())
+		except (OSError, ValueError, struct.error):
+			return None
+		self.frame_hashes[screen_name] = frame_hash(img)
+		return img
+
+	"""
+	store a WeatherSnapshot: the forecast data as json, the background as a packed frame
+	"""
+	def save_snapshot(self, snapshot):
+		bg = pack_frame(snapshot.bg) if snapshot.bg is not None else None
+		data = {
+			'noaa': snapshot.noaa,
+			'darksky': snapshot.darksky,
+			'loaded_at': snapshot.loaded_at.strftime(LOG_DATE_FORMAT)
+		}
+		try:
+			os.makedirs(self.directory, exist_ok=True)
+			if bg is not None:
+				atomic_write(self.directory + BG_FILE + FRAME_EXT, bg)
+			atomic_write(self.directory + SNAPSHOT_FILE, json.dumps(data).encode('utf-8'))
+		except (OSError, TypeError, ValueError):
+			logger.warning("couldn't save warm start snapshot")
+
+	"""
+	last stored WeatherSnapshot, or None
+	"""
+	def load_snapshot(self):
+		try:
+			with open(self.directory + SNAPSHOT_FILE) as f:
+				data = json.load(f)
+			with open(self.directory + BG_FILE + FRAME_EXT, 'rb') as f:
+				bg = unpack_frame(f.read())
+			return WeatherSnapshot(
+				bg=bg,
+				noaa=data['noaa'],
+				darksky=data['darksky'],
+				loaded_at=datetime.strptime(data['loaded_at'], LOG_DATE_FORMAT)
+			)
+		except (OSError, ValueError, KeyError, struct.error):
+			return None
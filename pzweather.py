@@ -2,117 +2,312 @@
 # -*- coding: utf-8 -*-
 
 import sys
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
+
+# time-to-first-frame is measured from here, before anything heavy is imported
+STARTED_AT = time.monotonic()
+
 import threading
-import queue
 import argparse
-from PIL import Image, ImageDraw, ImageFont
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import pzwglobals
-
-if pzwglobals.RUN_ON_RASPBERRY_PI:
-	import subprocess
-	from inky import InkyPHAT
-	import RPi.GPIO as GPIO
-	BTN_PIN = 6
-
-from lib.satelliteimage import SatelliteImage
-from lib.noaaforecast import NoaaForecast
-from lib.darkskyweather import DarkSkyWeather
 from lib.screens import *
+from lib.frames import get_frame_gate
+from lib.refresher import Refresher, WeatherSnapshot
+from lib.eventloop import EventLoop
+from lib.warmstart import WarmStart
+from lib.metrics import get_metrics
+from lib.memory import get_memory_budget
+
+# the data sources (requests, bs4, numpy) and the pi hardware libraries
+# are imported where they're first used, so the first frame doesn't wait on them
 
 logger = pzwglobals.logger
 
 EXIT_COMMAND = 'exit'
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--debug', '-d', type=str, required=False, choices=['true', 'True', 'false', 'False'], help="run in debug mode") 
-parser.add_argument('--icon', '-i', type=str, required=False, choices=['wind', 'sun', 'snowflake', 'sleet', 'rain', 'moon', 'hot', 'hail', 'fog', 'cold', 'cloudy', 'cloudy-night', 'cloudy-day', 'cloud', 'blizzard'], help="force a specific weather icon to display")
-parser.add_argument('--dither', '-a', type=str, required=False, choices=['bayer', 'cluster', 'yliluoma'], help="set a dither algorithm for the background")
-parser.add_argument('--threshold', '-t', type=int, required=False, choices=[128, 64, 32], help="set the dither algorithm threshold for dithering")
-args = parser.parse_args()
+BTN_PIN = 6
+
+# seconds from the start of load_data each source has before we use its cached value
+LOAD_DEADLINES = {
+	'bg': 90,
+	'noaa': 30,
+	'darksky': 20
+}
+
+"""
+command line options
+"""
+def parse_args(argv=None):
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--debug', '-d', type=str, required=False, choices=['true', 'True', 'false', 'False'], help="run in debug mode") 
+	parser.add_argument('--icon', '-i', type=str, required=False, choices=['wind', 'sun', 'snowflake', 'sleet', 'rain', 'moon', 'hot', 'hail', 'fog', 'cold', 'cloudy', 'cloudy-night', 'cloudy-day', 'cloud', 'blizzard'], help="force a specific weather icon to display")
+	parser.add_argument('--dither', '-a', type=str, required=False, choices=['bayer', 'cluster', 'yliluoma'], help="set a dither algorithm for the background")
+	parser.add_argument('--threshold', '-t', type=int, required=False, choices=[128, 64, 32], help="set the dither algorithm threshold for dithering")
+	parser.add_argument('--low-memory', action='store_true', help="load one source at a time and free intermediates between stages")
+	parser.add_argument('--memory-profile', action='store_true', help="record peak memory per stage into the metrics file, slows everything down")
+	parser.add_argument('--server', type=str, required=False, metavar='LOCATIONS', help="render frames for every location in this json file instead of driving a display")
+	parser.add_argument('--workers', type=int, required=False, help="render processes for --server, defaults to one per cpu")
+	parser.add_argument('--import-report', action='store_true', help="print what importing the app costs per module and exit")
+	return parser.parse_args(argv)
 
 """
 small thread to handle keyboard input on desktop
  as seen here: https://stackoverflow.com/questions/5404068/how-to-read-keyboard-input/53344690#53344690
 """
-def read_kbd_input(input_queue):
+def read_kbd_input(loop):
 	logger.debug('starting keyboard thread')
 	print('Type exit to quit or anything else to toggle screens.')
 	while (True):
 		input_str = input()
-		input_queue.put(input_str)
+		loop.post('key', (input_str, time.monotonic()))
 
 """
 main app class
  maintains screen instances. handles switching screens
 """
 class PzWeather():
-	def __init__(self):
+	def __init__(self, args):
+		self.args = args
 		self.debug = False
 		self.display = None
 		self.current = None
 		self.last = None
-		self.last_load = None
-		self.bg = None
-		self.noaa = None
-		self.darksky = None
 		self.btn_down = False
+		# in low memory mode sources load in turn, so their peaks don't add up
+		workers = 1 if get_memory_budget().low_memory else len(LOAD_DEADLINES)
+		self.loader = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pzw-load')
+		self.pending = {}
+		self.refresher = Refresher(self.build_snapshot)
+		self.refresher.subscribe(self.on_snapshot)
+		self.snapshot_changed = threading.Event()
+		self.warm = WarmStart()
+		self.refresher.subscribe(self.warm.save_snapshot)
+		self.refresher.subscribe(self.write_metrics)
+		self.first_frame_at = None
 		
-		if args.debug is 'true' or args.debug is 'True':
+		if args.debug in ('true', 'True'):
 			self.debug = True
 		
 		if pzwglobals.RUN_ON_RASPBERRY_PI:
+			from inky import InkyPHAT
 			self.display = InkyPHAT("yellow")
 			self.display.set_border(WHITE)
 		
 		self.screens = {
-			'current_weather': CurrentWeather('current_weather', debug=self.debug, display=self.display),
+			'current_weather': CurrentWeather('current_weather', icon=args.icon, debug=self.debug, display=self.display),
 			'forecast_days': ForecastDays('forecast_days', debug=self.debug, display=self.display)
 		}
+		
+		for screen in self.screens.values():
+			self.refresher.subscribe(screen.on_snapshot)
+	
+	# current data, swapped in whole by the refresher
+	@property
+	def snapshot(self):
+		return self.refresher.snapshot
+	
+	@property
+	def bg(self):
+		return self.snapshot.bg
+	
+	@property
+	def noaa(self):
+		return self.snapshot.noaa
+	
+	@property
+	def darksky(self):
+		return self.snapshot.darksky
+	
+	@property
+	def last_load(self):
+		return self.snapshot.loaded_at
 
 	def change_screen(self, screen_name):
 		logger.debug('PzWeather::change_screen \t' + screen_name)
-		self.make_current_screen(self.screens[screen_name])
+		return self.make_current_screen(self.screens[screen_name])
 
 	def make_current_screen(self, screen):
 		logger.debug('PzWeather::make_current_screen \t' + screen.name)
 		if self.current:
 			self.last = self.current
 		self.current = screen
-		self.render_current_screen()
+		return self.render_current_screen()
 
+	# show the current screen for the current snapshot
+	#  returns True if the screen's pre-rendered frame was pushed
 	def render_current_screen(self):
-		if self.current is not None:
-			self.current.render(bg=self.bg.copy(), darksky=self.darksky, noaa=self.noaa, icon=args.icon)
-	
-	# do time check to update data
-	def check_time(self):
-		now = datetime.now()
-		tdiff = now - self.last_load
-		if (tdiff >= timedelta(minutes=10)):
-			self.load_data()
+		self.snapshot_changed.clear()
+		if self.current is None:
+			return False
+		prerendered = self.current.show_snapshot(self.snapshot)
+		if self.current.last_frame is not None:
+			self.warm.save_frame(self.current.name, self.current.last_frame)
+			self.log_first_frame('cold')
+		return prerendered
+	
+	# put the last session's data and frame back on screen before touching the network
+	#  returns False when nothing was stored yet, the caller then loads and renders as usual
+	def warm_start(self, screen_name):
+		snapshot = self.warm.load_snapshot()
+		frame = self.warm.load_frame(screen_name)
+		if snapshot is None or frame is None:
+			logger.info('PzWeather::warm_start nothing stored, cold start')
+			return False
+		self.refresher.restore(snapshot)
+		if self.current:
+			self.last = self.current
+		self.current = self.screens[screen_name]
+		self.current.show(frame)
+		self.log_first_frame('warm')
+		return True
+	
+	# seconds from process start to the first frame on the display, logged once
+	def log_first_frame(self, kind):
+		if self.first_frame_at is not None:
+			return
+		self.first_frame_at = time.monotonic() - STARTED_AT
+		logger.info('PzWeather::first_frame {} start, first frame after {:.2f}s'.format(kind, self.first_frame_at))
+	
+	# called on the refresher thread after each swap, rendering stays on the ui thread
+	def on_snapshot(self, snapshot):
+		self.snapshot_changed.set()
+	
+	# keep pre-rendered frames that depend on the clock current, on the minute tick
+	def prerender(self):
+		for screen in self.screens.values():
+			screen.refresh_prerender(self.snapshot)
+	
+	# re-render if the refresher swapped in new data
+	def check_refresh(self):
+		if self.snapshot_changed.is_set():
 			self.render_current_screen()
+			logger.info('PzWeather::check_refresh frames pushed: {pushes} skipped: {skips}'.format(**self.frame_stats()))
 	
+	# load data now and swap it in, on the calling thread
 	def load_data(self):
-		logger.debug('PzWeather::load_data')
-		self.bg = SatelliteImage(args.dither, args.threshold, debug=self.debug).image
-		self.noaa = NoaaForecast(debug=self.debug).forecast
-		self.darksky = DarkSkyWeather(debug=self.debug).weather
+		self.refresher.refresh()
+	
+	# spans and counters go to DATA_DIRECTORY/metrics.json after every refresh
+	def write_metrics(self, snapshot=None):
+		get_metrics().write()
+	
+	# fetch all data sources concurrently into a new snapshot
+	#  each source gets its own deadline, a source that misses it keeps its cached value
+	#  and its fetch is left to finish, the result is picked up on the next load
+	def build_snapshot(self):
+		logger.debug('PzWeather::build_snapshot')
+		from lib.satelliteimage import SatelliteImage
+		from lib.noaaforecast import NoaaForecast
+		from lib.darkskyweather import DarkSkyWeather
+		from lib.httpclient import get_http_client
+		args = self.args
+		start = time.time()
+		
+		previous = self.snapshot
+		values = {
+			'bg': previous.bg,
+			'noaa': previous.noaa,
+			'darksky': previous.darksky
+		}
+		
+		# loader threads can wait, so stale sources are fetched here rather than
+		# served stale and revalidated behind the snapshot's back
+		fetchers = {
+			'bg': lambda: SatelliteImage(args.dither, args.threshold, debug=self.debug, revalidate=False).image,
+			'noaa': lambda: NoaaForecast(debug=self.debug, revalidate=False).forecast,
+			'darksky': lambda: DarkSkyWeather(debug=self.debug, revalidate=False).weather
+		}
+		
+		for name, fetch in fetchers.items():
+			future = self.pending.get(name)
+			if future is not None and future.done():
+				self.adopt_result(name, future, values)
+				future = None
+			if future is None:
+				self.pending[name] = self.loader.submit(self.timed_fetch, name, fetch)
+		
+		for name in fetchers:
+			future = self.pending[name]
+			
+			# nothing cached yet, so there's nothing to fall back to. wait it out
+			if values[name] is None:
+				timeout = None
+			else:
+				timeout = max(LOAD_DEADLINES[name] - (time.time() - start), 0)
+			
+			try:
+				future.result(timeout=timeout)
+			except FutureTimeoutError:
+				logger.warning('PzWeather::load_data {} missed its {}s deadline, using cached value'.format(name, LOAD_DEADLINES[name]))
+				continue
+			except Exception:
+				pass
+			
+			self.adopt_result(name, future, values)
 		
-		logger.debug(self.noaa)
-		logger.debug(self.darksky)
+		if values['bg'] is None:
+			values['bg'] = SatelliteImage(None, None, debug=True).image
 		
-		self.last_load = datetime.now()
+		logger.info('PzWeather::load_data finished in {:.2f}s'.format(time.time() - start))
+		get_metrics().observe('load_data', (time.time() - start) * 1000)
+		get_metrics().incr('refreshes')
+		logger.info('PzWeather::load_data upstreams {}'.format(get_http_client().breaker_stats()))
+		logger.debug(values['noaa'])
+		logger.debug(values['darksky'])
 		
-	def toggle_screens(self):
+		return WeatherSnapshot(**values)
+	
+	# run one source's fetch on a loader thread and log how long it took
+	def timed_fetch(self, name, fetch):
+		start = time.time()
+		try:
+			with get_metrics().span('fetch.' + name):
+				return fetch()
+		finally:
+			get_memory_budget().release()
+			logger.info('PzWeather::load_data {} took {:.2f}s'.format(name, time.time() - start))
+	
+	# take a finished fetch's result into values, keeping the cached value if it failed
+	def adopt_result(self, name, future, values):
+		self.pending.pop(name, None)
+		try:
+			value = future.result()
+		except Exception:
+			logger.exception('PzWeather::load_data {} failed, using cached value'.format(name))
+			return
+		if value is not None:
+			values[name] = value
+		
+	# display pushes and unchanged frames skipped by the frame gate
+	def frame_stats(self):
+		return get_frame_gate().stats()
+	
+	# switch screens and log how long it took from the press to the push
+	def toggle_screens(self, pressed_at=None):
 		logger.debug('PzWeather::toggle_screens')
+		if pressed_at is None:
+			pressed_at = time.monotonic()
 		if self.current and self.current.name == 'current_weather':
-			self.change_screen('forecast_days')
-			return
-		self.change_screen('current_weather')
+			screen_name = 'forecast_days'
+		else:
+			screen_name = 'current_weather'
+		prerendered = self.change_screen(screen_name)
+		elapsed = time.monotonic() - pressed_at
+		get_metrics().observe('toggle.press_to_push', elapsed * 1000)
+		get_metrics().incr('toggle.prerendered' if prerendered else 'toggle.rendered')
+		logger.info('PzWeather::toggle_screens {} pushed {:.3f}s after press ({})'.format(screen_name, elapsed, 'pre-rendered' if prerendered else 'rendered'))
+	
+	# desktop keyboard input, anything but exit toggles screens
+	def key_input(self, data):
+		input_str, pressed_at = data
+		logger.debug("input_str = {}".format(input_str))
+		if input_str == EXIT_COMMAND:
+			self.kill()
+		self.button_toggle(pressed_at)
 	
-	def button_toggle(self):
+	def button_toggle(self, pressed_at=None):
 		self.btn_down = not self.btn_down
 		
 		logger.info('PzWeather::button_toggle {}'.format(self.btn_down))
@@ -120,59 +315,88 @@ class PzWeather():
 		if self.btn_down:
 			pass
 		else:
-			self.toggle_screens()
+			self.toggle_screens(pressed_at)
 	
 	# helper to exit program in case we need special rpi consideration in future
 	def kill(self):
+		self.write_metrics()
+		if get_memory_budget().profiling:
+			logger.info('PzWeather::kill memory per stage\n' + get_memory_budget().report())
+		self.refresher.stop()
+		self.loader.shutdown(wait=False)
 		if pzwglobals.RUN_ON_RASPBERRY_PI:
 			sys.exit(0)
 		else:
 			sys.exit(0)
 
+"""
+render server mode, no display and no screens to switch
+"""
+def serve(args):
+	from lib.locations import load_locations
+	from lib.renderserver import RenderServer
+	server = RenderServer(load_locations(args.server), args.dither, args.threshold, args.workers)
+	try:
+		server.serve()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.stop()
+
 """
 main
 """
-if __name__ == '__main__':
+def main(argv=None):
+	args = parse_args(argv)
+	
+	if args.import_report:
+		from lib.importreport import import_report
+		print(import_report('pzweather'))
+		return
+	
+	pzwglobals.setup_logging()
+	get_memory_budget().configure(low_memory=args.low_memory, profile=args.memory_profile)
+	
 	logger.info('pizero weather started at ' + datetime.now().strftime("%m/%d/%Y %I:%M %p"))
 	
+	if args.server:
+		serve(args)
+		return
+	
+	# init app and show the last session's frame if we have one,
+	# otherwise load data and render current weather screen
+	pzweather = PzWeather(args)
+	warm = pzweather.warm_start('current_weather')
+	if not warm:
+		pzweather.load_data()
+		pzweather.change_screen('current_weather')
+	
+	# everything after this is event driven, the ui thread sleeps until
+	# a button press, keyboard input or new data arrives
+	loop = EventLoop()
+	loop.on('button', pzweather.button_toggle)
+	loop.on('key', pzweather.key_input)
+	loop.on('refresh', lambda data: pzweather.check_refresh())
+	loop.on('minute', lambda data: pzweather.prerender())
+	loop.every_minute('minute')
+	pzweather.refresher.subscribe(lambda snapshot: loop.post('refresh'))
+	
 	# init ui for pi and desktop for switching screens, exit / shutdown
 	if pzwglobals.RUN_ON_RASPBERRY_PI:
+		import RPi.GPIO as GPIO
 		GPIO.setmode(GPIO.BCM)
 		GPIO.setup(BTN_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-		GPIO.add_event_detect(BTN_PIN, GPIO.FALLING, bouncetime=120)
+		GPIO.add_event_detect(BTN_PIN, GPIO.FALLING, callback=lambda channel: loop.post('button', time.monotonic()), bouncetime=120)
 	else:
-		input_queue = queue.Queue()
-		input_thread = threading.Thread(target=read_kbd_input, args=(input_queue,), daemon=True)
+		input_thread = threading.Thread(target=read_kbd_input, args=(loop,), daemon=True)
 		input_thread.start()
 	
-	# init app and render current weather screen
-	pzweather = PzWeather()
-	pzweather.load_data()
-	pzweather.change_screen('current_weather')
+	# later refreshes happen off the ui thread, the first one straight away after a warm start
+	pzweather.refresher.start(delay=0 if warm else None)
 	
-	# main loop
-	while (True):
-		
-		# check ui
-		if pzwglobals.RUN_ON_RASPBERRY_PI:
-			if GPIO.event_detected(BTN_PIN):
-				pzweather.button_toggle()
-		else:
-			if (input_queue.qsize() > 0):
-				input_str = input_queue.get()
-				logger.debug("input_str = {}".format(input_str))
-				if input_str == EXIT_COMMAND:
-					pzweather.kill()
-				pzweather.button_toggle()
-		
-		pzweather.check_time()
-		
-		time.sleep(0.2) 
+	loop.run()
 	
 	pzweather.kill()
 
-
-
-
-
-
+if __name__ == '__main__':
+	main()
@@ -15,23 +15,63 @@ DATA_DIRECTORY = os.path.dirname(__file__) + '/data/'
 DISPLAY_WIDTH = 212
 DISPLAY_HEIGHT = 104
 
-formatter = logging.Formatter('%(asctime)s_%(name)s_%(levelname)s - %(message)s')
+# most resident memory in MB a full refresh may peak at, checked by benchmarks/memory_ceiling.py
+# a 512 MB pi zero shares its ram with the gpu and the os
+MEMORY_CEILING_MB = 96
 
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-ch.setFormatter(formatter)
+"""
+ordered dither engine for the background: hitherdither, or numpy for lib.dither's
+vectorized engine, which is much faster but only close to hitherdither's output
+ benchmarks/bench_dither.py compares the two
+"""
+DITHER_ENGINE = 'hitherdither'
+
+"""
+seconds before cached data from each source is considered stale
+"""
+CACHE_TTLS = {
+	'noaa': 45 * 60,
+	'darksky': 10 * 60,
+	'satellite': 10 * 60
+}
 
-fh = logging.FileHandler(DATA_DIRECTORY + 'pz_weather.log', 'a')
-fh.setLevel(logging.DEBUG)
-fh.setFormatter(formatter)
+"""
+hard deadline in seconds for each upstream request, body included
+ each source also has a circuit breaker under the same name
+"""
+FETCH_DEADLINES = {
+	'noaa': 25,
+	'darksky': 15,
+	'nesdis': 40
+}
 
 logger = logging.getLogger('pz_weather_logger')
-if RUN_ON_RASPBERRY_PI:
-	logger.setLevel(logging.INFO)
-else:
-	logger.setLevel(logging.DEBUG)
-logger.addHandler(ch)
-logger.addHandler(fh)
+
+"""
+attach the console and log file handlers
+ called once by the entry point, so importing a module never opens files
+"""
+def setup_logging():
+	if logger.handlers:
+		return logger
+	
+	formatter = logging.Formatter('%(asctime)s_%(name)s_%(levelname)s - %(message)s')
+	
+	ch = logging.StreamHandler()
+	ch.setLevel(logging.DEBUG)
+	ch.setFormatter(formatter)
+	
+	fh = logging.FileHandler(DATA_DIRECTORY + 'pz_weather.log', 'a')
+	fh.setLevel(logging.DEBUG)
+	fh.setFormatter(formatter)
+	
+	if RUN_ON_RASPBERRY_PI:
+		logger.setLevel(logging.INFO)
+	else:
+		logger.setLevel(logging.DEBUG)
+	logger.addHandler(ch)
+	logger.addHandler(fh)
+	return logger
 
 """
 map darksky icon names to names of our custom icons